@@ -0,0 +1,211 @@
+"""Benchmarks for the calculator hot paths, with baseline comparison.
+
+Usage (from the repository root):
+    python -m benchmarks.run --save baseline.json
+    python -m benchmarks.run --compare baseline.json --max-slowdown 1.25
+
+Every benchmark reports the best time per call over several repeats. With --compare, the run fails (exit code 1) if
+any benchmark is slower than the baseline by more than --max-slowdown.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+import numpy as np
+
+from one_click_looping import DEFAULT_SCENARIO, calc_price_change_for_roi, calculate_close_position, calculate_open_position, calculate_sensitivities, calculate_thresholds, evaluate_scenarios, find_flashloan_amount
+from one_click_looping.liquidity import ConcentratedLiquidity, ConstantProductPool
+from one_click_looping.montecarlo import simulate_roi_distribution
+from one_click_looping.rolling import simulate_rolling_loops
+from one_click_looping.surface import build_surface, load_surface
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGE_SCRIPT = os.path.join(REPO_ROOT, "one-click-looping-calculator.py")
+BATCH_SIZES = (1_000, 100_000, 1_000_000)
+LIQUIDITY_BATCH_SIZE = 100_000
+
+def time_call(fn, repeat=5, min_seconds=0.2):
+    # Best time per call over repeat runs, each calling fn often enough to take at least min_seconds
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < min_seconds and number < 1_000_000:
+        number *= 10
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def _open_args(n=None):
+    scenario = dict(DEFAULT_SCENARIO)
+    if n is not None:
+        rng = np.random.default_rng(0)
+        scenario.update(ltv=rng.uniform(0.5, 0.95, n), apr=rng.uniform(0, 0.5, n), price_move=rng.uniform(-0.5, 0.5, n))
+    return scenario
+
+def single_scenario_benchmarks():
+    s = _open_args()
+    cross_price = s["current_price_coll_token"] / s["current_price_loan_token"]
+    open_position = calculate_open_position(s["current_price_coll_token"], s["current_price_loan_token"], s["user_init_coll_amount"], s["ltv"], s["apr"], s["upfront_fee"], s["tenor"], s["myso_fee"], s["dex_slippage"], s["dex_swap_fee"])
+    owed_repayment, final_pledge_and_reclaimable = open_position[1], open_position[7]
+    return {
+        "find_flashloan_amount": lambda: find_flashloan_amount(s["user_init_coll_amount"], cross_price, s["ltv"], s["dex_slippage"], s["dex_swap_fee"], s["upfront_fee"]),
+        "calculate_open_position": lambda: calculate_open_position(s["current_price_coll_token"], s["current_price_loan_token"], s["user_init_coll_amount"], s["ltv"], s["apr"], s["upfront_fee"], s["tenor"], s["myso_fee"], s["dex_slippage"], s["dex_swap_fee"]),
+        "calculate_close_position": lambda: calculate_close_position(final_pledge_and_reclaimable, owed_repayment, s["current_price_coll_token"] * 1.05, s["current_price_loan_token"], s["dex_slippage"], s["dex_swap_fee"], s["gas_usd_cost"]),
+        "calc_price_change_for_roi": lambda: calc_price_change_for_roi(0., s["current_price_coll_token"], s["current_price_loan_token"], s["user_init_coll_amount"], final_pledge_and_reclaimable, owed_repayment, s["dex_slippage"], s["dex_swap_fee"], s["gas_usd_cost"]),
+        "calculate_thresholds": lambda: calculate_thresholds(s["current_price_coll_token"], s["current_price_loan_token"], s["user_init_coll_amount"], final_pledge_and_reclaimable, owed_repayment, s["dex_slippage"], s["dex_swap_fee"], s["gas_usd_cost"]),
+    }
+
+def batched_benchmarks():
+    benchmarks = {}
+    for n in BATCH_SIZES:
+        s = _open_args(n)
+        open_position = calculate_open_position(s["current_price_coll_token"], s["current_price_loan_token"], s["user_init_coll_amount"], s["ltv"], s["apr"], s["upfront_fee"], s["tenor"], s["myso_fee"], s["dex_slippage"], s["dex_swap_fee"])
+        benchmarks[f"evaluate_scenarios[{n}]"] = lambda s=s: evaluate_scenarios(**s)
+        benchmarks[f"calculate_thresholds[{n}]"] = lambda s=s, o=open_position: calculate_thresholds(s["current_price_coll_token"], s["current_price_loan_token"], s["user_init_coll_amount"], o[7], o[1], s["dex_slippage"], s["dex_swap_fee"], s["gas_usd_cost"])
+        benchmarks[f"calculate_sensitivities[{n}]"] = lambda s=s: calculate_sensitivities(**s)
+    # Price impact models: a $1M constant-product pool and 200 ticks of concentrated liquidity around the price
+    s = _open_args(LIQUIDITY_BATCH_SIZE)
+    price = s["current_price_coll_token"] / s["current_price_loan_token"]
+    ticks = np.arange(-20_000, 20_001, 200)
+    models = {
+        "constant_product": ConstantProductPool.from_tvl(1_000_000, s["current_price_coll_token"], s["current_price_loan_token"]),
+        "concentrated": ConcentratedLiquidity(price * 1.0001**ticks, 1_000_000 * np.exp(-(ticks[:-1] / 5_000)**2)),
+    }
+    for name, liquidity in models.items():
+        benchmarks[f"evaluate_scenarios[{LIQUIDITY_BATCH_SIZE}, {name}]"] = lambda s=s, liquidity=liquidity: evaluate_scenarios(**s, liquidity=liquidity)
+    s = _open_args()
+    s.pop("price_move")
+    benchmarks["simulate_roi_distribution[1000000]"] = lambda: simulate_roi_distribution(**s, volatility=0.8, seed=0)
+    benchmarks["simulate_rolling_loops[10000x52]"] = lambda: simulate_rolling_loops(**{**s, "ltv": 0.6}, volatility=0.5, seed=0)
+    return benchmarks
+
+def surface_benchmarks(directory):
+    # Lookups from a surface with the default grid, built into directory
+    prefix = os.path.join(directory, "surface")
+    build_surface(prefix, n_check=1000)
+    surface = load_surface(prefix)
+    s = _open_args()
+    price_moves = np.linspace(-0.05, 0.1, 101)
+    benchmarks = {
+        "surface.thresholds": lambda s=s: surface.thresholds(s["ltv"], s["apr"], s["tenor"]),
+        "surface.roi[101 price moves]": lambda s=s: surface.roi(s["ltv"], s["apr"], s["tenor"], price_moves),
+    }
+    for n in BATCH_SIZES:
+        s = _open_args(n)
+        benchmarks[f"surface.roi[{n}]"] = lambda s=s: surface.roi(s["ltv"], s["apr"], s["tenor"], s["price_move"])
+    return benchmarks
+
+def _page_runner():
+    # Headless page runs through Streamlit's script testing harness, with the runtime mocked like Streamlit's own
+    # InteractiveScriptTests do
+    from unittest.mock import MagicMock
+
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner import RerunData, ScriptRunnerEvent
+    from streamlit.testing.local_script_runner import LocalScriptRunner
+
+    config.set_option("runner.postScriptGC", False)
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime._instance = runtime
+    # `streamlit run` puts the script's directory on the path, so the page can import one_click_looping
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+    def render():
+        # Wall time of one script run, measured from the runner's own start/stop events
+        runner = LocalScriptRunner(PAGE_SCRIPT)
+        times = {}
+        done = threading.Event()
+
+        def on_event(sender, event, **kwargs):
+            if event == ScriptRunnerEvent.SCRIPT_STARTED:
+                times["start"] = time.perf_counter()
+            elif event in (ScriptRunnerEvent.SCRIPT_STOPPED_WITH_SUCCESS, ScriptRunnerEvent.SCRIPT_STOPPED_WITH_COMPILE_ERROR, ScriptRunnerEvent.SCRIPT_STOPPED_FOR_RERUN):
+                times["stop"] = time.perf_counter()
+                done.set()
+
+        runner.on_event.connect(on_event, weak=False)
+        runner.request_rerun(RerunData())
+        runner.start()
+        if not done.wait(timeout=120):
+            runner.request_stop()
+            raise RuntimeError("Page render timed out")
+        runner.request_stop()
+        runner.join()
+        if runner.script_thread_exceptions:
+            raise runner.script_thread_exceptions[0]
+        return times["stop"] - times["start"]
+
+    return render
+
+def page_benchmarks(repeat=5):
+    # Cold renders start from empty stage caches, warm renders reuse the caches of the previous run
+    import streamlit as st
+
+    render = _page_runner()
+    cold, warm = [], []
+    for _ in range(repeat):
+        st.cache_data.clear()
+        cold.append(render())
+        warm.append(render())
+    return {"page_render[cold]": min(cold), "page_render[warm]": min(warm)}
+
+def run_benchmarks(include_page=True):
+    with tempfile.TemporaryDirectory() as directory:
+        results = {name: time_call(fn) for name, fn in {**single_scenario_benchmarks(), **batched_benchmarks(), **surface_benchmarks(directory)}.items()}
+    if include_page:
+        results.update(page_benchmarks())
+    return results
+
+def compare(results, baseline, max_slowdown):
+    # Returns (name, baseline seconds, current seconds, ratio) for every benchmark in both runs and whether any
+    # benchmark regressed by more than max_slowdown
+    rows = []
+    for name, seconds in results.items():
+        if name in baseline:
+            rows.append((name, baseline[name], seconds, seconds / baseline[name]))
+    return rows, any(ratio > max_slowdown for *_, ratio in rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the one-click looping calculator.")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against the results in this JSON file")
+    parser.add_argument("--max-slowdown", type=float, default=1.25, help="allowed ratio of current to baseline time (default: 1.25)")
+    parser.add_argument("--skip-page", action="store_true", help="skip the headless page renders (no Streamlit needed)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(include_page=not args.skip_page)
+    for name, seconds in results.items():
+        print(f"{name:<40} {seconds*1e6:>14,.2f} us")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "results": results,
+            }, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        rows, regressed = compare(results, baseline, args.max_slowdown)
+        print(f"\n{'benchmark':<40} {'baseline':>14} {'current':>14} {'ratio':>8}")
+        for name, before, after, ratio in rows:
+            flag = "  REGRESSION" if ratio > args.max_slowdown else ""
+            print(f"{name:<40} {before*1e6:>11,.2f} us {after*1e6:>11,.2f} us {ratio:>8.2f}{flag}")
+        if regressed:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,83 +1,379 @@
+import os
+import time
+
 import streamlit as st
-import matplotlib.pyplot as plt
-import pandas as pd
 import numpy as np
-from scipy.optimize import bisect, minimize
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from urllib.parse import urlencode
 
-def find_flashloan_amount(flashloan_amount, user_init_coll_amount, cross_price, ltv, dex_slippage, dex_swap_fee, upfront_fee):
-    sold_on_dex = flashloan_amount
-    received_from_dex = sold_on_dex / cross_price * (1 - dex_slippage - dex_swap_fee)
-
-    combined_pledge = user_init_coll_amount + received_from_dex
-
-    upfront_fee_abs = combined_pledge * upfront_fee
-
-    flashloan_amount_act = (combined_pledge - upfront_fee_abs) * cross_price * ltv
-
-    return (flashloan_amount - flashloan_amount_act)**2
-
-def calculate_open_position(current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee):
-    cross_price = current_price_coll_token / current_price_loan_token
-    
-    # Calculate flashloan amount
-    flashloan_amount_guess = user_init_coll_amount * cross_price / (1 - ltv)
-    res = minimize(
-            find_flashloan_amount,
-            args=(user_init_coll_amount, cross_price, ltv, dex_slippage, dex_swap_fee, upfront_fee),
-            x0=[flashloan_amount_guess])
-    flashloan_amount_act = res["x"][0]
-
-    # Calculate owed repayment amount
-    owed_repayment = flashloan_amount_act * (1 + apr * tenor/365)
-
-    # Amount that's sold on the DEX 
-    sold_on_dex = flashloan_amount_act
-
-    # Amount received from the DEX (after considering slippage and swap fee)
-    received_from_dex = sold_on_dex / cross_price * (1 - dex_slippage - dex_swap_fee)
-
-    combined_pledge = user_init_coll_amount + received_from_dex
-
-    # Upfront fee
-    upfront_fee_abs = combined_pledge * upfront_fee
-
-    # Myso protocol fee
-    myso_fee_abs = combined_pledge * myso_fee
+from one_click_looping import calc_roi, calculate_close_position, calculate_open_position, calculate_sensitivities, calculate_thresholds
+from one_click_looping.charts import figure_to_png, new_figure, roi_curve_vega_lite
+from one_click_looping.inverse import solve_input
+from one_click_looping.leverage import find_optimal_ltv, roi_surface
+from one_click_looping.liquidity import ConcentratedLiquidity, ConstantProductPool, resolve_ticks_path
+from one_click_looping.montecarlo import price_move_probabilities, simulate_roi_distribution
+from one_click_looping.pricefeed import PriceFeedPool
+from one_click_looping.result_cache import ResultCache
+from one_click_looping.rolling import simulate_rolling_loops
+from one_click_looping.timing import StageTimer, append_jsonl
+
+# Pipeline stages (open position -> thresholds -> RoI grid -> charts -> tables). Each stage is cached on exactly the
+# inputs it reads, so a widget change only recomputes the stages downstream of it. Caches are bounded and evict the
+# least recently used entries so a long-running server doesn't grow without limit.
+STAGE_CACHE_MAX_ENTRIES = 256
+
+# Stage results can additionally be kept in a persistent SQLite cache (see one_click_looping.result_cache), shared by
+# all worker processes and kept across restarts, so opening a popular share link in a fresh process doesn't recompute
+# it. Enabled by setting LOOPING_RESULT_CACHE to the database path.
+RESULT_CACHE_PATH = os.environ.get("LOOPING_RESULT_CACHE")
+RESULT_CACHE_MAX_BYTES = int(float(os.environ.get("LOOPING_RESULT_CACHE_MB", 256)) * 1024**2)
+
+@st.cache_resource
+def result_cache(path, max_bytes):
+    return ResultCache(path, max_bytes=max_bytes)
+
+def persistent_stage(func):
+    # Stage results are keyed by the stage and its inputs, i.e. the share link parameters it reads
+    return result_cache(RESULT_CACHE_PATH, RESULT_CACHE_MAX_BYTES).cached(func) if RESULT_CACHE_PATH else func
+
+# Live prices come from one feed per source (see one_click_looping.pricefeed), shared by all sessions of the server.
+# Sessions can only pick the sources configured in LOOPING_PRICE_FEEDS (websocket URLs or JSON lines files on the
+# server, separated by commas), live prices are off without it. A session waiting for new prices checks for widget
+# changes every LIVE_PRICES_POLL_SECONDS, and stops refreshing LIVE_PRICES_MAX_IDLE_SECONDS after the last run a user
+# started, so unattended tabs don't keep a script thread busy.
+PRICE_FEED_SPECS = tuple(spec.strip() for spec in os.environ.get("LOOPING_PRICE_FEEDS", "").split(",") if spec.strip())
+LIVE_PRICES_POLL_SECONDS = 0.5
+LIVE_PRICES_MAX_IDLE_SECONDS = 600.
+
+@st.cache_resource
+def price_feeds():
+    # Room for every configured feed, so no feed a session waits on is ever stopped
+    return PriceFeedPool(max_feeds=max(len(PRICE_FEED_SPECS), 1))
+
+# Directory of the tick files the concentrated liquidity model may load, tick file names are relative to it
+TICKS_DIR = os.environ.get("LOOPING_TICKS_DIR")
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def liquidity_model_stage(liquidity_model, pool_tvl, liquidity_ticks_path, liquidity_ticks_mtime, current_price_coll_token, current_price_loan_token):
+    # None keeps the flat DEX price impact. The tick file's modification time is part of the cache key, so edits to
+    # the file are picked up.
+    if liquidity_model == "constant_product":
+        return ConstantProductPool.from_tvl(pool_tvl, current_price_coll_token, current_price_loan_token)
+    if liquidity_model == "concentrated":
+        return ConcentratedLiquidity.from_ticks_csv(liquidity_ticks_path)
+    return None
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def open_position_stage(current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, liquidity):
+    return calculate_open_position(current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, liquidity)
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def thresholds_stage(current_price_coll_token, current_price_loan_token, user_init_coll_amount, final_pledge_and_reclaimable, owed_repayment, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity):
+    # Break-even and total loss price changes in percent
+    break_even_price_change, total_loss_price_change = calculate_thresholds(
+        current_price_coll_token, current_price_loan_token, user_init_coll_amount, final_pledge_and_reclaimable, owed_repayment, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity=liquidity
+    )
+    return break_even_price_change * 100, total_loss_price_change * 100
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def roi_grid_stage(current_price_coll_token, current_price_loan_token, user_init_coll_amount, final_pledge_and_reclaimable, owed_repayment, dex_slippage, dex_swap_fee, gas_usd_cost, price_change_range, roi_curve_points, liquidity):
+    # Evaluate the RoI curve over the user-defined range in one batched pass
+    rel_price_changes = np.linspace(price_change_range[0], price_change_range[1], roi_curve_points) / 100
+    p1 = current_price_coll_token * (1 + rel_price_changes)
+    p2 = current_price_loan_token
+    _, _, _, final_amounts_after_close, _, _ = calculate_close_position(final_pledge_and_reclaimable, owed_repayment, p1, p2, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity=liquidity)
+    RoIs = calc_roi(final_amounts_after_close, p2, user_init_coll_amount, current_price_coll_token)
 
-    # total pledge and reclaimable
-    final_pledge_and_reclaimable = combined_pledge - upfront_fee_abs - myso_fee_abs
+    _, _, _, final_amount_after_close3, _, _ = calculate_close_position(final_pledge_and_reclaimable, owed_repayment, current_price_coll_token, current_price_loan_token, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity=liquidity)
+    roi_unchanged = calc_roi(final_amount_after_close3, current_price_loan_token, user_init_coll_amount, current_price_coll_token) * 100
 
-    # Return results
-    return flashloan_amount_act, owed_repayment, sold_on_dex, received_from_dex, combined_pledge, upfront_fee_abs, myso_fee_abs, final_pledge_and_reclaimable
+    return rel_price_changes, RoIs, roi_unchanged
 
-def calculate_close_position(final_pledge_and_reclaimable, owed_repayment, final_price_coll_token, final_price_loan_token, dex_slippage, dex_swap_fee, gas_usd_cost, always_repay=False):
-    cross_price = final_price_coll_token / final_price_loan_token
-    
-    # Amount flashborrowed
-    flashloan_amount = final_pledge_and_reclaimable
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def roi_table_stage(current_price_coll_token, current_price_loan_token, user_init_coll_amount, final_pledge_and_reclaimable, owed_repayment, dex_slippage, dex_swap_fee, gas_usd_cost, price_change_range, break_even_price_change, total_loss_price_change, liquidity):
+    p2 = current_price_loan_token
 
-    # Amount that's sold on the DEX 
-    sold_on_dex = flashloan_amount
+    # Evenly spaced points for the table below (independent of the curve resolution)
+    table_price_changes = np.linspace(price_change_range[0], price_change_range[1], 11) / 100
+    _, _, _, final_amounts_after_close, _, _ = calculate_close_position(final_pledge_and_reclaimable, owed_repayment, current_price_coll_token * (1 + table_price_changes), p2, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity=liquidity)
+    table_rois = calc_roi(final_amounts_after_close, p2, user_init_coll_amount, current_price_coll_token)
+    rois_for_changes = list(zip(table_price_changes * 100, table_rois * 100))
+
+    # add special points (unchanged price, break-even and total loss)
+    special_price_changes = np.array([0, break_even_price_change/100, total_loss_price_change/100])
+    special_price_changes = special_price_changes[~np.isnan(special_price_changes)]
+    p1 = current_price_coll_token * (1 + special_price_changes)
+    _, _, _, final_amounts_after_close, _, _ = calculate_close_position(final_pledge_and_reclaimable, owed_repayment, p1, p2, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity=liquidity)
+    special_rois = calc_roi(final_amounts_after_close, p2, user_init_coll_amount, current_price_coll_token)
+    rois_for_changes.extend(zip((p1/current_price_coll_token-1)*100, special_rois*100))
+
+    import pandas as pd
+
+    df = pd.DataFrame(rois_for_changes, columns=["Price Change (%)", "Looping RoI (%)"])
+    df.drop_duplicates(inplace=True)
+    df = df.sort_values(by="Price Change (%)", ascending=False)
+    # Reset the index for proper numbering
+    df.reset_index(drop=True, inplace=True)
+
+    # Format the values for better display
+    df["Price Change (%)"] = df["Price Change (%)"].apply(lambda x: f"+{x:.2f}%" if x > 0 else f"{x:.2f}%")
+    df["Looping RoI (%)"] = df["Looping RoI (%)"].apply(lambda x: f"+{x:.2f}%" if x > 0 else f"{x:.2f}%")
+
+    return df
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def roi_chart_stage(rel_price_changes, RoIs, break_even_price_change, total_loss_price_change, roi_unchanged, price_change_range, collateral_token_name, loan_token_name):
+    # Create and customize the plot
+    fig = new_figure(figsize=(10, 5))
+    ax = fig.subplots()
+    ax.axhline(y=0, color='black', linestyle='-', lw=.5)
+    ax.axvline(x=0, color='black', linestyle='-', lw=.5)
+    ax.plot(rel_price_changes*100, RoIs*100, label=f'RoI Looping {collateral_token_name}', color='deepskyblue')
+    ax.plot(rel_price_changes*100, rel_price_changes*100, label=f'RoI Buy&Hold {collateral_token_name}', linestyle='-', color='gray')
+    ax.fill_between(rel_price_changes*100, RoIs*100, 0, where=RoIs > 0, color='lightgreen', label='Profit')
+    ax.fill_between(rel_price_changes*100, RoIs*100, 0, where=RoIs <= 0, color='lightcoral', label='Loss')
+    if price_change_range[0] < break_even_price_change and break_even_price_change < price_change_range[1]:
+        ax.axvline(x=break_even_price_change, color='green', lw=0.8, linestyle='--')
+        ax.plot(break_even_price_change, 0, "o", color="green")
+        # Annotate the break-even point below the x-axis
+        tmp = f"+{break_even_price_change:.2f}" if break_even_price_change > 0 else f"{break_even_price_change:.2f}"
+        ax.annotate(f'If price {tmp}%:\nBreak-even', 
+                    (break_even_price_change, RoIs.min()*100), 
+                    textcoords="offset points",
+                    color="green",
+                    xytext=(0, -90),  # This offsets the annotation below the x-axis
+                    ha='center',
+                    va='top',  # This aligns the top of the text to the xytext
+                    arrowprops=dict(arrowstyle="->", linestyle='dotted', lw=0.8, color='green'))
+    if price_change_range[0] < total_loss_price_change and total_loss_price_change < price_change_range[1]:
+        ax.axvline(x=total_loss_price_change, color='red', lw=0.8, linestyle='--')
+        ax.plot(total_loss_price_change, -100, "o", color="red")
+        # Annotate the full loss point below the x-axis
+        tmp = f"+{total_loss_price_change:.2f}" if total_loss_price_change > 0 else f"{total_loss_price_change:.2f}"
+        ax.annotate(f'If price {tmp}%:\nFull Loss', 
+                    (total_loss_price_change, RoIs.min()*100), 
+                    textcoords="offset points", 
+                    color="red",
+                    xytext=(0, -60),  # This offsets the annotation below the x-axis
+                    ha='center',
+                    va='top',  # This aligns the top of the text to the xytext
+                    arrowprops=dict(arrowstyle="->", linestyle='dotted', lw=0.8, color='red'))
+    # Annotation outside of the y-axis
+    tmp = f"+{roi_unchanged:.2f}" if roi_unchanged > 0 else f"{roi_unchanged:.2f}"
+    if price_change_range[0] < 0 and 0 < price_change_range[1]:   
+        # Add vertical dotted line
+        ax.axhline(y=roi_unchanged, color='darkblue', linestyle='--', lw=0.8)
+        ax.plot(0, roi_unchanged, "o", color="darkblue")
+        ax.annotate(f'If price flat:\n{tmp}% RoI',
+                    (price_change_range[0], roi_unchanged), 
+                    textcoords="offset points", 
+                    color="darkblue",
+                    xytext=(-65, 0),  # This offsets the annotation to the left of the y-axis
+                    ha='right',
+                    va='center',  # This aligns the center of the text to the xytext
+                    arrowprops=dict(arrowstyle="->", linestyle='dotted', lw=0.8, color='darkblue'))
+    ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+
+    ax.set_xlabel(f'Price Change of {collateral_token_name}/{loan_token_name} (%)')
+    ax.set_ylabel('RoI (%)')
+    ax.set_title(f'Your RoI for looping on {collateral_token_name}/{loan_token_name}')
+    ax.legend(loc="upper left")
+
+    return figure_to_png(fig)
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def roi_chart_vega_lite_stage(rel_price_changes, RoIs, break_even_price_change, total_loss_price_change, roi_unchanged, price_change_range, collateral_token_name, loan_token_name):
+    import pandas as pd
+
+    # Drawn in the browser as vector graphics, only the data and the spec are sent
+    data, spec = roi_curve_vega_lite(rel_price_changes, RoIs, break_even_price_change, total_loss_price_change, roi_unchanged, price_change_range, collateral_token_name, loan_token_name)
+    return pd.DataFrame(data), spec
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def close_position_stage(final_pledge_and_reclaimable, owed_repayment, final_price_coll_token, final_price_loan_token, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity):
+    return calculate_close_position(final_pledge_and_reclaimable, owed_repayment, final_price_coll_token, final_price_loan_token, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity=liquidity)
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def sensitivities_stage(current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost, price_move):
+    return calculate_sensitivities(current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost, price_move)
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def inverse_stage(solve_for, target, price_moves, current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost):
+    # The solved input for every price change in price_moves, all at once
+    return solve_input(solve_for, target, price_move=np.array(price_moves), current_price_coll_token=current_price_coll_token, current_price_loan_token=current_price_loan_token,
+                       user_init_coll_amount=user_init_coll_amount, ltv=ltv, apr=apr, upfront_fee=upfront_fee, tenor=tenor, myso_fee=myso_fee, dex_slippage=dex_slippage,
+                       dex_swap_fee=dex_swap_fee, gas_usd_cost=gas_usd_cost)
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def summary_chart_stage(user_init_coll_amount, current_price_coll_token, flashloan_amount, current_price_loan_token, combined_pledge, owed_repayment,
+                        final_price_coll_token, final_price_loan_token, flashloan_amount2, final_amount_after_close2, collateral_token_name, loan_token_name):
+    from matplotlib.ticker import FixedLocator
+
+    # Values for the bar chart
+    labels = [
+        f'Your Initial {collateral_token_name}\n (Inception)', 
+        f'Flasborrowed {loan_token_name}\n (Inception)',
+        f'Leveraged {collateral_token_name}\n (Open Position)', 
+        f'{loan_token_name} Owed\n (Open Position)', 
+        f'Flashborrowed {collateral_token_name}\n (Close Position)',
+        f'{loan_token_name} Owed\n (Close Position)',
+        f'Your Final {loan_token_name}\n (Final Position)'
+    ]
 
-    # Amount received from the DEX (after considering slippage and swap fee)
-    received_from_dex = sold_on_dex * cross_price * (1 - dex_slippage - dex_swap_fee)
+    values = [
+        user_init_coll_amount * current_price_coll_token,
+        flashloan_amount * current_price_loan_token,
+        combined_pledge * current_price_coll_token,
+        owed_repayment * current_price_loan_token,
+        combined_pledge * final_price_coll_token,
+        owed_repayment * final_price_loan_token,
+        final_amount_after_close2 * final_price_loan_token
+    ]
 
-    # Amount left over after repay
-    final_amount_after_close = received_from_dex - owed_repayment
-    final_amount_after_close_net_of_gas_fees = final_amount_after_close - gas_usd_cost
+    amounts = [
+        user_init_coll_amount,
+        flashloan_amount,
+        combined_pledge,
+        owed_repayment,
+        flashloan_amount2,
+        owed_repayment,
+        final_amount_after_close2
+    ]
 
-    # Myso protocol fee
-    rational_to_repay = always_repay if always_repay else final_amount_after_close > 0
+    tokens = [
+        collateral_token_name,
+        loan_token_name,
+        collateral_token_name,
+        loan_token_name,
+        collateral_token_name,
+        loan_token_name,
+        loan_token_name
+    ]
 
-    if not rational_to_repay:
-        flashloan_amount = 0 
-        sold_on_dex = 0
-        received_from_dex = 0
-        final_amount_after_close = 0
-    
-    # Return results
-    return flashloan_amount, sold_on_dex, received_from_dex, final_amount_after_close, rational_to_repay, final_amount_after_close_net_of_gas_fees
+    colors = ['lightgray', 'lightgray', 'lightgreen', 'lightcoral', 'lightgreen', 'lightcoral', 'lightblue']
+
+    # Create the bar chart
+    fig = new_figure(figsize=(12, 7))
+    ax = fig.subplots()
+    bars = ax.bar(labels, values, color=colors)
+
+    # Add annotations to the bars
+    for i, rect in enumerate(bars):
+        height = rect.get_height()
+        ax.text(rect.get_x() + rect.get_width()/2., 1.05 * height,
+                f"${values[i]:,.2f}\n({amounts[i]:,.2f} {tokens[i]})", ha='center', va='bottom', rotation=0)
+
+        # Adding vertical lines after every two bars
+        if (i+1) % 2 == 0 and i != len(bars) - 1:  # Check that it's not the last bar
+            ax.axvline(x=rect.get_x() + rect.get_width() + 0.1, color='black', linestyle='--')
+
+    # Highlight the negative values with a different color
+    for i, v in enumerate(values):
+        if v < 0:
+            bars[i].set_color('red')
+
+    ax.set_title("Overview of Assets vs Debts, pre and post Looping")
+    ax.set_ylabel('Amount (USD)')
+    locations = ax.get_xticks()  # Assuming you want to set labels for existing tick locations
+    ax.xaxis.set_major_locator(FixedLocator(locations))
+    ax.set_xticklabels(labels, rotation=45, ha='right')
+    ax.set_ylim(0, max(values)*1.2)  # Add some space at the top for annotations
+
+    return figure_to_png(fig)
+
+# Fixed seed so simulated results are reproducible and can be cached like every other stage
+MONTE_CARLO_SEED = 0
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def monte_carlo_stage(current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost, volatility, drift, n_paths, liquidity):
+    return simulate_roi_distribution(
+        current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost,
+        volatility, drift, n_paths=n_paths, seed=MONTE_CARLO_SEED, liquidity=liquidity
+    )
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def rolling_stage(current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost, volatility, drift, n_periods, n_paths, liquidity):
+    return simulate_rolling_loops(
+        current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost,
+        volatility, drift, n_periods=n_periods, n_paths=n_paths, seed=MONTE_CARLO_SEED, liquidity=liquidity
+    )
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def roi_histogram_stage(histogram_counts, histogram_bin_edges, collateral_token_name, loan_token_name):
+    fig = new_figure(figsize=(10, 4))
+    ax = fig.subplots()
+    shares = histogram_counts / histogram_counts.sum() * 100
+    bin_edges = histogram_bin_edges * 100
+    colors = ['lightgreen' if left >= 0 else 'lightcoral' for left in bin_edges[:-1]]
+    ax.bar(bin_edges[:-1], shares, width=np.diff(bin_edges), align='edge', color=colors)
+    ax.axvline(x=0, color='black', linestyle='-', lw=.5)
+    ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+    ax.set_xlabel('RoI (%)')
+    ax.set_ylabel('Share of Simulated Outcomes (%)')
+    ax.set_title(f'Simulated RoI distribution for looping on {collateral_token_name}/{loan_token_name}')
+
+    return figure_to_png(fig)
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def leverage_stage(current_price_coll_token, current_price_loan_token, user_init_coll_amount, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost,
+                   ltv_range, price_change_range, grid_points, volatility, drift, target_price_move, max_total_loss_price_change, liquidity):
+    # RoI surface over LTV x price change and the best LTV, either for the expected RoI under the simulated price
+    # distribution (target_price_move is None) or for the RoI at target_price_move
+    ltvs = np.linspace(ltv_range[0], ltv_range[1], grid_points)
+    price_moves = np.linspace(price_change_range[0], price_change_range[1], grid_points) / 100
+    args = (current_price_coll_token, current_price_loan_token, user_init_coll_amount, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost)
+    rois, total_loss_price_changes = roi_surface(ltvs, price_moves, *args, liquidity=liquidity)
+
+    # The expectation covers (almost) all simulated outcomes, not just the price range shown in the heatmap
+    max_price_move = np.expm1((drift - volatility**2 / 2) * tenor / 365 + 5 * volatility * np.sqrt(tenor / 365))
+    expectation_price_moves = np.linspace(-1, max(max_price_move, 0), 2001)
+    weights = price_move_probabilities(expectation_price_moves, tenor, volatility, drift)
+    optimum = find_optimal_ltv(ltvs, expectation_price_moves, *args, weights=weights, target_price_move=target_price_move, max_total_loss_price_change=max_total_loss_price_change,
+                               liquidity=liquidity)
+    return ltvs, price_moves, rois, total_loss_price_changes, optimum
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+@persistent_stage
+def leverage_heatmap_stage(ltvs, price_moves, rois, total_loss_price_changes, optimal_ltv, collateral_token_name, loan_token_name):
+    from matplotlib.colors import TwoSlopeNorm
+
+    fig = new_figure(figsize=(10, 6))
+    ax = fig.subplots()
+    image = ax.imshow(rois*100, origin='lower', aspect='auto', cmap='RdYlGn',
+                      norm=TwoSlopeNorm(vmin=min(rois.min()*100, -1e-9), vcenter=0, vmax=max(rois.max()*100, 1e-9)),
+                      extent=(price_moves[0]*100, price_moves[-1]*100, ltvs[0]*100, ltvs[-1]*100))
+    fig.colorbar(image, ax=ax, label='RoI (%)')
+    ax.plot(total_loss_price_changes*100, ltvs*100, color='black', lw=0.8, linestyle='--', label='Total Loss Threshold')
+    if not np.isnan(optimal_ltv):
+        ax.axhline(y=optimal_ltv*100, color='darkblue', lw=0.8, linestyle='--', label=f'Best LTV ({optimal_ltv*100:.1f}%)')
+    ax.set_xlim(price_moves[0]*100, price_moves[-1]*100)
+    ax.set_ylim(ltvs[0]*100, ltvs[-1]*100)
+    ax.set_xlabel(f'Price Change of {collateral_token_name}/{loan_token_name} (%)')
+    ax.set_ylabel('LTV (%)')
+    ax.set_title(f'Your RoI by LTV for looping on {collateral_token_name}/{loan_token_name}')
+    ax.legend(loc="upper left")
+
+    return figure_to_png(fig)
+
+# Every rerun times its stages. Add ?debug=1 to the URL to see the breakdown on the page, and set LOOPING_TIMING_LOG
+# to a file path to append one JSON record per rerun to it.
+timer = StageTimer()
+TIMING_LOG_PATH = os.environ.get("LOOPING_TIMING_LOG")
 
 st.title("One-Click Looping Calculator")
 
@@ -88,6 +384,16 @@ def get_param_value(key, default, data_type):
     except ValueError:  # Handle parsing issues
         return default
 
+def price_input(token_name, param_key, default):
+    # The live price of the token if the feed has one, the price input otherwise
+    live_price = live_prices.get(token_name)
+    if live_price is not None:
+        st.code(f"Live {token_name} Price: ${live_price[0]:,.4f} ({max(time.time() - live_price[1], 0.):,.0f}s ago)")
+        return live_price[0]
+    if live_prices_enabled:
+        st.caption(f"No live price for {token_name} yet, using the price below.")
+    return st.number_input("Current **{}** Price in USD".format(token_name), value=get_param_value(param_key, default, float), format="%.4f")
+
 params = st.experimental_get_query_params()
 params = params if params is not None else {}
 default_collateral_token_name = "WMNT"
@@ -102,24 +408,61 @@ default_upfront_fee = 0.
 default_myso_fee = 0.0008
 default_dex_slippage = 0.0008
 default_dex_swap_fee = 0.0005
+default_liquidity_model = "flat"
+default_pool_tvl = 1000000.
+default_liquidity_ticks_path = ""
 default_gas_used = 1200000
 default_gas_price = 20
 default_eth_price = 0.3
 default_price_move_from = -5.
 default_price_move_to = 10.
 default_expected_price_move_coll_token = 0.05
+default_roi_curve_points = 101
+default_chart_backend = "matplotlib"
+default_mc_volatility = 0.8
+default_mc_drift = 0.
+default_mc_enabled = 0
+default_mc_paths = 1000000
+default_rolling_enabled = 0
+default_rolling_periods = 52
+default_rolling_paths = 10000
+default_ltv_from = 0.5
+default_ltv_to = 0.95
+default_leverage_enabled = 0
+default_leverage_grid_points = 200
+default_leverage_objective = "Expected RoI"
+default_leverage_target_price_move = 0.05
+default_max_total_loss_price_change = -0.1
+default_inverse_solve_for = "apr"
+default_inverse_target_roi = 0.1
+default_inverse_price_move = 0.05
+default_inverse_target_leverage = 3.
+default_live_prices = 0
+default_price_feed = PRICE_FEED_SPECS[0] if PRICE_FEED_SPECS else ""
+default_live_refresh_seconds = 5.
 
 with st.sidebar:
     st.title("User Input")
+    with st.expander("**Live Prices**"):
+        live_prices_enabled = st.checkbox("Use live prices", value=bool(PRICE_FEED_SPECS) and get_param_value("live_prices", default_live_prices, int) == 1, disabled=not PRICE_FEED_SPECS,
+                                          help="Takes the token prices from a live feed and recomputes the page when they change." if PRICE_FEED_SPECS else "No price feeds are configured on this server.")
+        price_feed_spec = get_param_value("price_feed", default_price_feed, str)
+        if PRICE_FEED_SPECS:
+            price_feed_spec = st.selectbox("Price Feed", PRICE_FEED_SPECS, index=PRICE_FEED_SPECS.index(price_feed_spec) if price_feed_spec in PRICE_FEED_SPECS else 0, disabled=not live_prices_enabled,
+                                           help='One of the feeds configured on the server, with messages like {"symbol": "WMNT", "price": 0.38}.')
+        live_refresh_seconds = st.number_input("Minimum Refresh Interval (seconds)", min_value=0.5, max_value=3600., value=get_param_value("live_refresh_seconds", default_live_refresh_seconds, float), disabled=not live_prices_enabled,
+                                               help="The page recomputes at most this often, however fast prices arrive.")
+        live_prices_version, live_prices = price_feeds().get(price_feed_spec).store.snapshot() if live_prices_enabled else (None, {})
+
     with st.expander("**Your Collateral Token**", expanded=True):
         collateral_token_name = st.text_input("Name of token you want to lever up", value=get_param_value("collateral_token_name", default_collateral_token_name, str))
         user_init_coll_amount = st.number_input("Amount of **{}** you want to lever up".format(collateral_token_name), min_value=0.1, max_value=100000000000.0, value=get_param_value("user_init_coll_amount", default_user_init_coll_amount, float))
-        current_price_coll_token = st.number_input("Current **{}** Price in USD".format(collateral_token_name), value=get_param_value("current_price_coll_token", default_current_price_coll_token, float), format="%.4f")
+        current_price_coll_token = price_input(collateral_token_name, "current_price_coll_token", default_current_price_coll_token)
         st.code(f"Value in USD: ${current_price_coll_token*user_init_coll_amount:,.2f}")
 
     with st.expander("**Your Loan Token**", expanded=False):
         loan_token_name = st.text_input("Name of token you want to borrow", value=get_param_value("loan_token_name", default_loan_token_name, str))
-        current_price_loan_token = st.number_input("Current **{}** Price in USD".format(loan_token_name), value=get_param_value("current_price_loan_token", default_current_price_loan_token, float), format="%.4f")
+        current_price_loan_token = price_input(loan_token_name, "current_price_loan_token", default_current_price_loan_token)
         st.code(f"1 {collateral_token_name} = {current_price_coll_token/current_price_loan_token} {loan_token_name}")
 
     with st.expander("**Your Loan Terms**", expanded=True):
@@ -134,8 +477,21 @@ with st.sidebar:
                                 help="MYSO protocol fee as a decimal. E.g., enter 0.005 for 0.5%.")
 
     with st.expander("**Advanced: Input DEX Assumptions**"):
+        liquidity_models = {"flat": "Flat", "constant_product": "Constant-Product Pool", "concentrated": "Concentrated Liquidity (Tick File)"}
+        liquidity_model = get_param_value("liquidity_model", default_liquidity_model, str)
+        liquidity_model = st.selectbox("Price Impact Model", list(liquidity_models), format_func=liquidity_models.get, index=list(liquidity_models).index(liquidity_model) if liquidity_model in liquidity_models else 0,
+                                       help="Flat charges the same price impact on every swap. The pool models derive it from the pool's liquidity, so it grows with the size of your position.")
         dex_slippage = st.number_input("DEX Price Impact", min_value=0.0, max_value=1.0, value=get_param_value("dex_slippage", default_dex_slippage, float), format="%.4f",
-                                    help="DEX price impact as a decimal. E.g., enter 0.0008 for 0.08% price impact on the exchange.")
+                                    help="DEX price impact as a decimal. E.g., enter 0.0008 for 0.08% price impact on the exchange.",
+                                    disabled=liquidity_model != "flat")
+        pool_tvl = get_param_value("pool_tvl", default_pool_tvl, float)
+        liquidity_ticks_path = get_param_value("liquidity_ticks_path", default_liquidity_ticks_path, str)
+        if liquidity_model == "constant_product":
+            pool_tvl = st.number_input("Pool TVL in USD", min_value=1., max_value=100000000000., value=pool_tvl,
+                                       help=f"Total value locked in the {collateral_token_name}/{loan_token_name} pool, half in each token.")
+        elif liquidity_model == "concentrated":
+            liquidity_ticks_path = st.text_input("Tick File", value=liquidity_ticks_path,
+                                                 help=f"Name of a CSV file in the server's tick file directory with columns tick and liquidity_net. Tick prices are 1.0001^tick {loan_token_name} per {collateral_token_name}.")
         dex_swap_fee = st.number_input("DEX Swap Fee", min_value=0.0, max_value=1.0, value=get_param_value("dex_swap_fee", default_dex_swap_fee, float), format="%.4f",
                                    help="DEX swap fee as a decimal. E.g., enter 0.0005 for a 0.05% swap fee on the exchange.")
     
@@ -146,25 +502,37 @@ with st.sidebar:
         gas_usd_cost = gas_used * gas_price / 10**9 * eth_price
         st.code(f"Gas Cost in USD: ${gas_usd_cost:,.2f}")
 
-flashloan_amount, owed_repayment, sold_on_dex, received_from_dex, combined_pledge, upfront_fee_abs, myso_fee_abs, final_pledge_and_reclaimable = calculate_open_position(
-    current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee
-)
-
-def calc_roi(final_loan_token_amount_after_close, final_loan_token_price, user_init_coll_amount, init_coll_token_price):
-    return final_loan_token_amount_after_close * final_loan_token_price / (user_init_coll_amount * init_coll_token_price) - 1
-
-def calc_roi2(coll_usd_price_change, target_roi, current_price_coll_token, current_price_loan_token, final_pledge_and_reclaimable, owed_repayment, dex_slippage, dex_swap_fee, gas_usd_cost):
-    p1 = current_price_coll_token * (1 + coll_usd_price_change)
-    p2 = current_price_loan_token
-    _, _, _, final_amount_after_close2, _, _ = calculate_close_position(final_pledge_and_reclaimable, owed_repayment, p1, p2, dex_slippage, dex_swap_fee, gas_usd_cost, True)
-    roi = calc_roi(final_amount_after_close2, p2, user_init_coll_amount, current_price_coll_token)
-    return roi - target_roi
-
-total_loss_price_change = bisect(calc_roi2, -1., 2., args=(-1., current_price_coll_token, current_price_loan_token, final_pledge_and_reclaimable, owed_repayment, dex_slippage, dex_swap_fee, gas_usd_cost)) * 100
+    with timer.stage("liquidity_model"):
+        try:
+            liquidity_ticks_file = resolve_ticks_path(liquidity_ticks_path, TICKS_DIR) if liquidity_model == "concentrated" else ""
+            liquidity_ticks_mtime = os.path.getmtime(liquidity_ticks_file) if liquidity_model == "concentrated" else None
+            liquidity = liquidity_model_stage(liquidity_model, pool_tvl, liquidity_ticks_file, liquidity_ticks_mtime, current_price_coll_token, current_price_loan_token)
+        except (OSError, ValueError) as e:
+            st.error(f"Can't load the tick file, using the flat price impact instead: {e}")
+            liquidity = None
+
+    with st.expander("**Advanced: Chart Settings**"):
+        roi_curve_points = st.number_input("RoI Curve Resolution (points)", min_value=11, max_value=100000, value=get_param_value("roi_curve_points", default_roi_curve_points, int),
+                                           help="Number of price changes the RoI curve is evaluated at. Increase it to zoom into narrow price ranges.")
+        chart_backends = {"matplotlib": "Static Image", "vega-lite": "Interactive (in Browser)"}
+        chart_backend = get_param_value("chart_backend", default_chart_backend, str)
+        chart_backend = st.radio("RoI Curve Chart", list(chart_backends), format_func=chart_backends.get, index=list(chart_backends).index(chart_backend) if chart_backend in chart_backends else 0,
+                                 help="The interactive chart is drawn in your browser and shows values on hover.")
+
+with timer.stage("open_position"):
+    flashloan_amount, owed_repayment, sold_on_dex, received_from_dex, combined_pledge, upfront_fee_abs, myso_fee_abs, final_pledge_and_reclaimable = open_position_stage(
+        current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, liquidity
+    )
+
+with timer.stage("thresholds"):
+    break_even_price_change, total_loss_price_change = thresholds_stage(
+        current_price_coll_token, current_price_loan_token, user_init_coll_amount, final_pledge_and_reclaimable, owed_repayment, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity
+    )
+total_loss_text = f"{total_loss_price_change:.2f}%" if not np.isnan(total_loss_price_change) else "any level"
 
 st.write(f"""
 ### What is One-Click Looping?
-With MYSO's one-click looping, you can create a leveraged position in {collateral_token_name} against {loan_token_name} up to a ratio of {final_pledge_and_reclaimable/user_init_coll_amount:,.2f}x (assuming {ltv*100:.1f}% LTV). Instead of consecutively pledging {collateral_token_name} to borrow {loan_token_name}, swapping it for {collateral_token_name}, and repeating the process, one-click looping lets you handle all these steps in one efficient transaction.\n\nAnd unlike perpetuals, there's no risk of liquidation. This ensures that even if the price of {collateral_token_name}/{loan_token_name} plummets, you maintain the full upside potential if the price rebounds again. However, exercise caution: if the price of {collateral_token_name}/{loan_token_name} decreases and remains below {total_loss_price_change:.2f}% for the entire loan duration, your leveraged {collateral_token_name} position will be worth less than the debt you owe. As a result, you won't be able to recover your position without additional {loan_token_name} capital and could suffer a total, 100% loss.
+With MYSO's one-click looping, you can create a leveraged position in {collateral_token_name} against {loan_token_name} up to a ratio of {final_pledge_and_reclaimable/user_init_coll_amount:,.2f}x (assuming {ltv*100:.1f}% LTV). Instead of consecutively pledging {collateral_token_name} to borrow {loan_token_name}, swapping it for {collateral_token_name}, and repeating the process, one-click looping lets you handle all these steps in one efficient transaction.\n\nAnd unlike perpetuals, there's no risk of liquidation. This ensures that even if the price of {collateral_token_name}/{loan_token_name} plummets, you maintain the full upside potential if the price rebounds again. However, exercise caution: if the price of {collateral_token_name}/{loan_token_name} decreases and remains below {total_loss_text} for the entire loan duration, your leveraged {collateral_token_name} position will be worth less than the debt you owe. As a result, you won't be able to recover your position without additional {loan_token_name} capital and could suffer a total, 100% loss.
 """)
 
 st.write(f"""
@@ -180,111 +548,23 @@ price_change_range = st.slider(
     format="%.0f%%"  # Added the % sign after the float format
 )
 
-rel_price_changes = []
-RoIs = []
-rois_for_changes = []
+with timer.stage("roi_grid"):
+    rel_price_changes, RoIs, roi_unchanged = roi_grid_stage(
+        current_price_coll_token, current_price_loan_token, user_init_coll_amount, final_pledge_and_reclaimable, owed_repayment, dex_slippage, dex_swap_fee, gas_usd_cost, price_change_range, roi_curve_points, liquidity
+    )
+
+with timer.stage("roi_chart"):
+    if chart_backend == "vega-lite":
+        roi_chart_data, roi_chart_spec = roi_chart_vega_lite_stage(rel_price_changes, RoIs, break_even_price_change, total_loss_price_change, roi_unchanged, price_change_range, collateral_token_name, loan_token_name)
+        st.vega_lite_chart(roi_chart_data, roi_chart_spec, use_container_width=True)
+    else:
+        st.image(roi_chart_stage(rel_price_changes, RoIs, break_even_price_change, total_loss_price_change, roi_unchanged, price_change_range, collateral_token_name, loan_token_name), use_column_width=True)
 
-# Adjust the loop to take into account the user-defined range
-for i in range(101):
-    p1 = current_price_coll_token * (1 + (price_change_range[0] + (price_change_range[1] - price_change_range[0]) * i/100)/100)
-    p2 = current_price_loan_token
-    _, _, _, final_amount_after_close2, _, _ = calculate_close_position(final_pledge_and_reclaimable, owed_repayment, p1, p2, dex_slippage, dex_swap_fee, gas_usd_cost)
-    rel_price_changes.append(p1/current_price_coll_token-1)
-    roi = calc_roi(final_amount_after_close2, p2, user_init_coll_amount, current_price_coll_token)
-    RoIs.append(roi)
-    if i % 10 == 0:
-        rois_for_changes.append(((p1/current_price_coll_token-1)*100, roi*100))
-
-_, _, _, final_amount_after_close3, _, _ = calculate_close_position(final_pledge_and_reclaimable, owed_repayment, current_price_coll_token, current_price_loan_token, dex_slippage, dex_swap_fee, gas_usd_cost)
-roi_unchanged = calc_roi(final_amount_after_close3, current_price_loan_token, user_init_coll_amount, current_price_coll_token) * 100
-
-break_even_price_change = bisect(calc_roi2, -1., 2., args=(.0, current_price_coll_token, current_price_loan_token, final_pledge_and_reclaimable, owed_repayment, dex_slippage, dex_swap_fee, gas_usd_cost)) * 100
-
-# Create and customize the plot
-fig, ax = plt.subplots(figsize=(10, 5))
-ax.axhline(y=0, color='black', linestyle='-', lw=.5)
-ax.axvline(x=0, color='black', linestyle='-', lw=.5)
-ax.plot([x*100 for x in rel_price_changes], [x*100 for x in RoIs], label=f'RoI Looping {collateral_token_name}', color='deepskyblue')
-ax.plot([x*100 for x in rel_price_changes], [x*100 for x in rel_price_changes], label=f'RoI Buy&Hold {collateral_token_name}', linestyle='-', color='gray')
-ax.fill_between([x*100 for x in rel_price_changes], [x*100 for x in RoIs], [0 for _ in rel_price_changes], where=[roi > 0 for roi, hold in zip(RoIs, rel_price_changes)], color='lightgreen', label='Profit')
-ax.fill_between([x*100 for x in rel_price_changes], [x*100 for x in RoIs], [0 for _ in rel_price_changes], where=[roi <= 0 for roi, hold in zip(RoIs, rel_price_changes)], color='lightcoral', label='Loss')
-if price_change_range[0] < break_even_price_change and break_even_price_change < price_change_range[1]:
-    ax.axvline(x=break_even_price_change, color='green', lw=0.8, linestyle='--')
-    ax.plot(break_even_price_change, 0, "o", color="green")
-    # Annotate the break-even point below the x-axis
-    tmp = f"+{break_even_price_change:.2f}" if break_even_price_change > 0 else f"{break_even_price_change:.2f}"
-    ax.annotate(f'If price {tmp}%:\nBreak-even', 
-                (break_even_price_change, min(RoIs)*100), 
-                textcoords="offset points",
-                color="green",
-                xytext=(0, -90),  # This offsets the annotation below the x-axis
-                ha='center',
-                va='top',  # This aligns the top of the text to the xytext
-                arrowprops=dict(arrowstyle="->", linestyle='dotted', lw=0.8, color='green'))
-if price_change_range[0] < total_loss_price_change and total_loss_price_change < price_change_range[1]:
-    ax.axvline(x=total_loss_price_change, color='red', lw=0.8, linestyle='--')
-    ax.plot(total_loss_price_change, -100, "o", color="red")
-    # Annotate the full loss point below the x-axis
-    tmp = f"+{total_loss_price_change:.2f}" if total_loss_price_change > 0 else f"{total_loss_price_change:.2f}"
-    ax.annotate(f'If price {tmp}%:\nFull Loss', 
-                (total_loss_price_change, min(RoIs)*100), 
-                textcoords="offset points", 
-                color="red",
-                xytext=(0, -60),  # This offsets the annotation below the x-axis
-                ha='center',
-                va='top',  # This aligns the top of the text to the xytext
-                arrowprops=dict(arrowstyle="->", linestyle='dotted', lw=0.8, color='red'))
-# Annotation outside of the y-axis
-tmp = f"+{roi_unchanged:.2f}" if roi_unchanged > 0 else f"{roi_unchanged:.2f}"
-if price_change_range[0] < 0 and 0 < price_change_range[1]:   
-    # Add vertical dotted line
-    ax.axhline(y=roi_unchanged, color='darkblue', linestyle='--', lw=0.8)
-    ax.plot(0, roi_unchanged, "o", color="darkblue")
-    ax.annotate(f'If price flat:\n{tmp}% RoI',
-                (price_change_range[0], roi_unchanged), 
-                textcoords="offset points", 
-                color="darkblue",
-                xytext=(-65, 0),  # This offsets the annotation to the left of the y-axis
-                ha='right',
-                va='center',  # This aligns the center of the text to the xytext
-                arrowprops=dict(arrowstyle="->", linestyle='dotted', lw=0.8, color='darkblue'))
-ax.grid(True, which='both', linestyle='--', linewidth=0.5)
-
-ax.set_xlabel(f'Price Change of {collateral_token_name}/{loan_token_name} (%)')
-ax.set_ylabel('RoI (%)')
-ax.set_title(f'Your RoI for looping on {collateral_token_name}/{loan_token_name}')
-ax.legend(loc="upper left")
-
-st.pyplot(fig)
-
-
-# add special points
-p1 = current_price_coll_token
-p2 = current_price_loan_token
-_, _, _, final_amount_after_close2, _, _ = calculate_close_position(final_pledge_and_reclaimable, owed_repayment, p1, p2, dex_slippage, dex_swap_fee, gas_usd_cost)
-rel_price_changes.append(p1/current_price_coll_token-1)
-roi = calc_roi(final_amount_after_close2, p2, user_init_coll_amount, current_price_coll_token)
-rois_for_changes.append(((p1/current_price_coll_token-1)*100, roi*100))
-
-p1 = current_price_coll_token * (1 + break_even_price_change/100)
-p2 = current_price_loan_token
-_, _, _, final_amount_after_close2, _, _ = calculate_close_position(final_pledge_and_reclaimable, owed_repayment, p1, p2, dex_slippage, dex_swap_fee, gas_usd_cost)
-rel_price_changes.append(p1/current_price_coll_token-1)
-roi = calc_roi(final_amount_after_close2, p2, user_init_coll_amount, current_price_coll_token)
-rois_for_changes.append(((p1/current_price_coll_token-1)*100, roi*100))
-
-p1 = current_price_coll_token * (1 + total_loss_price_change/100)
-p2 = current_price_loan_token
-_, _, _, final_amount_after_close2, _, _ = calculate_close_position(final_pledge_and_reclaimable, owed_repayment, p1, p2, dex_slippage, dex_swap_fee, gas_usd_cost)
-rel_price_changes.append(p1/current_price_coll_token-1)
-roi = calc_roi(final_amount_after_close2, p2, user_init_coll_amount, current_price_coll_token)
-rois_for_changes.append(((p1/current_price_coll_token-1)*100, roi*100))
-
-df = pd.DataFrame(rois_for_changes, columns=["Price Change (%)", "Looping RoI (%)"])
-df.drop_duplicates(inplace=True)
-df = df.sort_values(by="Price Change (%)", ascending=False)
-# Reset the index for proper numbering
-df.reset_index(drop=True, inplace=True)
+
+with timer.stage("roi_table"):
+    df = roi_table_stage(
+        current_price_coll_token, current_price_loan_token, user_init_coll_amount, final_pledge_and_reclaimable, owed_repayment, dex_slippage, dex_swap_fee, gas_usd_cost, price_change_range, break_even_price_change, total_loss_price_change, liquidity
+    )
 
 def highlight_special_points(column):
     """
@@ -315,26 +595,110 @@ def highlight_special_points(column):
             colors.append('')  # Default - no highlighting
     return colors
 
-# Format the values for better display
-df["Price Change (%)"] = df["Price Change (%)"].apply(lambda x: f"+{x:.2f}%" if x > 0 else f"{x:.2f}%")
-df["Looping RoI (%)"] = df["Looping RoI (%)"].apply(lambda x: f"+{x:.2f}%" if x > 0 else f"{x:.2f}%")
-
 
 st.write(f"""Above, you can view the RoI from looping (blue curve) based on different {collateral_token_name}/{loan_token_name} price changes. You can also see how it compares to simply holding {collateral_token_name} (gray curve). Below, a table provides a detailed view on some of the points.""")
 
 # If you still want to display the full DataFrame below the selected row
-styled_df = df.style.apply(highlight_special_points)
-st.table(styled_df)
+with timer.stage("roi_table"):
+    styled_df = df.style.apply(highlight_special_points)
+    st.table(styled_df)
 st.write(f"""
     There are 3 important scenarios to be aware of (gray shaded rows):
     
-    - **Break-even**: The price of {collateral_token_name}/{loan_token_name} needs to move by at least {"+" if break_even_price_change > 0 else ""}{break_even_price_change:.2f}% for you to break even.
+    - **Break-even**: {f'The price of {collateral_token_name}/{loan_token_name} needs to move by at least {"+" if break_even_price_change > 0 else ""}{break_even_price_change:.2f}% for you to break even.' if not np.isnan(break_even_price_change) else f'No price move of {collateral_token_name}/{loan_token_name} lets you break even with these loan terms.'}
 
     - **Unwinding Immediately**: If the price of {collateral_token_name}/{loan_token_name} stays flat, or if you decide to unwind your position immediately, your RoI will be {roi_unchanged:.2f}%.
 
-    - **Total Loss**: If the price of {collateral_token_name}/{loan_token_name} drops and stays below {total_loss_price_change:.2f}% throughout the entire loan duration, your leveraged {collateral_token_name} collateral will be worth less than your {loan_token_name} debt. In this situation, it would be rational for you to not repay, in which case you'll suffer a 100% loss.
+    - **Total Loss**: If the price of {collateral_token_name}/{loan_token_name} drops and stays below {total_loss_text} throughout the entire loan duration, your leveraged {collateral_token_name} collateral will be worth less than your {loan_token_name} debt. In this situation, it would be rational for you to not repay, in which case you'll suffer a 100% loss.
     """)
 
+st.write("""### How Risky Is Looping?""")
+st.write(f"""
+Instead of a single price change, you can simulate many possible {collateral_token_name}/{loan_token_name} price outcomes over the loan duration of {tenor} days, assuming the price follows a geometric Brownian motion, and look at the resulting RoI distribution.""")
+
+with st.expander("**Simulate Price Outcomes**"):
+    col1, col2, col3 = st.columns(3)
+    mc_volatility = col1.number_input("Annualized Volatility", min_value=0.0, max_value=10.0, value=get_param_value("mc_volatility", default_mc_volatility, float), format="%.4f",
+                                      help="Annualized volatility of the price as a decimal. E.g., enter 0.8 for 80%.")
+    mc_drift = col2.number_input("Annualized Drift", min_value=-10.0, max_value=10.0, value=get_param_value("mc_drift", default_mc_drift, float), format="%.4f",
+                                 help="Expected annualized price return as a decimal. E.g., enter 0.1 for 10%.")
+    mc_paths = col3.number_input("Simulated Paths", min_value=1000, max_value=10000000, step=100000, value=get_param_value("mc_paths", default_mc_paths, int))
+    mc_enabled = st.checkbox("Run simulation", value=get_param_value("mc_enabled", default_mc_enabled, int) == 1)
+
+    if mc_enabled:
+        with timer.stage("monte_carlo"):
+            mc_results = monte_carlo_stage(
+                current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost,
+                mc_volatility, mc_drift, mc_paths, liquidity
+            )
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Expected RoI (before gas)", f"{mc_results['expected_roi']*100:,.2f}%", help="Of a single loan, before gas costs.")
+        col2.metric("Probability of Total Loss", f"{mc_results['prob_total_loss']*100:,.2f}%")
+        col3.metric(f"VaR ({mc_results['var_level']*100:.0f}%, before gas)", f"{-mc_results['var']*100:,.2f}%",
+                    help="RoI that is only undercut in the worst simulated outcomes, before gas costs.")
+        col4.metric(f"CVaR ({mc_results['var_level']*100:.0f}%, before gas)", f"{-mc_results['cvar']*100:,.2f}%",
+                    help="Average RoI of the worst simulated outcomes beyond the VaR, before gas costs.")
+        with timer.stage("roi_histogram_chart"):
+            st.image(roi_histogram_stage(mc_results["histogram_counts"], mc_results["histogram_bin_edges"], collateral_token_name, loan_token_name), use_column_width=True)
+
+st.write("""### What If You Keep Rolling?""")
+st.write(f"""
+At expiry, you can swap what's left into {collateral_token_name} and open a new loop with it. You can simulate rolling your position over many consecutive loans of {tenor} days, with the volatility and drift of the simulation above. A default ends the chain with a total loss.""")
+
+with st.expander("**Simulate Rolling Loops**"):
+    col1, col2 = st.columns(2)
+    rolling_periods = col1.number_input("Consecutive Loans", min_value=1, max_value=520, value=get_param_value("rolling_periods", default_rolling_periods, int))
+    rolling_paths = col2.number_input("Simulated Paths", min_value=1000, max_value=100000, step=1000, value=get_param_value("rolling_paths", default_rolling_paths, int), key="rolling_paths")
+    rolling_enabled = st.checkbox("Run simulation", value=get_param_value("rolling_enabled", default_rolling_enabled, int) == 1, key="rolling_enabled")
+
+    if rolling_enabled:
+        with timer.stage("rolling"):
+            rolling_results = rolling_stage(
+                current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost,
+                mc_volatility, mc_drift, rolling_periods, rolling_paths, liquidity
+            )
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Expected RoI (net of gas)", f"{rolling_results['expected_roi']*100:,.2f}%", help="Compounded over all loans, net of gas costs.")
+        col2.metric("Median RoI (net of gas)", f"{rolling_results['median_roi']*100:,.2f}%")
+        col3.metric("Probability of Total Loss", f"{rolling_results['prob_total_loss']*100:,.2f}%")
+        col4.metric(f"Expected RoI Buy&Hold {collateral_token_name}", f"{rolling_results['expected_buy_and_hold_roi']*100:,.2f}%")
+        with timer.stage("rolling_histogram_chart"):
+            st.image(roi_histogram_stage(rolling_results["histogram_counts"], rolling_results["histogram_bin_edges"], collateral_token_name, loan_token_name), use_column_width=True)
+        st.line_chart({"Loans": np.arange(rolling_periods + 1), "Paths Still Rolling (%)": rolling_results["survival"] * 100}, x="Loans", y="Paths Still Rolling (%)")
+
+st.write("""### How Much Leverage Should I Use?""")
+st.write(f"""
+The heatmap below shows your RoI for every combination of LTV and {collateral_token_name}/{loan_token_name} price change in the range chosen above. You can also search for the LTV that maximizes your RoI while keeping the total loss threshold below a price change of your choice.""")
+
+with st.expander("**Explore Leverage**"):
+    ltv_range = st.slider("LTV range", min_value=0.01, max_value=1.0, step=0.01,
+                          value=(get_param_value("ltv_from", default_ltv_from, float), get_param_value("ltv_to", default_ltv_to, float)))
+    col1, col2 = st.columns(2)
+    leverage_grid_points = col1.number_input("Grid Resolution (points per axis)", min_value=10, max_value=1000, value=get_param_value("leverage_grid_points", default_leverage_grid_points, int))
+    max_total_loss_price_change = col2.number_input("Max. Total Loss Price Change", min_value=-1.0, max_value=0.0, value=get_param_value("max_total_loss_price_change", default_max_total_loss_price_change, float), format="%.4f",
+                                                    help="Only consider LTVs where a total loss requires the price to drop by more than this, as a decimal. E.g., enter -0.1 for -10%.")
+    leverage_objectives = ["Expected RoI", "RoI at Target Price Change"]
+    leverage_objective = get_param_value("leverage_objective", default_leverage_objective, str)
+    leverage_objective = col1.radio("Optimize for", leverage_objectives, index=leverage_objectives.index(leverage_objective) if leverage_objective in leverage_objectives else 0,
+                                    help="Expected RoI uses the volatility and drift of the simulation above.")
+    leverage_target_price_move = col2.number_input("Target Price Change", min_value=-1.0, max_value=10.0, value=get_param_value("leverage_target_price_move", default_leverage_target_price_move, float), format="%.4f",
+                                                   disabled=leverage_objective != "RoI at Target Price Change")
+    leverage_enabled = st.checkbox("Compute leverage grid", value=get_param_value("leverage_enabled", default_leverage_enabled, int) == 1)
+
+    if leverage_enabled:
+        with timer.stage("leverage"):
+            ltvs, leverage_price_moves, leverage_rois, leverage_total_loss_price_changes, leverage_optimum = leverage_stage(
+                current_price_coll_token, current_price_loan_token, user_init_coll_amount, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost,
+                ltv_range, price_change_range, leverage_grid_points, mc_volatility, mc_drift,
+                leverage_target_price_move if leverage_objective == "RoI at Target Price Change" else None, max_total_loss_price_change, liquidity
+            )
+        if np.isnan(leverage_optimum["ltv"]):
+            st.code(f"No LTV in this range keeps the total loss threshold below {max_total_loss_price_change*100:.2f}%")
+        else:
+            st.code(f"Best LTV: {leverage_optimum['ltv']*100:.2f}% ({leverage_objective}: {leverage_optimum['objective']*100:,.2f}%, total loss below {leverage_optimum['total_loss_price_change']*100:.2f}%)")
+        with timer.stage("leverage_heatmap_chart"):
+            st.image(leverage_heatmap_stage(ltvs, leverage_price_moves, leverage_rois, leverage_total_loss_price_changes, leverage_optimum["ltv"], collateral_token_name, loan_token_name), use_column_width=True)
+
 st.write(f"""### How Does Looping Work?""")
 st.write(f"""
 For a more detailed scenario breakdown, you can input the {collateral_token_name}/{loan_token_name} price change you expect over the loan duration of {tenor} days.""")
@@ -345,7 +709,8 @@ final_price_coll_token = current_price_coll_token * (1 + expected_price_move_col
 final_price_loan_token = current_price_loan_token
 
 
-flashloan_amount2, sold_on_dex2, received_from_dex2, final_amount_after_close2, rational_to_repay, _ = calculate_close_position(final_pledge_and_reclaimable, owed_repayment, final_price_coll_token, final_price_loan_token, dex_slippage, dex_swap_fee, gas_usd_cost)
+with timer.stage("close_position"):
+    flashloan_amount2, sold_on_dex2, received_from_dex2, final_amount_after_close2, rational_to_repay, _ = close_position_stage(final_pledge_and_reclaimable, owed_repayment, final_price_coll_token, final_price_loan_token, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity)
 
 roi = final_amount_after_close2 * final_price_loan_token / (current_price_coll_token * user_init_coll_amount) - 1
 
@@ -425,7 +790,8 @@ data = {
 }
 
 # Display the table in Streamlit
-st.table(data)
+with timer.stage("breakdown_table"):
+    st.table(data)
 
 
 st.write(f"""
@@ -440,78 +806,79 @@ st.write(f"""
 """)
 
 
-# Values for the bar chart
-labels = [
-    f'Your Initial {collateral_token_name}\n (Inception)', 
-    f'Flasborrowed {loan_token_name}\n (Inception)',
-    f'Leveraged {collateral_token_name}\n (Open Position)', 
-    f'{loan_token_name} Owed\n (Open Position)', 
-    f'Flashborrowed {collateral_token_name}\n (Close Position)',
-    f'{loan_token_name} Owed\n (Close Position)',
-    f'Your Final {loan_token_name}\n (Final Position)'
-]
-
-values = [
-    user_init_coll_amount * current_price_coll_token,
-    flashloan_amount * current_price_loan_token,
-    combined_pledge * current_price_coll_token,
-    owed_repayment * current_price_loan_token,
-    combined_pledge * final_price_coll_token,
-    owed_repayment * final_price_loan_token,
-    final_amount_after_close2 * final_price_loan_token
-]
-
-amounts = [
-    user_init_coll_amount,
-    flashloan_amount,
-    combined_pledge,
-    owed_repayment,
-    flashloan_amount2,
-    owed_repayment,
-    final_amount_after_close2
-]
-
-tokens = [
-    collateral_token_name,
-    loan_token_name,
-    collateral_token_name,
-    loan_token_name,
-    collateral_token_name,
-    loan_token_name,
-    loan_token_name
-]
-
-colors = ['lightgray', 'lightgray', 'lightgreen', 'lightcoral', 'lightgreen', 'lightcoral', 'lightblue']
-
-# Create the bar chart
-fig, ax = plt.subplots(figsize=(12, 7))
-bars = ax.bar(labels, values, color=colors)
-
-# Add annotations to the bars
-for i, rect in enumerate(bars):
-    height = rect.get_height()
-    ax.text(rect.get_x() + rect.get_width()/2., 1.05 * height,
-            f"${values[i]:,.2f}\n({amounts[i]:,.2f} {tokens[i]})", ha='center', va='bottom', rotation=0)
-
-    # Adding vertical lines after every two bars
-    if (i+1) % 2 == 0 and i != len(bars) - 1:  # Check that it's not the last bar
-        ax.axvline(x=rect.get_x() + rect.get_width() + 0.1, color='black', linestyle='--')
-
-# Highlight the negative values with a different color
-for i, v in enumerate(values):
-    if v < 0:
-        bars[i].set_color('red')
-
-ax.set_title("Overview of Assets vs Debts, pre and post Looping")
-ax.set_ylabel('Amount (USD)')
-locations = ax.get_xticks()  # Assuming you want to set labels for existing tick locations
-ax.xaxis.set_major_locator(plt.FixedLocator(locations))
-ax.set_xticklabels(labels, rotation=45, ha='right')
-ax.set_ylim(0, max(values)*1.2)  # Add some space at the top for annotations
-
 # Display the bar chart in Streamlit
-st.pyplot(fig)
-
+with timer.stage("summary_chart"):
+    st.image(summary_chart_stage(user_init_coll_amount, current_price_coll_token, flashloan_amount, current_price_loan_token, combined_pledge, owed_repayment,
+                                  final_price_coll_token, final_price_loan_token, flashloan_amount2, final_amount_after_close2, collateral_token_name, loan_token_name),
+             use_column_width=True)
+
+st.write("""### How Sensitive Is Your Position?""")
+if liquidity is not None:
+    st.write("""Sensitivities are only available for the flat DEX price impact model.""")
+else:
+    with timer.stage("sensitivities"):
+        sensitivities = sensitivities_stage(current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost, expected_price_move_coll_token)
+    st.write(f"""
+How much your RoI (net of gas costs) changes when one input changes, at the expected price change of {expected_price_move_coll_token*100:+.2f}%. These are exact derivatives of the position formulas{"" if rational_to_repay else f"; as you'd default at this price change, only gas costs still matter"}.""")
+    # Input, its current value, the derivative's key and a typical change of the input
+    sensitivity_rows = [
+        (f"{collateral_token_name}/{loan_token_name} Price Change", f"{expected_price_move_coll_token*100:+.2f}%", "delta", 0.01, "+1%"),
+        ("APR", f"{apr*100:.2f}%", "apr", 0.01, "+1%"),
+        ("Tenor", f"{tenor} days", "tenor", 1, "+1 day"),
+        ("LTV", f"{ltv*100:.2f}%", "ltv", 0.01, "+1%"),
+        ("Upfront Fee", f"{upfront_fee*100:.2f}%", "upfront_fee", 0.001, "+0.1%"),
+        ("MYSO Protocol Fee", f"{myso_fee*100:.2f}%", "myso_fee", 0.0001, "+0.01%"),
+        ("DEX Price Impact", f"{dex_slippage*100:.2f}%", "dex_slippage", 0.0001, "+0.01%"),
+        ("DEX Swap Fee", f"{dex_swap_fee*100:.2f}%", "dex_swap_fee", 0.0001, "+0.01%"),
+        ("Gas Costs", f"${gas_usd_cost:,.2f}", "gas_usd_cost", 1, "+$1"),
+    ]
+    st.table({
+        "Input": [row[0] for row in sensitivity_rows],
+        "Value": [row[1] for row in sensitivity_rows],
+        "dRoI/dInput": [f"{sensitivities[row[2]]:+,.4f}" for row in sensitivity_rows],
+        "Change": [row[4] for row in sensitivity_rows],
+        "RoI Change": [f"{sensitivities[row[2]]*row[3]*100:+,.2f}%" for row in sensitivity_rows],
+    })
+    st.caption("The RoI is linear in the price change as long as you repay, so gamma is zero; below the total loss threshold it stays flat at -100%.")
+
+st.write("""### What Do I Need for My Target?""")
+st.write("""
+Instead of nudging the inputs in the sidebar until you hit your target, you can solve for one input directly, keeping all other inputs as they are.""")
+
+with st.expander("**Solve for an Input**"):
+    inverse_inputs = {"apr": "Highest APR", "tenor": "Longest Tenor", "upfront_fee": "Highest Upfront Fee", "ltv": "LTV", "leverage": "LTV for a Target Leverage"}
+    inverse_solve_for = get_param_value("inverse_solve_for", default_inverse_solve_for, str)
+    inverse_solve_for = st.selectbox("Solve for", list(inverse_inputs), format_func=inverse_inputs.get, index=list(inverse_inputs).index(inverse_solve_for) if inverse_solve_for in inverse_inputs else 0)
+    col1, col2, col3 = st.columns(3)
+    inverse_target_roi = col1.number_input("Target RoI", min_value=-0.9999, max_value=100.0, value=get_param_value("inverse_target_roi", default_inverse_target_roi, float), format="%.4f",
+                                           help="RoI you want to reach as a decimal, before gas costs. E.g., enter 0.1 for 10%.", disabled=inverse_solve_for == "leverage")
+    inverse_price_move = col2.number_input("At Price Change", min_value=-1.0, max_value=10.0, value=get_param_value("inverse_price_move", default_inverse_price_move, float), format="%.4f",
+                                           help=f"Price change of {collateral_token_name}/{loan_token_name} over the loan lifetime as a decimal. E.g., enter 0.05 for +5%.", disabled=inverse_solve_for == "leverage")
+    inverse_target_leverage = col3.number_input("Target Leverage", min_value=1.0, max_value=1000.0, value=get_param_value("inverse_target_leverage", default_inverse_target_leverage, float), format="%.2f",
+                                                disabled=inverse_solve_for != "leverage")
+
+    if liquidity is not None and inverse_solve_for != "leverage":
+        st.write("""The solver is only available for the flat DEX price impact model.""")
+    else:
+        # Solve at the chosen price change and at the price changes of the RoI table
+        table_price_moves = np.linspace(price_change_range[0], price_change_range[1], 11) / 100
+        with timer.stage("inverse"):
+            solved = inverse_stage(inverse_solve_for, inverse_target_leverage if inverse_solve_for == "leverage" else inverse_target_roi, (inverse_price_move, *table_price_moves),
+                                   current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost)
+
+        def format_solved(value):
+            if np.isnan(value):
+                return "not reachable"
+            if inverse_solve_for == "tenor":
+                return "any tenor" if np.isinf(value) else f"{value:,.1f} days"
+            return f"{value*100:.2f}%"
+
+        if inverse_solve_for == "leverage":
+            # Leverage doesn't depend on the price change, so there's a single LTV
+            st.code(f"LTV for {inverse_target_leverage:,.2f}x leverage: {format_solved(solved)}")
+        else:
+            st.code(f"{inverse_inputs[inverse_solve_for]} for a {inverse_target_roi*100:+.2f}% RoI at a {inverse_price_move*100:+.2f}% price change: {format_solved(solved[0])}")
+            st.table({"Price Change": [f"{move*100:+.2f}%" for move in table_price_moves], inverse_inputs[inverse_solve_for]: [format_solved(value) for value in solved[1:]]})
 
 st.write(f"""💡You can share the calculated scenario using this link:""")
 input_values = {
@@ -527,12 +894,38 @@ input_values = {
     "myso_fee": myso_fee,
     "dex_slippage": dex_slippage,
     "dex_swap_fee": dex_swap_fee,
+    "liquidity_model": liquidity_model,
+    "pool_tvl": pool_tvl,
+    "liquidity_ticks_path": liquidity_ticks_path,
     "gas_used": gas_used,
     "gas_price": gas_price,
     "eth_price": eth_price,
     "price_move_from": price_change_range[0],
     "price_move_to": price_change_range[1],
-    "expected_price_move_coll_token": expected_price_move_coll_token
+    "expected_price_move_coll_token": expected_price_move_coll_token,
+    "roi_curve_points": roi_curve_points,
+    "chart_backend": chart_backend,
+    "mc_volatility": mc_volatility,
+    "mc_drift": mc_drift,
+    "mc_paths": mc_paths,
+    "mc_enabled": int(mc_enabled),
+    "rolling_periods": rolling_periods,
+    "rolling_paths": rolling_paths,
+    "rolling_enabled": int(rolling_enabled),
+    "ltv_from": ltv_range[0],
+    "ltv_to": ltv_range[1],
+    "leverage_grid_points": leverage_grid_points,
+    "leverage_enabled": int(leverage_enabled),
+    "leverage_objective": leverage_objective,
+    "leverage_target_price_move": leverage_target_price_move,
+    "max_total_loss_price_change": max_total_loss_price_change,
+    "inverse_solve_for": inverse_solve_for,
+    "inverse_target_roi": inverse_target_roi,
+    "inverse_price_move": inverse_price_move,
+    "inverse_target_leverage": inverse_target_leverage,
+    "live_prices": int(live_prices_enabled),
+    "price_feed": price_feed_spec,
+    "live_refresh_seconds": live_refresh_seconds
 }
 
 # Convert the dictionary to a query string
@@ -542,3 +935,42 @@ shareable_link = base_url + "?" + query_string
 
 # Display the shareable link in a code block
 st.code(shareable_link)
+
+script_run_ctx = get_script_run_ctx()
+timing_record = timer.record(session_id=script_run_ctx.session_id if script_run_ctx else None, query_params={key: values[0] for key, values in params.items()})
+if TIMING_LOG_PATH:
+    append_jsonl(TIMING_LOG_PATH, timing_record)
+if get_param_value("debug", "", str) not in ("", "0", "false"):
+    with st.expander(f"**Debug: Timing Breakdown** ({timing_record['total_seconds']*1000:,.1f} ms)"):
+        st.table({
+            "Stage": list(timing_record["stages"]),
+            "Time (ms)": [f"{seconds*1000:,.2f}" for seconds in timing_record["stages"].values()],
+            "Share of Rerun": [f"{seconds/timing_record['total_seconds']*100:.1f}%" for seconds in timing_record["stages"].values()],
+        })
+        if RESULT_CACHE_PATH:
+            cache_stats = result_cache(RESULT_CACHE_PATH, RESULT_CACHE_MAX_BYTES).stats()
+            hit_rate = f"{cache_stats['hit_rate']*100:.1f}%" if cache_stats["hit_rate"] is not None else "-"
+            st.code(f"Result cache: {cache_stats['entries']:,} entries, {cache_stats['bytes']/1024**2:,.1f} MB, {cache_stats['hits']:,} hits, {cache_stats['misses']:,} misses ({hit_rate} hit rate), {cache_stats['evictions']:,} evictions")
+
+if live_prices_enabled:
+    # Reruns once newer prices arrived, at most every live_refresh_seconds however fast they come, and idles at least
+    # as long as the rerun took so a live session never keeps a core busy. Stages that don't read the prices are
+    # served from their caches, so a rerun only recomputes the price-dependent ones. Waiting only blocks this session's
+    # script thread, and updating the status is a yield point where Streamlit interrupts the wait for a widget change
+    # or a closed page. Automatic reruns keep the deadline of the last run a user started; once it passes the run ends
+    # and the session idles until the next interaction.
+    live_status = st.empty()
+    price_store = price_feeds().get(price_feed_spec).store
+    if not st.session_state.pop("live_prices_rerun", False):
+        st.session_state["live_prices_until"] = time.monotonic() + LIVE_PRICES_MAX_IDLE_SECONDS
+    refresh_at = time.monotonic() + max(live_refresh_seconds - timing_record["total_seconds"], timing_record["total_seconds"])
+    while time.monotonic() < st.session_state["live_prices_until"]:
+        live_status.caption(f"Live prices from {price_feed_spec}, refreshing at most every {live_refresh_seconds:g}s.")
+        wait_seconds = refresh_at - time.monotonic()
+        if wait_seconds > 0:
+            time.sleep(min(wait_seconds, LIVE_PRICES_POLL_SECONDS))
+        elif price_store.wait_for_update(live_prices_version, timeout=LIVE_PRICES_POLL_SECONDS) != live_prices_version:
+            st.session_state["live_prices_rerun"] = True
+            st.experimental_rerun()
+    live_status.caption(f"Live prices paused after {LIVE_PRICES_MAX_IDLE_SECONDS / 60:g} minutes without interaction.")
+    st.button("Resume Live Prices")
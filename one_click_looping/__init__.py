@@ -0,0 +1,30 @@
+"""Headless engine of the one-click looping calculator.
+
+Importing this package only pulls in numpy; the Streamlit page and its plotting dependencies live in
+``one-click-looping-calculator.py``.
+"""
+from one_click_looping.engine import (
+    DEFAULT_SCENARIO,
+    SCENARIO_FIELDS,
+    calc_price_change_for_roi,
+    calc_roi,
+    calculate_close_position,
+    calculate_open_position,
+    calculate_sensitivities,
+    calculate_thresholds,
+    evaluate_scenarios,
+    find_flashloan_amount,
+)
+
+__all__ = [
+    "DEFAULT_SCENARIO",
+    "SCENARIO_FIELDS",
+    "calc_price_change_for_roi",
+    "calc_roi",
+    "calculate_close_position",
+    "calculate_open_position",
+    "calculate_sensitivities",
+    "calculate_thresholds",
+    "evaluate_scenarios",
+    "find_flashloan_amount",
+]
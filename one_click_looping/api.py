@@ -0,0 +1,323 @@
+"""Local HTTP/JSON API of the calculator, for bots.
+
+Usage:
+    python -m one_click_looping.api --port 8600
+    curl -d '{"ltv": 0.9, "apr": 0.1, "tenor": 14}' localhost:8600/evaluate
+    curl -d '[{"ltv": 0.9}, {"ltv": 0.8, "liquidity_model": "constant_product", "pool_tvl": 250000}]' localhost:8600/evaluate
+    curl 'localhost:8600/evaluate?ltv=0.9&tenor=14'
+
+Requests take the parameters of the Streamlit page's share link (``input_values``), as a JSON object, a JSON list of
+objects or a query string; parameters that aren't given take the page's defaults and unrelated ones are ignored.
+Parameters out of their valid range (e.g. fees outside [0, 1), an LTV outside (0, 1), prices that aren't positive, a
+tenor below one day or a fractional number of days) are rejected with a 400. Every parameter set gets the open/close
+breakdown at expected_price_move_coll_token, the break-even and total loss price changes (relative, null if
+unreachable) and the RoI curve over price_move_from..price_move_to (in percent, like the page). Parameter sets of
+all requests arriving within the batch window are evaluated together in one vectorized pass. With --surface, RoI
+curves are interpolated from precomputed surfaces where they cover the parameter set. Tick files of the concentrated
+liquidity model are only loaded from the --ticks-dir directory. The server only needs tornado, which comes with
+Streamlit.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+from functools import lru_cache
+
+import numpy as np
+import tornado.web
+
+from one_click_looping.engine import DEFAULT_SCENARIO, calc_roi, calculate_close_position, evaluate_scenarios
+from one_click_looping.liquidity import ConcentratedLiquidity, ConstantProductPool, resolve_ticks_path
+from one_click_looping.surface import load_surface
+
+DEFAULT_BATCH_WINDOW = 0.002
+DEFAULT_MAX_BATCH_SIZE = 4096
+
+# RoI curve points of one parameter set (as on the page) and of all sets of one request
+MAX_ROI_CURVE_POINTS = 100_000
+MAX_REQUEST_ROI_CURVE_POINTS = 1_000_000
+
+# Share link parameters the API evaluates, with their types and the page's defaults
+PARAM_DEFAULTS = {
+    "collateral_token_name": "WMNT",
+    "user_init_coll_amount": 100.,
+    "current_price_coll_token": DEFAULT_SCENARIO["current_price_coll_token"],
+    "loan_token_name": "USDT",
+    "current_price_loan_token": DEFAULT_SCENARIO["current_price_loan_token"],
+    "ltv": DEFAULT_SCENARIO["ltv"],
+    "tenor": DEFAULT_SCENARIO["tenor"],
+    "apr": DEFAULT_SCENARIO["apr"],
+    "upfront_fee": DEFAULT_SCENARIO["upfront_fee"],
+    "myso_fee": DEFAULT_SCENARIO["myso_fee"],
+    "dex_slippage": DEFAULT_SCENARIO["dex_slippage"],
+    "dex_swap_fee": DEFAULT_SCENARIO["dex_swap_fee"],
+    "liquidity_model": "flat",
+    "pool_tvl": 1000000.,
+    "liquidity_ticks_path": "",
+    "gas_used": 1200000,
+    "gas_price": 20,
+    "eth_price": 0.3,
+    "price_move_from": -5.,
+    "price_move_to": 10.,
+    "expected_price_move_coll_token": DEFAULT_SCENARIO["price_move"],
+    "roi_curve_points": 101,
+}
+LIQUIDITY_MODELS = ("flat", "constant_product", "concentrated")
+NUMERIC_PARAMS = tuple(name for name, default in PARAM_DEFAULTS.items() if not isinstance(default, str))
+FEE_PARAMS = ("upfront_fee", "myso_fee", "dex_slippage", "dex_swap_fee")
+PRICE_PARAMS = ("current_price_coll_token", "current_price_loan_token", "user_init_coll_amount")
+NON_NEGATIVE_PARAMS = ("apr", "gas_used", "gas_price", "eth_price")
+
+OPEN_POSITION_FIELDS = ("flashloan_amount", "owed_repayment", "sold_on_dex", "received_from_dex", "combined_pledge", "upfront_fee_abs", "myso_fee_abs", "final_pledge_and_reclaimable", "leverage")
+CLOSE_POSITION_FIELDS = ("final_price_coll_token", "received_from_dex_on_close", "final_amount_after_close", "rational_to_repay", "roi", "roi_net_of_gas")
+
+@lru_cache(maxsize=32)
+def _load_ticks(path, mtime):
+    # The modification time is part of the key, so edits to the file are picked up
+    return ConcentratedLiquidity.from_ticks_csv(path)
+
+def parse_params(raw, ticks_dir=None):
+    # Typed parameter set from a share link style dict (values may be strings, as in a query string). Raises
+    # ValueError for values that can't be parsed or are out of range, including fractions of whole-number parameters.
+    # Tick files are looked up in ticks_dir (see resolve_ticks_path).
+    if not isinstance(raw, dict):
+        raise ValueError("Every parameter set must be a JSON object")
+    params = {}
+    for name, default in PARAM_DEFAULTS.items():
+        value = raw.get(name, default)
+        if isinstance(default, str):
+            params[name] = str(value)
+            continue
+        # Numbers are checked as floats first, so huge or infinite values can't overflow the int conversion
+        try:
+            number = float(value)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"Invalid value for {name}: {value!r}")
+        if not math.isfinite(number):
+            raise ValueError(f"{name} must be finite")
+        if isinstance(default, int):
+            if not number.is_integer():
+                raise ValueError(f"{name} must be a whole number")
+            number = int(number)
+        params[name] = number
+    if params["liquidity_model"] not in LIQUIDITY_MODELS:
+        raise ValueError(f"liquidity_model must be one of {', '.join(LIQUIDITY_MODELS)}")
+    for name in FEE_PARAMS:
+        if not 0 <= params[name] < 1:
+            raise ValueError(f"{name} must be at least 0 and below 1")
+    if not 0 < params["ltv"] < 1:
+        raise ValueError("ltv must be above 0 and below 1")
+    if params["tenor"] < 1:
+        raise ValueError("tenor must be at least 1 day")
+    for name in NON_NEGATIVE_PARAMS:
+        if params[name] < 0:
+            raise ValueError(f"{name} can't be negative")
+    for name in PRICE_PARAMS:
+        if params[name] <= 0:
+            raise ValueError(f"{name} must be positive")
+    if not 2 <= params["roi_curve_points"] <= MAX_ROI_CURVE_POINTS:
+        raise ValueError(f"roi_curve_points must be between 2 and {MAX_ROI_CURVE_POINTS}")
+    if params["liquidity_model"] == "concentrated":
+        params["liquidity_ticks_path"] = resolve_ticks_path(params["liquidity_ticks_path"], ticks_dir)
+        try:
+            _load_ticks(params["liquidity_ticks_path"], os.path.getmtime(params["liquidity_ticks_path"]))
+        except OSError as e:
+            raise ValueError(f"Can't load the tick file: {e}")
+    return params
+
+def _liquidity(model, ticks_path, columns, rows):
+    # Liquidity model of the rows of one group. Constant-product pools of different sizes are evaluated together, as
+    # one pool with an array of liquidities.
+    if model == "constant_product":
+        return ConstantProductPool.from_tvl(columns["pool_tvl"][rows], columns["current_price_coll_token"][rows], columns["current_price_loan_token"][rows])
+    if model == "concentrated":
+        return _load_ticks(ticks_path, os.path.getmtime(ticks_path))
+    return None
+
+def _json_values(values):
+    # Plain Python values with nan and infinities as None, which serializes to null
+    values = values.tolist()
+    return [None if isinstance(value, float) and not math.isfinite(value) else value for value in values]
+
+def evaluate_requests(param_sets, surfaces=()):
+    # Evaluates a list of parsed parameter sets and returns one JSON-serializable result per set. Sets are grouped by
+    # liquidity model and each group is evaluated in one vectorized pass, RoI curves of all sets included. RoI curves
+    # of flat price impact sets covered by one of the precomputed surfaces (see one_click_looping.surface) are
+    # interpolated from it.
+    n = len(param_sets)
+    columns = {name: np.array([params[name] for params in param_sets], dtype=float) for name in NUMERIC_PARAMS}
+    columns["gas_usd_cost"] = columns["gas_used"] * columns["gas_price"] / 10**9 * columns["eth_price"]
+    scenario = {
+        "current_price_coll_token": columns["current_price_coll_token"],
+        "current_price_loan_token": columns["current_price_loan_token"],
+        "user_init_coll_amount": columns["user_init_coll_amount"],
+        "ltv": columns["ltv"],
+        "apr": columns["apr"],
+        "upfront_fee": columns["upfront_fee"],
+        "tenor": columns["tenor"],
+        "myso_fee": columns["myso_fee"],
+        "dex_slippage": columns["dex_slippage"],
+        "dex_swap_fee": columns["dex_swap_fee"],
+        "gas_usd_cost": columns["gas_usd_cost"],
+        "price_move": columns["expected_price_move_coll_token"],
+    }
+    results = {name: np.empty(n) for name in OPEN_POSITION_FIELDS + CLOSE_POSITION_FIELDS + ("break_even_price_change", "total_loss_price_change")}
+    results["rational_to_repay"] = np.empty(n, dtype=bool)
+    curve_points = columns["roi_curve_points"].astype(int)
+    curve_ends = np.cumsum(curve_points)
+    curve_price_changes = np.empty(curve_ends[-1] if n else 0)
+    curve_rois = np.empty_like(curve_price_changes)
+
+    groups = {}
+    for i, params in enumerate(param_sets):
+        key = (params["liquidity_model"], params["liquidity_ticks_path"] if params["liquidity_model"] == "concentrated" else "")
+        groups.setdefault(key, []).append(i)
+    for (model, ticks_path), rows in groups.items():
+        rows = np.array(rows)
+        group = evaluate_scenarios(**{name: values[rows] for name, values in scenario.items()}, liquidity=_liquidity(model, ticks_path, columns, rows))
+        for name in results:
+            if name in group:
+                results[name][rows] = group[name]
+        results["final_price_coll_token"][rows] = columns["current_price_coll_token"][rows] * (1 + columns["expected_price_move_coll_token"][rows])
+
+        # RoI curves of the group, one row per curve point
+        points = curve_points[rows]
+        point_rows = np.repeat(rows, points)
+        curve_index = np.concatenate([np.arange(curve_ends[i] - curve_points[i], curve_ends[i]) for i in rows])
+        step = np.arange(len(point_rows)) - np.repeat(np.cumsum(points) - points, points)
+        price_changes = columns["price_move_from"][point_rows] + step / (curve_points[point_rows] - 1) * (columns["price_move_to"][point_rows] - columns["price_move_from"][point_rows])
+        curve_price_changes[curve_index] = price_changes
+
+        # Curves of sets a precomputed surface covers are interpolated from it, the others evaluated exactly
+        exact = np.ones(len(rows), dtype=bool)
+        if model == "flat":
+            for surface in surfaces:
+                covered = exact & surface.covers(*(columns[name][rows] for name in ("ltv", "apr", "tenor", "upfront_fee", "myso_fee", "dex_slippage", "dex_swap_fee")),
+                                                 price_move_range=(np.minimum(columns["price_move_from"][rows], columns["price_move_to"][rows]) / 100, np.maximum(columns["price_move_from"][rows], columns["price_move_to"][rows]) / 100))
+                covered_points = np.repeat(covered, points)
+                curve_rois[curve_index[covered_points]] = surface.roi(*(columns[name][point_rows[covered_points]] for name in ("ltv", "apr", "tenor")), price_changes[covered_points] / 100) * 100
+                exact &= ~covered
+        exact_points = np.repeat(exact, points)
+        exact_rows = point_rows[exact_points]
+        _, _, _, final_amounts_after_close, _, _ = calculate_close_position(
+            np.repeat(group["final_pledge_and_reclaimable"][exact], points[exact]), np.repeat(group["owed_repayment"][exact], points[exact]),
+            columns["current_price_coll_token"][exact_rows] * (1 + price_changes[exact_points] / 100), columns["current_price_loan_token"][exact_rows],
+            columns["dex_slippage"][exact_rows], columns["dex_swap_fee"][exact_rows], columns["gas_usd_cost"][exact_rows],
+            liquidity=_liquidity(model, ticks_path, columns, exact_rows)
+        )
+        curve_rois[curve_index[exact_points]] = calc_roi(final_amounts_after_close, columns["current_price_loan_token"][exact_rows], columns["user_init_coll_amount"][exact_rows], columns["current_price_coll_token"][exact_rows]) * 100
+
+    values = {name: _json_values(column) for name, column in results.items()}
+    curve_price_changes, curve_rois = _json_values(curve_price_changes), _json_values(curve_rois)
+    gas_usd_costs = _json_values(columns["gas_usd_cost"])
+    responses = []
+    for i, params in enumerate(param_sets):
+        curve = slice(curve_ends[i] - curve_points[i], curve_ends[i])
+        responses.append({
+            "params": params,
+            "gas_usd_cost": gas_usd_costs[i],
+            "open_position": {name: values[name][i] for name in OPEN_POSITION_FIELDS},
+            "close_position": {name: values[name][i] for name in CLOSE_POSITION_FIELDS},
+            "break_even_price_change": values["break_even_price_change"][i],
+            "total_loss_price_change": values["total_loss_price_change"][i],
+            "roi_curve": {"price_change": curve_price_changes[curve], "roi": curve_rois[curve]},
+        })
+    return responses
+
+class RequestBatcher:
+    def __init__(self, window=DEFAULT_BATCH_WINDOW, max_batch_size=DEFAULT_MAX_BATCH_SIZE, surfaces=()):
+        # Parameter sets submitted within window seconds of the first pending one are evaluated together, or as soon
+        # as max_batch_size of them are pending
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.surfaces = surfaces
+        self._pending = []
+        self._flush_handle = None
+
+    async def evaluate(self, param_sets):
+        # Results for the parameter sets of one request, once its batch has been evaluated
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((param_sets, future))
+        if sum(len(sets) for sets, _ in self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        try:
+            results = evaluate_requests([params for param_sets, _ in batch for params in param_sets], self.surfaces)
+        except Exception:
+            # A failing parameter set mustn't fail the requests it was batched with, so each is evaluated on its own
+            for param_sets, future in batch:
+                try:
+                    request_results = evaluate_requests(param_sets, self.surfaces)
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(request_results)
+            return
+        start = 0
+        for param_sets, future in batch:
+            future.set_result(results[start:start + len(param_sets)])
+            start += len(param_sets)
+
+class EvaluateHandler(tornado.web.RequestHandler):
+    def initialize(self, batcher, ticks_dir):
+        self.batcher = batcher
+        self.ticks_dir = ticks_dir
+
+    async def get(self):
+        # A share link's query string, one parameter set
+        raw = {name: self.get_query_argument(name) for name in self.request.query_arguments}
+        await self._respond(raw, batched=False)
+
+    async def post(self):
+        # A JSON object or a list of them
+        try:
+            raw = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="The request body must be JSON")
+        await self._respond(raw, batched=isinstance(raw, list))
+
+    async def _respond(self, raw, batched):
+        try:
+            param_sets = [parse_params(params, self.ticks_dir) for params in (raw if batched else [raw])]
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, reason=str(e))
+        if sum(params["roi_curve_points"] for params in param_sets) > MAX_REQUEST_ROI_CURVE_POINTS:
+            raise tornado.web.HTTPError(400, reason=f"A request can have at most {MAX_REQUEST_ROI_CURVE_POINTS} RoI curve points in total")
+        results = await self.batcher.evaluate(param_sets) if param_sets else []
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(results if batched else results[0]))
+
+def make_app(batch_window=DEFAULT_BATCH_WINDOW, max_batch_size=DEFAULT_MAX_BATCH_SIZE, surfaces=(), ticks_dir=None):
+    return tornado.web.Application([
+        (r"/evaluate", EvaluateHandler, {"batcher": RequestBatcher(batch_window, max_batch_size, surfaces), "ticks_dir": ticks_dir}),
+    ])
+
+async def serve(host, port, batch_window, max_batch_size, surfaces=(), ticks_dir=None):
+    make_app(batch_window, max_batch_size, surfaces, ticks_dir).listen(port, address=host)
+    print(f"Serving the looping calculator API on http://{host}:{port}/evaluate")
+    await asyncio.Event().wait()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the one-click looping calculator as a local HTTP/JSON API.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8600, help="port to listen on (default: 8600)")
+    parser.add_argument("--batch-window", type=float, default=DEFAULT_BATCH_WINDOW * 1000, help=f"milliseconds to collect requests into one batch (default: {DEFAULT_BATCH_WINDOW * 1000:g})")
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE, help=f"parameter sets that trigger an immediate evaluation (default: {DEFAULT_MAX_BATCH_SIZE})")
+    parser.add_argument("--surface", action="append", default=[], metavar="PREFIX", help="precomputed RoI surface to interpolate RoI curves from (repeatable, see one_click_looping.surface)")
+    parser.add_argument("--ticks-dir", default=os.environ.get("LOOPING_TICKS_DIR"), help="directory of the tick files the concentrated liquidity model may load, tick file names are relative to it (default: LOOPING_TICKS_DIR, none: tick files are disabled)")
+    args = parser.parse_args(argv)
+    surfaces = [load_surface(prefix) for prefix in args.surface]
+    asyncio.run(serve(args.host, args.port, args.batch_window / 1000, args.max_batch_size, surfaces, args.ticks_dir))
+
+if __name__ == "__main__":
+    main()
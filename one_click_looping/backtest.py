@@ -0,0 +1,185 @@
+"""Historical backtests of a looping configuration over local price series.
+
+Usage:
+    python -m one_click_looping.backtest convert wmnt_usd.csv -o data/wmnt
+    python -m one_click_looping.backtest run --collateral data/wmnt --ltv 0.92 --apr 0.12 --tenor 7 -o rois.csv
+
+Price CSVs have the columns timestamp (unix seconds or an ISO date/time) and price (in USD), sorted by time. They are
+converted once into two .npy files per series (``<prefix>.times.npy`` and ``<prefix>.prices.npy``), which backtests
+memory-map, so series of any length are never loaded into RAM as a whole. A position is opened at every entry time
+(every --entry-step from the start of the data) and closed tenor days later, using the last price observed at or
+before each time. Without --loan, the loan token is priced at $1. RoIs are net of the gas for closing (--gas-usd-cost)
+and a default counts as -100%.
+"""
+import argparse
+import csv
+
+import numpy as np
+
+from one_click_looping.engine import DEFAULT_SCENARIO, calc_roi, calculate_close_position, calculate_open_position
+
+DEFAULT_CHUNK_SIZE = 100_000
+SECONDS_PER_DAY = 86_400
+
+# Inputs of the looping configuration that's backtested, everything but the prices
+CONFIG_FIELDS = ("user_init_coll_amount", "ltv", "apr", "upfront_fee", "tenor", "myso_fee", "dex_slippage", "dex_swap_fee", "gas_usd_cost")
+
+def _parse_timestamps(values):
+    try:
+        return np.array(values, dtype=float).astype(np.int64)
+    except ValueError:
+        return np.array(values, dtype="datetime64[s]").astype(np.int64)
+
+def _is_blank(fields):
+    # Rows without any non-blank field (e.g. empty lines) are skipped
+    return not any(field.strip() for field in fields if isinstance(field, str))
+
+def convert_price_csv(csv_path, output_prefix, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Streams the CSV into <output_prefix>.times.npy (int64 unix seconds) and <output_prefix>.prices.npy (float64),
+    # returns the number of observations
+    with open(csv_path, newline="") as f:
+        n = max(sum(1 for fields in csv.reader(f) if not _is_blank(fields)) - 1, 0)
+    times = np.lib.format.open_memmap(f"{output_prefix}.times.npy", mode="w+", dtype=np.int64, shape=(n,))
+    prices = np.lib.format.open_memmap(f"{output_prefix}.prices.npy", mode="w+", dtype=np.float64, shape=(n,))
+    with open(csv_path, newline="") as f:
+        reader = csv.DictReader(f)
+        missing = {"timestamp", "price"} - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"Missing price columns in {csv_path}: {', '.join(sorted(missing))}")
+        start = 0
+        rows = []
+        for row in reader:
+            if _is_blank(row.values()):
+                continue
+            rows.append(row)
+            if len(rows) == chunk_size:
+                start = _write_rows(times, prices, start, rows)
+                rows = []
+        if rows:
+            start = _write_rows(times, prices, start, rows)
+    if n and np.any(np.diff(times) < 0):
+        raise ValueError(f"Timestamps in {csv_path} must be sorted")
+    times.flush()
+    prices.flush()
+    return n
+
+def _write_rows(times, prices, start, rows):
+    stop = start + len(rows)
+    times[start:stop] = _parse_timestamps([row["timestamp"] for row in rows])
+    prices[start:stop] = [float(row["price"]) for row in rows]
+    return stop
+
+def load_price_series(prefix):
+    # Memory-mapped (times, prices) of a converted series
+    return np.load(f"{prefix}.times.npy", mmap_mode="r"), np.load(f"{prefix}.prices.npy", mmap_mode="r")
+
+def prices_at(series, at_times):
+    # Last observed price at or before each of at_times (sorted), nan before the first observation. Only the pages
+    # of the memory map that hold the looked up prices are read.
+    times, prices = series
+    idx = np.searchsorted(times, at_times, side="right") - 1
+    return np.where(idx >= 0, prices[np.maximum(idx, 0)], np.nan)
+
+def entry_times(collateral_series, loan_series, tenor, entry_step=SECONDS_PER_DAY):
+    # Every entry_step seconds from the first time both series have a price, as long as the exit is still covered.
+    # There are no entries if either series is empty.
+    if len(collateral_series[0]) == 0 or (loan_series is not None and len(loan_series[0]) == 0):
+        return np.empty(0, dtype=np.int64)
+    start, stop = collateral_series[0][0], collateral_series[0][-1]
+    if loan_series is not None:
+        start, stop = max(start, loan_series[0][0]), min(stop, loan_series[0][-1])
+    return np.arange(start, stop - tenor * SECONDS_PER_DAY + 1, entry_step, dtype=np.int64)
+
+def run_backtest(collateral_series, loan_series=None, entry_step=SECONDS_PER_DAY, chunk_size=DEFAULT_CHUNK_SIZE, **config):
+    # Opens the configured position (CONFIG_FIELDS, defaults from the Streamlit page) at every entry time and closes
+    # it tenor days later, with the open/close rules of the engine, vectorized over chunks of entry times. Returns a
+    # dict of columns: entry_time, exit_time, the four prices, rational_to_repay and roi. The RoI is net of gas; a
+    # position whose proceeds don't cover the gas for closing it is defaulted, and a default counts as -100%.
+    unknown = set(config) - set(CONFIG_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown backtest parameters: {', '.join(sorted(unknown))}")
+    c = {name: config.get(name, DEFAULT_SCENARIO[name]) for name in CONFIG_FIELDS}
+    entries = entry_times(collateral_series, loan_series, c["tenor"], entry_step)
+    exits = entries + int(round(c["tenor"] * SECONDS_PER_DAY))
+
+    columns = {name: np.empty(len(entries)) for name in ("entry_price_coll_token", "entry_price_loan_token", "exit_price_coll_token", "exit_price_loan_token", "roi")}
+    rational_to_repay = np.empty(len(entries), dtype=bool)
+    for start in range(0, len(entries), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        p0 = prices_at(collateral_series, entries[chunk])
+        p1 = prices_at(collateral_series, exits[chunk])
+        l0 = prices_at(loan_series, entries[chunk]) if loan_series is not None else np.ones_like(p0)
+        l1 = prices_at(loan_series, exits[chunk]) if loan_series is not None else np.ones_like(p1)
+        _, owed_repayment, _, _, _, _, _, final_pledge_and_reclaimable = calculate_open_position(
+            p0, l0, c["user_init_coll_amount"], c["ltv"], c["apr"], c["upfront_fee"], c["tenor"], c["myso_fee"], c["dex_slippage"], c["dex_swap_fee"]
+        )
+        _, _, _, final_amount_after_close, repay, _ = calculate_close_position(
+            final_pledge_and_reclaimable, owed_repayment, p1, l1, c["dex_slippage"], c["dex_swap_fee"], c["gas_usd_cost"]
+        )
+        columns["entry_price_coll_token"][chunk], columns["entry_price_loan_token"][chunk] = p0, l0
+        columns["exit_price_coll_token"][chunk], columns["exit_price_loan_token"][chunk] = p1, l1
+        proceeds = final_amount_after_close - c["gas_usd_cost"] / l1
+        repay = repay & (proceeds > 0)
+        columns["roi"][chunk] = calc_roi(np.where(repay, proceeds, 0.), l1, c["user_init_coll_amount"], p0)
+        rational_to_repay[chunk] = repay
+    return {"entry_time": entries, "exit_time": exits, **columns, "rational_to_repay": rational_to_repay}
+
+def summarize(results, n_worst=10):
+    # Hit rate (share of entries with a positive RoI), total loss rate, RoI statistics and the n_worst entries
+    rois = results["roi"]
+    worst = np.argsort(rois, kind="stable")[:n_worst]
+    return {
+        "entries": len(rois),
+        "hit_rate": np.mean(rois > 0) if len(rois) else np.nan,
+        "total_loss_rate": np.mean(~results["rational_to_repay"]) if len(rois) else np.nan,
+        "mean_roi": rois.mean() if len(rois) else np.nan,
+        "median_roi": np.median(rois) if len(rois) else np.nan,
+        "worst": [(int(results["entry_time"][i]), float(rois[i])) for i in worst],
+    }
+
+def write_results_csv(path, results):
+    names = list(results)
+    with open(path, "w", newline="") as f:
+        f.write(",".join(names) + "\n")
+        np.savetxt(f, np.column_stack([results[name] for name in names]), delimiter=",", fmt="%.10g")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest a one-click looping configuration over historical prices.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser("convert", help="convert a price CSV into memory-mappable .npy files")
+    convert_parser.add_argument("csv", help="CSV with timestamp and price columns")
+    convert_parser.add_argument("-o", "--output", required=True, help="output prefix, e.g. data/wmnt")
+
+    run_parser = subparsers.add_parser("run", help="backtest over converted price series")
+    run_parser.add_argument("--collateral", required=True, help="prefix of the collateral token's converted prices")
+    run_parser.add_argument("--loan", help="prefix of the loan token's converted prices (default: $1)")
+    for name in CONFIG_FIELDS:
+        run_parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=float, help=f"default: {DEFAULT_SCENARIO[name]:g}")
+    run_parser.add_argument("--entry-step", type=float, default=1., help="days between entries (default: 1)")
+    run_parser.add_argument("--worst", type=int, default=10, help="number of worst entries to print (default: 10)")
+    run_parser.add_argument("-o", "--output", help="write the RoI of every entry to this CSV file")
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        n = convert_price_csv(args.csv, args.output)
+        print(f"Converted {n:,} prices to {args.output}.times.npy and {args.output}.prices.npy")
+        return
+
+    config = {name: getattr(args, name) for name in CONFIG_FIELDS if getattr(args, name) is not None}
+    results = run_backtest(load_price_series(args.collateral), load_price_series(args.loan) if args.loan else None,
+                           entry_step=int(round(args.entry_step * SECONDS_PER_DAY)), **config)
+    summary = summarize(results, args.worst)
+    print(f"Entries:          {summary['entries']:,}")
+    print(f"Hit rate:         {summary['hit_rate']*100:.2f}%")
+    print(f"Total loss rate:  {summary['total_loss_rate']*100:.2f}%")
+    print(f"Mean RoI:         {summary['mean_roi']*100:+.2f}%")
+    print(f"Median RoI:       {summary['median_roi']*100:+.2f}%")
+    print("Worst entries:")
+    for entry_time, roi in summary["worst"]:
+        print(f"  {np.datetime64(entry_time, 's')}  {roi*100:+.2f}%")
+    if args.output:
+        write_results_csv(args.output, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Chart rendering helpers for the Streamlit page.
+
+Figures are created as plain ``matplotlib.figure.Figure`` objects, never through pyplot, so they aren't registered in
+pyplot's global figure manager: nothing outlives a render, across reruns or sessions. Charts are rendered to PNG
+bytes, which the page caches keyed on the plotted data and labels. The RoI curve can alternatively be drawn in the
+browser as a Vega-Lite chart. matplotlib is only imported when a figure is created.
+"""
+import io
+import json
+
+import numpy as np
+
+# Resolution of rendered charts; the page scales the images to the column width
+PNG_DPI = 144
+
+def new_figure(figsize):
+    from matplotlib.figure import Figure
+
+    return Figure(figsize=figsize)
+
+def figure_to_png(fig, dpi=PNG_DPI):
+    # Renders the figure to PNG bytes and clears it, so its artists are released right away
+    buf = io.BytesIO()
+    try:
+        fig.savefig(buf, format="png", dpi=dpi, bbox_inches="tight")
+    finally:
+        fig.clear()
+    return buf.getvalue()
+
+def _signed_percent(value):
+    return f"+{value:.2f}%" if value > 0 else f"{value:.2f}%"
+
+def roi_curve_vega_lite(rel_price_changes, RoIs, break_even_price_change, total_loss_price_change, roi_unchanged, price_change_range, collateral_token_name, loan_token_name):
+    # Data columns (in percent) and Vega-Lite spec of the RoI curve, with the same layers as the matplotlib chart:
+    # looping and buy & hold RoI, profit/loss areas and the break-even, total loss and flat price markers. Thresholds
+    # are in percent, like on the page.
+    price_changes = rel_price_changes * 100
+    rois = RoIs * 100
+    data = {
+        "price_change": price_changes,
+        "looping": rois,
+        "buy_and_hold": price_changes,
+        "profit": np.maximum(rois, 0),
+        "loss": np.minimum(rois, 0),
+    }
+    series_names = {"looping": f"RoI Looping {collateral_token_name}", "buy_and_hold": f"RoI Buy&Hold {collateral_token_name}"}
+    x = {"field": "price_change", "type": "quantitative", "title": f"Price Change of {collateral_token_name}/{loan_token_name} (%)", "scale": {"domain": list(price_change_range)}}
+
+    layers = [
+        {"mark": {"type": "area", "color": "lightgreen", "opacity": 0.8}, "encoding": {"x": x, "y": {"field": "profit", "type": "quantitative"}, "y2": {"datum": 0}}},
+        {"mark": {"type": "area", "color": "lightcoral", "opacity": 0.8}, "encoding": {"x": x, "y": {"field": "loss", "type": "quantitative"}, "y2": {"datum": 0}}},
+        {
+            "transform": [
+                {"fold": list(series_names), "as": ["series", "roi"]},
+                {"calculate": f"{json.dumps(series_names)}[datum.series]", "as": "series"},
+            ],
+            "mark": {"type": "line"},
+            "encoding": {
+                "x": x,
+                "y": {"field": "roi", "type": "quantitative", "title": "RoI (%)"},
+                "color": {"field": "series", "type": "nominal", "title": None, "legend": {"orient": "top-left"},
+                          "scale": {"domain": list(series_names.values()), "range": ["deepskyblue", "gray"]}},
+                "tooltip": [
+                    {"field": "price_change", "type": "quantitative", "title": "Price Change (%)", "format": "+.2f"},
+                    {"field": "series", "type": "nominal", "title": "Series"},
+                    {"field": "roi", "type": "quantitative", "title": "RoI (%)", "format": "+.2f"},
+                ],
+            },
+        },
+    ]
+
+    markers = []
+    if price_change_range[0] < break_even_price_change < price_change_range[1]:
+        markers.append({"price_change": break_even_price_change, "roi": 0., "label": f"If price {_signed_percent(break_even_price_change)}: Break-even", "color": "green", "rule": "vertical"})
+    if price_change_range[0] < total_loss_price_change < price_change_range[1]:
+        markers.append({"price_change": total_loss_price_change, "roi": -100., "label": f"If price {_signed_percent(total_loss_price_change)}: Full Loss", "color": "red", "rule": "vertical"})
+    if price_change_range[0] < 0 < price_change_range[1]:
+        markers.append({"price_change": 0., "roi": roi_unchanged, "label": f"If price flat: {_signed_percent(roi_unchanged)} RoI", "color": "darkblue", "rule": "horizontal"})
+    if markers:
+        marker_encoding = {
+            "x": {"field": "price_change", "type": "quantitative"},
+            "y": {"field": "roi", "type": "quantitative"},
+            "color": {"field": "color", "type": "nominal", "scale": None},
+            "tooltip": [{"field": "label", "type": "nominal", "title": "Marker"}],
+        }
+        # Thresholds are marked with a vertical line, the RoI at a flat price with a horizontal one
+        layers.append({"data": {"values": markers}, "transform": [{"filter": "datum.rule == 'vertical'"}],
+                       "mark": {"type": "rule", "strokeDash": [4, 4]}, "encoding": {"x": marker_encoding["x"], "color": marker_encoding["color"]}})
+        layers.append({"data": {"values": markers}, "transform": [{"filter": "datum.rule == 'horizontal'"}],
+                       "mark": {"type": "rule", "strokeDash": [4, 4]}, "encoding": {"y": marker_encoding["y"], "color": marker_encoding["color"]}})
+        layers.append({"data": {"values": markers}, "mark": {"type": "point", "filled": True, "size": 60}, "encoding": marker_encoding})
+
+    spec = {
+        "title": f"Your RoI for looping on {collateral_token_name}/{loan_token_name}",
+        "height": 400,
+        "layer": layers,
+    }
+    return data, spec
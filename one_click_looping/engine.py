@@ -0,0 +1,213 @@
+"""Position math for one-click looping, usable without Streamlit or any plotting dependency.
+
+All functions work element-wise, so every input can be a scalar or a numpy array (one entry per scenario). Swaps are
+charged a flat dex_slippage unless a liquidity model (see one_click_looping.liquidity) is passed as ``liquidity``.
+"""
+import numpy as np
+
+from one_click_looping.liquidity import price_change_for_roi, solve_flashloan_amount
+
+def find_flashloan_amount(user_init_coll_amount, cross_price, ltv, dex_slippage, dex_swap_fee, upfront_fee):
+    # The flashloan has to equal what can be borrowed against the combined pledge, i.e.
+    #   F = (U + F / cross_price * (1 - dex_slippage - dex_swap_fee)) * (1 - upfront_fee) * cross_price * ltv
+    # which is linear in F and can be solved exactly (element-wise for array inputs)
+    dex_factor = 1 - dex_slippage - dex_swap_fee
+    borrowable_share = (1 - upfront_fee) * ltv
+    return np.divide(user_init_coll_amount * cross_price * borrowable_share, 1 - dex_factor * borrowable_share)
+
+def calculate_open_position(current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, liquidity=None):
+    # All inputs can be scalars or numpy arrays of matching shape (one entry per scenario)
+    cross_price = current_price_coll_token / current_price_loan_token
+    
+    # Calculate flashloan amount
+    if liquidity is None:
+        flashloan_amount_act = find_flashloan_amount(user_init_coll_amount, cross_price, ltv, dex_slippage, dex_swap_fee, upfront_fee)
+    else:
+        flashloan_amount_act = solve_flashloan_amount(liquidity, user_init_coll_amount, cross_price, ltv, dex_swap_fee, upfront_fee)
+
+    # Calculate owed repayment amount
+    owed_repayment = flashloan_amount_act * (1 + apr * tenor/365)
+
+    # Amount that's sold on the DEX 
+    sold_on_dex = flashloan_amount_act
+
+    # Amount received from the DEX (after considering slippage and swap fee)
+    if liquidity is None:
+        received_from_dex = sold_on_dex / cross_price * (1 - dex_slippage - dex_swap_fee)
+    else:
+        received_from_dex, _ = liquidity.collateral_out(sold_on_dex * (1 - dex_swap_fee), cross_price)
+
+    combined_pledge = user_init_coll_amount + received_from_dex
+
+    # Upfront fee
+    upfront_fee_abs = combined_pledge * upfront_fee
+
+    # Myso protocol fee
+    myso_fee_abs = combined_pledge * myso_fee
+
+    # total pledge and reclaimable
+    final_pledge_and_reclaimable = combined_pledge - upfront_fee_abs - myso_fee_abs
+
+    # Return results
+    return flashloan_amount_act, owed_repayment, sold_on_dex, received_from_dex, combined_pledge, upfront_fee_abs, myso_fee_abs, final_pledge_and_reclaimable
+
+def calculate_close_position(final_pledge_and_reclaimable, owed_repayment, final_price_coll_token, final_price_loan_token, dex_slippage, dex_swap_fee, gas_usd_cost, always_repay=False, liquidity=None):
+    # All inputs can be scalars or numpy arrays of matching shape, e.g. an array of final prices
+    cross_price = final_price_coll_token / final_price_loan_token
+    
+    # Amount flashborrowed
+    flashloan_amount = final_pledge_and_reclaimable
+
+    # Amount that's sold on the DEX 
+    sold_on_dex = flashloan_amount
+
+    # Amount received from the DEX (after considering slippage and swap fee)
+    if liquidity is None:
+        received_from_dex = sold_on_dex * cross_price * (1 - dex_slippage - dex_swap_fee)
+    else:
+        received_from_dex = liquidity.loan_out(sold_on_dex * (1 - dex_swap_fee), cross_price)
+
+    # Amount left over after repay
+    final_amount_after_close = received_from_dex - owed_repayment
+    final_amount_after_close_net_of_gas_fees = final_amount_after_close - gas_usd_cost
+
+    # Repay only where the proceeds cover the debt, otherwise default (element-wise for array inputs)
+    rational_to_repay = np.logical_or(always_repay, final_amount_after_close > 0)
+
+    flashloan_amount = np.where(rational_to_repay, flashloan_amount, 0)[()]
+    sold_on_dex = np.where(rational_to_repay, sold_on_dex, 0)[()]
+    received_from_dex = np.where(rational_to_repay, received_from_dex, 0)[()]
+    final_amount_after_close = np.where(rational_to_repay, final_amount_after_close, 0)[()]
+    rational_to_repay = rational_to_repay[()]
+    
+    # Return results
+    return flashloan_amount, sold_on_dex, received_from_dex, final_amount_after_close, rational_to_repay, final_amount_after_close_net_of_gas_fees
+
+def calc_roi(final_loan_token_amount_after_close, final_loan_token_price, user_init_coll_amount, init_coll_token_price):
+    # Works element-wise for numpy array inputs
+    return final_loan_token_amount_after_close * final_loan_token_price / (user_init_coll_amount * init_coll_token_price) - 1
+
+def calc_price_change_for_roi(target_roi, current_price_coll_token, current_price_loan_token, user_init_coll_amount, final_pledge_and_reclaimable, owed_repayment, dex_slippage, dex_swap_fee, gas_usd_cost, net_of_gas=False, liquidity=None):
+    # Relative collateral price change at which repaying yields target_roi. Closing is linear in the final price, i.e.
+    #   final_pledge_and_reclaimable * p1 / p2 * (1 - dex_slippage - dex_swap_fee) - owed_repayment = (1 + target_roi) * U * p0 / p2
+    # so it can be solved for p1 exactly (element-wise for array inputs); with a liquidity model it's solved numerically.
+    # Levels that no positive price can reach are returned as nan.
+    if liquidity is not None:
+        return price_change_for_roi(liquidity, target_roi, current_price_coll_token, current_price_loan_token, user_init_coll_amount, final_pledge_and_reclaimable, owed_repayment, dex_swap_fee, gas_usd_cost, net_of_gas)
+    dex_factor = 1 - dex_slippage - dex_swap_fee
+    required_usd = (1 + target_roi) * user_init_coll_amount * current_price_coll_token + (gas_usd_cost if net_of_gas else 0)
+    proceeds_per_coll_usd = final_pledge_and_reclaimable * dex_factor * current_price_coll_token
+    with np.errstate(divide="ignore", invalid="ignore"):
+        price_change = (required_usd + owed_repayment * current_price_loan_token) / proceeds_per_coll_usd - 1
+    reachable = (proceeds_per_coll_usd > 0) & (price_change >= -1)
+    return np.where(reachable, price_change, np.nan)[()]
+
+def calculate_thresholds(current_price_coll_token, current_price_loan_token, user_init_coll_amount, final_pledge_and_reclaimable, owed_repayment, dex_slippage, dex_swap_fee, gas_usd_cost, net_of_gas=False, liquidity=None):
+    # Relative price changes for break-even (0% RoI) and total loss (-100% RoI), nan where unreachable
+    args = (current_price_coll_token, current_price_loan_token, user_init_coll_amount, final_pledge_and_reclaimable, owed_repayment, dex_slippage, dex_swap_fee, gas_usd_cost, net_of_gas, liquidity)
+    break_even_price_change = calc_price_change_for_roi(0., *args)
+    total_loss_price_change = calc_price_change_for_roi(-1., *args)
+    return break_even_price_change, total_loss_price_change
+
+def calculate_sensitivities(current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost, price_move):
+    # Exact partial derivatives of the RoI net of gas at a relative collateral price move x, for the flat price impact.
+    # With k = 1 - dex_slippage - dex_swap_fee, b = (1 - upfront_fee) * ltv and D = 1 - k * b, opening pledges
+    # U * (1 - upfront_fee - myso_fee) / D and owes U * cross_price * b * (1 + apr * tenor / 365) / D, so repaying yields
+    #   RoI = N / D - 1 - gas_usd_cost / (U * p0),  N = (1 - upfront_fee - myso_fee) * k * (1 + x) - b * (1 + apr * tenor / 365)
+    # which is linear in x (gamma is 0 away from the repay/default kink at N = 0). In the default region the RoI is
+    # -1 minus gas, so only the gas sensitivity is non-zero there. "delta" is the derivative with respect to x.
+    k = 1 - dex_slippage - dex_swap_fee
+    b = (1 - upfront_fee) * ltv
+    D = 1 - k * b
+    kept_share = 1 - upfront_fee - myso_fee
+    accrual = 1 + apr * tenor / 365
+    N = kept_share * k * (1 + price_move) - b * accrual
+    repay = N > 0
+    d_roi_d_b = (k * N - accrual * D) / D**2
+    d_roi_d_k = (kept_share * (1 + price_move) * D + b * N) / D**2
+
+    sensitivities = {
+        "roi_net_of_gas": np.where(repay, N / D - 1, -1) - gas_usd_cost / (user_init_coll_amount * current_price_coll_token),
+        "delta": kept_share * k / D,
+        "gamma": np.zeros_like(D),
+        "apr": -b * tenor / 365 / D,
+        "tenor": -b * apr / 365 / D,
+        "ltv": (1 - upfront_fee) * d_roi_d_b,
+        "upfront_fee": ((ltv * accrual - k * (1 + price_move)) * D - N * k * ltv) / D**2,
+        "myso_fee": -k * (1 + price_move) / D,
+        "dex_slippage": -d_roi_d_k,
+        "dex_swap_fee": -d_roi_d_k,
+    }
+    sensitivities = {name: np.where(repay, values, 0.) if name != "roi_net_of_gas" else values for name, values in sensitivities.items()}
+    sensitivities["gas_usd_cost"] = -1 / (user_init_coll_amount * current_price_coll_token)
+    shape = np.broadcast(*sensitivities.values()).shape
+    return {name: np.broadcast_to(values, shape)[()] for name, values in sensitivities.items()}
+
+# Inputs of a single looping scenario, in the order evaluate_scenarios expects them
+SCENARIO_FIELDS = (
+    "current_price_coll_token",
+    "current_price_loan_token",
+    "user_init_coll_amount",
+    "ltv",
+    "apr",
+    "upfront_fee",
+    "tenor",
+    "myso_fee",
+    "dex_slippage",
+    "dex_swap_fee",
+    "gas_usd_cost",
+    "price_move",
+)
+
+# Same defaults as the Streamlit page (gas cost = 1.2M gas at 20 GWei and a gas token price of $0.3)
+DEFAULT_SCENARIO = {
+    "current_price_coll_token": 0.38,
+    "current_price_loan_token": 1.,
+    "user_init_coll_amount": 100.,
+    "ltv": 0.92,
+    "apr": 0.12,
+    "upfront_fee": 0.,
+    "tenor": 7,
+    "myso_fee": 0.0008,
+    "dex_slippage": 0.0008,
+    "dex_swap_fee": 0.0005,
+    "gas_usd_cost": 1200000 * 20 / 10**9 * 0.3,
+    "price_move": 0.05,
+}
+
+def evaluate_scenarios(current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost, price_move, liquidity=None):
+    # Open/close breakdown, RoI and thresholds for every scenario, returned as a dict of equally shaped columns.
+    # price_move is the relative change of the collateral token price over the loan lifetime.
+    flashloan_amount, owed_repayment, sold_on_dex, received_from_dex, combined_pledge, upfront_fee_abs, myso_fee_abs, final_pledge_and_reclaimable = calculate_open_position(
+        current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, liquidity
+    )
+    final_price_coll_token = current_price_coll_token * (1 + price_move)
+    _, _, received_from_dex_on_close, final_amount_after_close, rational_to_repay, _ = calculate_close_position(
+        final_pledge_and_reclaimable, owed_repayment, final_price_coll_token, current_price_loan_token, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity=liquidity
+    )
+    roi = calc_roi(final_amount_after_close, current_price_loan_token, user_init_coll_amount, current_price_coll_token)
+    roi_net_of_gas = roi - gas_usd_cost / (user_init_coll_amount * current_price_coll_token)
+    break_even_price_change, total_loss_price_change = calculate_thresholds(
+        current_price_coll_token, current_price_loan_token, user_init_coll_amount, final_pledge_and_reclaimable, owed_repayment, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity=liquidity
+    )
+
+    results = {
+        "flashloan_amount": flashloan_amount,
+        "owed_repayment": owed_repayment,
+        "sold_on_dex": sold_on_dex,
+        "received_from_dex": received_from_dex,
+        "combined_pledge": combined_pledge,
+        "upfront_fee_abs": upfront_fee_abs,
+        "myso_fee_abs": myso_fee_abs,
+        "final_pledge_and_reclaimable": final_pledge_and_reclaimable,
+        "leverage": final_pledge_and_reclaimable / user_init_coll_amount,
+        "received_from_dex_on_close": received_from_dex_on_close,
+        "final_amount_after_close": final_amount_after_close,
+        "rational_to_repay": rational_to_repay,
+        "roi": roi,
+        "roi_net_of_gas": roi_net_of_gas,
+        "break_even_price_change": break_even_price_change,
+        "total_loss_price_change": total_loss_price_change,
+    }
+    shape = np.broadcast(*results.values()).shape
+    return {name: np.broadcast_to(values, shape) for name, values in results.items()}
@@ -0,0 +1,97 @@
+"""Inverse solver: the value of one input that yields a target RoI at a given price move.
+
+For the flat price impact, repaying at a relative collateral price move x yields
+    RoI = N / D - 1,  N = (1 - upfront_fee - myso_fee) * k * (1 + x) - b * (1 + apr * tenor / 365),  D = 1 - k * b
+with k = 1 - dex_slippage - dex_swap_fee and b = (1 - upfront_fee) * ltv (see calculate_sensitivities), which can be
+solved for apr, tenor, upfront_fee or ltv exactly. Leverage doesn't depend on the price move, so a leverage target
+fixes the LTV directly. All solvers work element-wise on arrays of targets and inputs and return nan where no valid
+input value reaches the target (e.g. an APR below zero or an LTV above 100%), instead of raising. Targets are the RoI
+of the page, optionally net of gas; a target of -100% or less is never solved for, as every default yields it.
+"""
+import numpy as np
+
+from one_click_looping.engine import DEFAULT_SCENARIO, SCENARIO_FIELDS
+
+# Inputs that can be solved for; "leverage" solves for the LTV that gives a leverage target
+SOLVABLE_INPUTS = ("apr", "tenor", "upfront_fee", "ltv", "leverage")
+
+def _required_growth(target_roi, current_price_coll_token, user_init_coll_amount, gas_usd_cost, net_of_gas):
+    # N / D needed for the target, i.e. 1 + the RoI before gas
+    return 1 + target_roi + (gas_usd_cost / (user_init_coll_amount * current_price_coll_token) if net_of_gas else 0)
+
+def _valid(values, feasible):
+    return np.where(feasible, values, np.nan)[()]
+
+def apr_for_roi(target_roi, price_move, current_price_coll_token, user_init_coll_amount, ltv, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost, net_of_gas=False):
+    # Highest APR that still yields target_roi (the RoI falls with the APR)
+    y = _required_growth(target_roi, current_price_coll_token, user_init_coll_amount, gas_usd_cost, net_of_gas)
+    k = 1 - dex_slippage - dex_swap_fee
+    b = (1 - upfront_fee) * ltv
+    with np.errstate(divide="ignore", invalid="ignore"):
+        accrual = ((1 - upfront_fee - myso_fee) * k * (1 + price_move) - y * (1 - k * b)) / b
+        apr = (accrual - 1) * 365 / tenor
+    return _valid(apr, (y > 0) & (apr >= 0))
+
+def tenor_for_roi(target_roi, price_move, current_price_coll_token, user_init_coll_amount, ltv, apr, upfront_fee, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost, net_of_gas=False):
+    # Longest tenor in days that still yields target_roi at this price move (the RoI falls with the tenor); infinite
+    # at a zero APR if the target is reachable at all
+    y = _required_growth(target_roi, current_price_coll_token, user_init_coll_amount, gas_usd_cost, net_of_gas)
+    k = 1 - dex_slippage - dex_swap_fee
+    b = (1 - upfront_fee) * ltv
+    with np.errstate(divide="ignore", invalid="ignore"):
+        accrual = ((1 - upfront_fee - myso_fee) * k * (1 + price_move) - y * (1 - k * b)) / b
+        tenor = np.where(apr > 0, (accrual - 1) * 365 / apr, np.inf)
+    return _valid(tenor, (y > 0) & (accrual >= 1))
+
+def upfront_fee_for_roi(target_roi, price_move, current_price_coll_token, user_init_coll_amount, ltv, apr, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost, net_of_gas=False):
+    # Upfront fee that yields target_roi. With v = 1 - upfront_fee the target condition N = y * D is linear in v:
+    #   v * (k * (1 + x) - ltv * accrual + y * k * ltv) = y + myso_fee * k * (1 + x)
+    # The RoI falls with the fee wherever k * (1 + x) * (1 - k * ltv * myso_fee) > ltv * accrual, which makes the
+    # solution the highest acceptable fee.
+    y = _required_growth(target_roi, current_price_coll_token, user_init_coll_amount, gas_usd_cost, net_of_gas)
+    k = 1 - dex_slippage - dex_swap_fee
+    accrual = 1 + apr * tenor / 365
+    with np.errstate(divide="ignore", invalid="ignore"):
+        v = (y + myso_fee * k * (1 + price_move)) / (k * (1 + price_move) - ltv * accrual + y * k * ltv)
+    upfront_fee = 1 - v
+    return _valid(upfront_fee, (y > 0) & (v > 0) & (upfront_fee >= 0) & (upfront_fee + myso_fee < 1) & (k * v * ltv < 1))
+
+def ltv_for_roi(target_roi, price_move, current_price_coll_token, user_init_coll_amount, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost, net_of_gas=False):
+    # LTV that yields target_roi. The target condition is linear in b = (1 - upfront_fee) * ltv, and the RoI is
+    # monotone in the LTV, so the solution is unique:
+    #   b * (y * k - accrual) = y - (1 - upfront_fee - myso_fee) * k * (1 + x)
+    y = _required_growth(target_roi, current_price_coll_token, user_init_coll_amount, gas_usd_cost, net_of_gas)
+    k = 1 - dex_slippage - dex_swap_fee
+    accrual = 1 + apr * tenor / 365
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b = (y - (1 - upfront_fee - myso_fee) * k * (1 + price_move)) / (y * k - accrual)
+        ltv = b / (1 - upfront_fee)
+    return _valid(ltv, (y > 0) & (ltv >= 0) & (ltv <= 1) & (k * b < 1))
+
+def ltv_for_leverage(leverage, upfront_fee, myso_fee, dex_slippage, dex_swap_fee):
+    # LTV at which the final pledge is leverage times the initial collateral: leverage = (1 - upfront_fee - myso_fee) / D
+    k = 1 - dex_slippage - dex_swap_fee
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ltv = (1 - (1 - upfront_fee - myso_fee) / leverage) / (k * (1 - upfront_fee))
+    return _valid(ltv, (ltv >= 0) & (ltv <= 1))
+
+def solve_input(name, target, net_of_gas=False, **scenario):
+    # Solves for one of SOLVABLE_INPUTS given a target (an RoI, or a leverage for "leverage") and the other inputs of
+    # the scenario (SCENARIO_FIELDS, defaults from the Streamlit page; price_move is the move the target applies to)
+    if name not in SOLVABLE_INPUTS:
+        raise ValueError(f"Can only solve for {', '.join(SOLVABLE_INPUTS)}")
+    unknown = set(scenario) - set(SCENARIO_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown scenario inputs: {', '.join(sorted(unknown))}")
+    s = {**DEFAULT_SCENARIO, **scenario}
+    if name == "leverage":
+        return ltv_for_leverage(target, s["upfront_fee"], s["myso_fee"], s["dex_slippage"], s["dex_swap_fee"])
+    common = (target, s["price_move"], s["current_price_coll_token"], s["user_init_coll_amount"])
+    costs = (s["myso_fee"], s["dex_slippage"], s["dex_swap_fee"], s["gas_usd_cost"])
+    if name == "apr":
+        return apr_for_roi(*common, s["ltv"], s["upfront_fee"], s["tenor"], *costs, net_of_gas=net_of_gas)
+    if name == "tenor":
+        return tenor_for_roi(*common, s["ltv"], s["apr"], s["upfront_fee"], *costs, net_of_gas=net_of_gas)
+    if name == "upfront_fee":
+        return upfront_fee_for_roi(*common, s["ltv"], s["apr"], s["tenor"], *costs, net_of_gas=net_of_gas)
+    return ltv_for_roi(*common, s["apr"], s["upfront_fee"], s["tenor"], *costs, net_of_gas=net_of_gas)
@@ -0,0 +1,52 @@
+"""RoI over a grid of LTVs and price moves, and the search for the LTV that maximizes it."""
+import numpy as np
+
+from one_click_looping.engine import calc_roi, calculate_close_position, calculate_open_position, calculate_thresholds
+
+def roi_surface(ltvs, price_moves, current_price_coll_token, current_price_loan_token, user_init_coll_amount, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity=None):
+    # RoI for every pair of LTV and relative price move, shape (len(ltvs), len(price_moves)), in one batched pass.
+    # Also returns the total loss price change per LTV, which doesn't depend on the price move.
+    ltvs = np.asarray(ltvs, dtype=float)[:, None]
+    price_moves = np.asarray(price_moves, dtype=float)[None, :]
+    _, owed_repayment, _, _, _, _, _, final_pledge_and_reclaimable = calculate_open_position(
+        current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltvs, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, liquidity
+    )
+    _, _, _, final_amount_after_close, _, _ = calculate_close_position(
+        final_pledge_and_reclaimable, owed_repayment, current_price_coll_token * (1 + price_moves), current_price_loan_token, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity=liquidity
+    )
+    rois = calc_roi(final_amount_after_close, current_price_loan_token, user_init_coll_amount, current_price_coll_token)
+    _, total_loss_price_change = calculate_thresholds(
+        current_price_coll_token, current_price_loan_token, user_init_coll_amount, final_pledge_and_reclaimable[:, 0], owed_repayment[:, 0], dex_slippage, dex_swap_fee, gas_usd_cost, liquidity=liquidity
+    )
+    return rois, total_loss_price_change
+
+def find_optimal_ltv(ltvs, price_moves, current_price_coll_token, current_price_loan_token, user_init_coll_amount, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost,
+                     weights=None, target_price_move=None, max_total_loss_price_change=None, liquidity=None):
+    # Searches the LTV grid for the highest objective, which is either the RoI at target_price_move or the expected RoI
+    # over price_moves (weighted by weights, e.g. from montecarlo.price_move_probabilities; uniform if not given).
+    # LTVs whose total loss price change is above max_total_loss_price_change (e.g. -0.2: a total loss must require a
+    # price drop of more than 20%) are excluded. Returns a dict with the optimum (ltv is nan if no LTV is feasible)
+    # and the objective and feasibility of every LTV.
+    ltvs = np.asarray(ltvs, dtype=float)
+    if target_price_move is not None:
+        price_moves, weights = np.array([target_price_move], dtype=float), None
+    rois, total_loss_price_change = roi_surface(
+        ltvs, price_moves, current_price_coll_token, current_price_loan_token, user_init_coll_amount, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity
+    )
+    objective = rois.mean(axis=1) if weights is None else rois @ (np.asarray(weights, dtype=float) / np.sum(weights))
+
+    feasible = np.ones(len(ltvs), dtype=bool)
+    if max_total_loss_price_change is not None:
+        feasible = np.nan_to_num(total_loss_price_change, nan=np.inf) <= max_total_loss_price_change
+
+    if not feasible.any():
+        best = None
+    else:
+        best = int(np.argmax(np.where(feasible, objective, -np.inf)))
+    return {
+        "ltv": ltvs[best] if best is not None else np.nan,
+        "objective": objective[best] if best is not None else np.nan,
+        "total_loss_price_change": total_loss_price_change[best] if best is not None else np.nan,
+        "objectives": objective,
+        "feasible": feasible,
+    }
@@ -0,0 +1,196 @@
+"""Size-dependent DEX price impact from the liquidity of the pool a swap is routed through.
+
+By default the calculator charges a flat ``dex_slippage`` on every swap, no matter how large it is. A liquidity model
+instead derives the execution price from the pool's liquidity, so price impact grows with the trade size:
+
+- ConstantProductPool: a Uniswap v2 style pool with reserves x * y = L**2
+- ConcentratedLiquidity: liquidity that varies over price ranges, e.g. the ticks of a Uniswap v3 pool
+
+Prices are pool prices in loan tokens per collateral token. The pool is assumed to trade at the market cross price
+when a swap happens, at opening as well as at closing. Swap fees are charged on the input amount by the callers; the
+model's price impact replaces dex_slippage. All methods work element-wise on numpy arrays.
+"""
+import csv
+import os
+
+import numpy as np
+
+# Tick prices are powers of this base, as in Uniswap v3
+TICK_BASE = 1.0001
+
+# Floor of the sqrt price of a constant-product pool, so a cross price of 0 gives huge but finite reserves
+_MIN_SQRT_PRICE = 1e-150
+
+class ConstantProductPool:
+    def __init__(self, liquidity):
+        # liquidity is sqrt(collateral reserve * loan reserve) and stays constant when the price moves
+        self.liquidity = liquidity
+
+    def __reduce__(self):
+        # Pickled and hashed (e.g. by Streamlit's cache) as its constructor arguments
+        return ConstantProductPool, (self.liquidity,)
+
+    @classmethod
+    def from_reserves(cls, coll_reserve, loan_reserve):
+        return cls(np.sqrt(coll_reserve * loan_reserve))
+
+    @classmethod
+    def from_tvl(cls, tvl_usd, current_price_coll_token, current_price_loan_token):
+        # Pool holding tvl_usd, split evenly between both tokens at the current prices
+        return cls(tvl_usd / (2 * np.sqrt(current_price_coll_token * current_price_loan_token)))
+
+    def _reserves(self, cross_price):
+        # Prices at or below 0 take the limit of a worthless collateral token: all liquidity is in collateral
+        sqrt_price = np.maximum(np.sqrt(np.maximum(cross_price, 0.)), _MIN_SQRT_PRICE)
+        return self.liquidity / sqrt_price, self.liquidity * sqrt_price
+
+    def collateral_out(self, loan_in, cross_price):
+        # Collateral received for loan_in loan tokens (after fees) and its derivative with respect to loan_in
+        coll_reserve, loan_reserve = self._reserves(cross_price)
+        new_loan_reserve = loan_reserve + loan_in
+        return coll_reserve * loan_in / new_loan_reserve, coll_reserve * loan_reserve / new_loan_reserve**2
+
+    def loan_out(self, coll_in, cross_price):
+        # Loan tokens received for coll_in collateral (after fees)
+        coll_reserve, loan_reserve = self._reserves(cross_price)
+        return loan_reserve * coll_in / (coll_reserve + coll_in)
+
+    def price_for_loan_out(self, coll_in, loan_out):
+        # Pool price at which selling coll_in collateral yields loan_out loan tokens. With s = sqrt(price),
+        #   L * s * coll_in / (L / s + coll_in) = loan_out
+        # is a quadratic in s with exactly one positive root (nan if there's no collateral to sell).
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sqrt_price = (loan_out * coll_in + np.sqrt((loan_out * coll_in)**2 + 4 * self.liquidity**2 * coll_in * loan_out)) / (2 * self.liquidity * coll_in)
+        return np.where(coll_in > 0, sqrt_price**2, np.nan)[()]
+
+class ConcentratedLiquidity:
+    def __init__(self, price_bounds, liquidities):
+        # liquidities[i] is active between price_bounds[i] and price_bounds[i + 1]. Swaps walk through the ranges
+        # using the cumulative token amounts along the sqrt price s, Y(s) = integral of L ds for the loan token and
+        # X(s) = integral of L / s**2 ds for the collateral, so a swap of any size costs two binary searches.
+        # Prices outside of the bounds are clamped to them; trades beyond the last range only get what's left.
+        price_bounds = np.asarray(price_bounds, dtype=float)
+        liquidities = np.asarray(liquidities, dtype=float)
+        if price_bounds.ndim != 1 or len(price_bounds) < 2 or len(liquidities) != len(price_bounds) - 1:
+            raise ValueError("Concentrated liquidity needs one liquidity value per range between consecutive price bounds")
+        if np.any(price_bounds <= 0) or np.any(np.diff(price_bounds) <= 0):
+            raise ValueError("Price bounds of concentrated liquidity must be positive and increasing")
+        if np.any(liquidities < 0):
+            raise ValueError("Concentrated liquidity can't be negative")
+        self.price_bounds = price_bounds
+        self.sqrt_price_bounds = np.sqrt(price_bounds)
+        self.liquidities = liquidities
+        s = self.sqrt_price_bounds
+        self._loan_cum = np.concatenate([[0.], np.cumsum(liquidities * np.diff(s))])
+        self._coll_cum = np.concatenate([[0.], np.cumsum(liquidities * (1 / s[:-1] - 1 / s[1:]))])
+
+    def __reduce__(self):
+        # Pickled and hashed (e.g. by Streamlit's cache) as its constructor arguments
+        return ConcentratedLiquidity, (self.price_bounds, self.liquidities)
+
+    @classmethod
+    def from_ticks_csv(cls, path, price_scale=1., liquidity_scale=1.):
+        # Reads a CSV with columns tick and liquidity_net, as reported for the initialized ticks of a Uniswap v3 pool.
+        # The price at a tick is price_scale * 1.0001**tick loan tokens per collateral token and the active liquidity
+        # is the running sum of liquidity_net times liquidity_scale (e.g. to convert raw token units).
+        with open(path, newline="") as f:
+            reader = csv.DictReader(f)
+            missing = {"tick", "liquidity_net"} - set(reader.fieldnames or ())
+            if missing:
+                raise ValueError(f"Missing tick columns in {path}: {', '.join(sorted(missing))}")
+            rows = sorted((int(row["tick"]), float(row["liquidity_net"])) for row in reader)
+        if len(rows) < 2:
+            raise ValueError(f"{path} needs at least two ticks")
+        ticks = np.array([tick for tick, _ in rows], dtype=float)
+        liquidities = np.cumsum([liquidity_net for _, liquidity_net in rows])[:-1] * liquidity_scale
+        return cls(price_scale * TICK_BASE**ticks, np.maximum(liquidities, 0))
+
+    def _locate(self, cross_price):
+        # Clamped sqrt price and index of the range it lies in
+        s = np.clip(np.sqrt(cross_price), self.sqrt_price_bounds[0], self.sqrt_price_bounds[-1])
+        return s, self._range_index(self.sqrt_price_bounds, s)
+
+    def _range_index(self, levels, value):
+        return np.clip(np.searchsorted(levels, value, side="right") - 1, 0, len(self.liquidities) - 1)
+
+    def _loan_level(self, s, i):
+        return self._loan_cum[i] + self.liquidities[i] * (s - self.sqrt_price_bounds[i])
+
+    def _coll_level(self, s, i):
+        return self._coll_cum[i] + self.liquidities[i] * (1 / self.sqrt_price_bounds[i] - 1 / s)
+
+    def collateral_out(self, loan_in, cross_price):
+        # Buying collateral moves the price up: find the sqrt price where Y has grown by loan_in. The marginal rate
+        # there is 1 / s**2 collateral per loan token (zero once the liquidity is exhausted).
+        s, i = self._locate(cross_price)
+        target = np.minimum(self._loan_level(s, i) + loan_in, self._loan_cum[-1])
+        j = self._range_index(self._loan_cum, target)
+        liquidity = self.liquidities[j]
+        step = np.divide(target - self._loan_cum[j], liquidity, out=np.zeros(np.shape(target)), where=liquidity > 0)
+        s_new = self.sqrt_price_bounds[j] + step
+        marginal = np.where(target < self._loan_cum[-1], 1 / s_new**2, 0.)
+        return (self._coll_level(s_new, j) - self._coll_level(s, i))[()], marginal[()]
+
+    def loan_out(self, coll_in, cross_price):
+        # Selling collateral moves the price down: find the sqrt price where X has shrunk by coll_in
+        s, i = self._locate(cross_price)
+        return self._loan_out_at(coll_in, s, i)
+
+    def _loan_out_at(self, coll_in, s, i):
+        target = np.maximum(self._coll_level(s, i) - coll_in, 0.)
+        j = self._range_index(self._coll_cum, target)
+        liquidity = self.liquidities[j]
+        step = np.divide(target - self._coll_cum[j], liquidity, out=np.zeros(np.shape(target)), where=liquidity > 0)
+        s_new = 1 / (1 / self.sqrt_price_bounds[j] - step)
+        return (self._loan_level(s, i) - self._loan_level(s_new, j))[()]
+
+    def price_for_loan_out(self, coll_in, loan_out, tol=1e-12):
+        # Pool price at which selling coll_in collateral yields loan_out loan tokens, by bisection on the sqrt price
+        # within the bounds (the proceeds grow with the price and are flat outside of them) down to a relative error
+        # of tol, nan if not even the upper bound gets there
+        shape = np.broadcast(coll_in, loan_out).shape
+        low = np.full(shape, self.sqrt_price_bounds[0])
+        high = np.full(shape, self.sqrt_price_bounds[-1])
+        reachable = self._loan_out_at(coll_in, high, self._range_index(self.sqrt_price_bounds, high)) >= loan_out
+        steps = int(np.ceil(np.log2((self.sqrt_price_bounds[-1] - self.sqrt_price_bounds[0]) / (self.sqrt_price_bounds[0] * tol))))
+        for _ in range(steps):
+            mid = (low + high) / 2
+            short = self._loan_out_at(coll_in, mid, self._range_index(self.sqrt_price_bounds, mid)) < loan_out
+            low = np.where(short, mid, low)
+            high = np.where(short, high, mid)
+        return np.where(reachable, high**2, np.nan)[()]
+
+def resolve_ticks_path(path, ticks_dir):
+    # Real path of a tick file named relative to ticks_dir. Tick file names come from users (share links, API
+    # requests), so anything outside of ticks_dir raises ValueError instead of being opened.
+    if not ticks_dir:
+        raise ValueError("Tick files are disabled, no tick file directory is configured (LOOPING_TICKS_DIR)")
+    root = os.path.realpath(ticks_dir)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if not path or os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"Tick file {path!r} is not in the tick file directory")
+    return resolved
+
+def solve_flashloan_amount(liquidity, user_init_coll_amount, cross_price, ltv, dex_swap_fee, upfront_fee, tol=1e-12, max_iter=50):
+    # Flashloan F that can be fully borrowed against the combined pledge when the swap has price impact:
+    #   F = (U + collateral_out(F * (1 - dex_swap_fee))) * (1 - upfront_fee) * cross_price * ltv
+    # F minus the right-hand side is increasing and convex in F, so Newton's method started at the solution without
+    # price impact (an upper bound) converges monotonically from above. All scenarios are iterated together.
+    borrowable_share = (1 - upfront_fee) * ltv
+    fee_factor = 1 - dex_swap_fee
+    flashloan = np.divide(user_init_coll_amount * cross_price * borrowable_share, 1 - fee_factor * borrowable_share)
+    for _ in range(max_iter):
+        coll_out, marginal = liquidity.collateral_out(flashloan * fee_factor, cross_price)
+        residual = flashloan - (user_init_coll_amount + coll_out) * borrowable_share * cross_price
+        step = residual / (1 - borrowable_share * cross_price * fee_factor * marginal)
+        flashloan = flashloan - step
+        if np.all(np.abs(step) <= tol * np.maximum(np.abs(flashloan), 1)):
+            break
+    return np.asarray(flashloan)[()]
+
+def price_change_for_roi(liquidity, target_roi, current_price_coll_token, current_price_loan_token, user_init_coll_amount, final_pledge_and_reclaimable, owed_repayment, dex_swap_fee, gas_usd_cost, net_of_gas=False):
+    # Relative collateral price change at which repaying yields target_roi when closing sells into the pool, nan
+    # where no price gets there
+    required = ((1 + target_roi) * user_init_coll_amount * current_price_coll_token + (gas_usd_cost if net_of_gas else 0)) / current_price_loan_token + owed_repayment
+    final_cross_price = liquidity.price_for_loan_out(final_pledge_and_reclaimable * (1 - dex_swap_fee), required)
+    return (final_cross_price / (current_price_coll_token / current_price_loan_token) - 1)[()]
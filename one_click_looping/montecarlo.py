@@ -0,0 +1,105 @@
+"""Monte Carlo RoI distribution of a looping position over simulated collateral price outcomes.
+
+Prices follow a geometric Brownian motion over the loan tenor; the loan token price stays fixed, like on the page.
+Paths are simulated in chunks and reduced into a fine histogram, so memory stays bounded for any number of paths.
+"""
+import numpy as np
+
+from one_click_looping.engine import calc_roi, calculate_close_position, calculate_open_position
+
+DEFAULT_N_PATHS = 1_000_000
+DEFAULT_CHUNK_SIZE = 250_000
+
+# Resolution of the internal histogram VaR/CVaR are read from, the reported histogram is re-binned from it
+_FINE_BINS = 20_000
+
+# Price outcomes beyond this many standard deviations are folded into the outermost histogram bins
+_MAX_SIGMAS = 5
+
+def simulate_price_moves(rng, n_paths, tenor, volatility, drift):
+    # Relative collateral price changes after tenor days under a GBM with annualized volatility and drift
+    t = tenor / 365
+    z = rng.standard_normal(n_paths)
+    return np.expm1((drift - volatility**2 / 2) * t + volatility * np.sqrt(t) * z)
+
+def simulate_price_paths(rng, n_paths, n_periods, tenor, volatility, drift):
+    # Collateral prices relative to today at the end of each of n_periods consecutive periods of tenor days, under
+    # the same GBM, shape (n_paths, n_periods + 1) with a first column of ones
+    t = tenor / 365
+    log_returns = (drift - volatility**2 / 2) * t + volatility * np.sqrt(t) * rng.standard_normal((n_paths, n_periods))
+    return np.exp(np.concatenate([np.zeros((n_paths, 1)), np.cumsum(log_returns, axis=1)], axis=1))
+
+def simulate_roi_distribution(current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost,
+                              volatility, drift=0., n_paths=DEFAULT_N_PATHS, chunk_size=DEFAULT_CHUNK_SIZE, bins=100, var_level=0.95, seed=None, liquidity=None):
+    # Simulates n_paths price outcomes and returns a dict with the expected RoI, the probability of a total loss
+    # (rational to default), VaR/CVaR at var_level (as positive RoI losses, e.g. 0.4 = -40% RoI) and a histogram of
+    # the RoI (counts and bin edges). Uses the same repay-or-default rule as calculate_close_position.
+    _, owed_repayment, _, _, _, _, _, final_pledge_and_reclaimable = calculate_open_position(
+        current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, liquidity
+    )
+
+    def roi_for_price_moves(price_moves):
+        _, _, _, final_amount_after_close, rational_to_repay, _ = calculate_close_position(
+            final_pledge_and_reclaimable, owed_repayment, current_price_coll_token * (1 + price_moves), current_price_loan_token, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity=liquidity
+        )
+        return calc_roi(final_amount_after_close, current_price_loan_token, user_init_coll_amount, current_price_coll_token), rational_to_repay
+
+    # RoI is non-decreasing in the price, so the range of the histogram follows from the extreme price outcomes
+    t = tenor / 365
+    extreme_price_moves = np.expm1((drift - volatility**2 / 2) * t + np.array([-_MAX_SIGMAS, _MAX_SIGMAS]) * volatility * np.sqrt(t))
+    roi_low, roi_high = roi_for_price_moves(extreme_price_moves)[0]
+    roi_high = max(roi_high, roi_low + 1e-9)
+    fine_width = (roi_high - roi_low) / _FINE_BINS
+
+    counts = np.zeros(_FINE_BINS, dtype=np.int64)
+    sums = np.zeros(_FINE_BINS)
+    total_losses = 0
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_paths, chunk_size):
+        rois, rational_to_repay = roi_for_price_moves(simulate_price_moves(rng, min(chunk_size, n_paths - start), tenor, volatility, drift))
+        idx = np.clip(((rois - roi_low) / fine_width).astype(np.int64), 0, _FINE_BINS - 1)
+        counts += np.bincount(idx, minlength=_FINE_BINS)
+        sums += np.bincount(idx, weights=rois, minlength=_FINE_BINS)
+        total_losses += np.count_nonzero(~rational_to_repay)
+
+    var_roi, cvar_roi = _tail_risk(counts, sums, 1 - var_level)
+    edges = np.linspace(0, _FINE_BINS, min(bins, _FINE_BINS) + 1).round().astype(np.int64)
+    return {
+        "n_paths": n_paths,
+        "expected_roi": sums.sum() / n_paths,
+        "prob_total_loss": total_losses / n_paths,
+        "var": -var_roi,
+        "cvar": -cvar_roi,
+        "var_level": var_level,
+        "histogram_counts": np.add.reduceat(counts, edges[:-1]),
+        "histogram_bin_edges": roi_low + edges * fine_width,
+    }
+
+def _tail_risk(counts, sums, tail_share):
+    # RoI quantile at tail_share and the mean RoI below it. The quantile is the mean RoI of the fine histogram bin it
+    # falls into (exact for the point mass at -100%), so both are accurate to within one fine bin.
+    n_tail = tail_share * counts.sum()
+    cum_counts = np.cumsum(counts)
+    i = min(int(np.searchsorted(cum_counts, n_tail)), len(counts) - 1)
+    quantile = sums[i] / counts[i]
+    share_of_bin = (n_tail - (cum_counts[i] - counts[i])) / counts[i]
+    tail_sum = sums[:i].sum() + share_of_bin * sums[i]
+    return quantile, tail_sum / n_tail if n_tail > 0 else quantile
+
+def price_move_probabilities(price_moves, tenor, volatility, drift):
+    # Probability weights for a sorted grid of relative price changes under the same GBM as simulate_price_moves,
+    # normalized to sum to one over the grid (outcomes outside of it are ignored)
+    price_moves = np.asarray(price_moves, dtype=float)
+    t = tenor / 365
+    mean = (drift - volatility**2 / 2) * t
+    if volatility == 0:
+        weights = np.zeros_like(price_moves)
+        weights[np.argmin(np.abs(price_moves - np.expm1(mean)))] = 1.
+        return weights
+    std = volatility * np.sqrt(t)
+    # lognormal density times the grid spacing around each point (zero at a price change of -100%)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_returns = np.log1p(price_moves)
+        density = np.exp(-((log_returns - mean) / std)**2 / 2) / (std * (1 + price_moves))
+    weights = np.nan_to_num(density) * np.gradient(price_moves)
+    return weights / weights.sum()
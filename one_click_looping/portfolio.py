@@ -0,0 +1,89 @@
+"""Books of looping positions, held column-wise and evaluated in one vectorized pass.
+
+A portfolio CSV has one position per row with the columns collateral_token_name, loan_token_name and (a subset of)
+the numeric SCENARIO_FIELDS except price_move, e.g.
+
+    collateral_token_name,loan_token_name,user_init_coll_amount,current_price_coll_token,current_price_loan_token,ltv,apr,tenor
+    WMNT,USDT,100,0.38,1,0.92,0.12,7
+    WETH,USDC,2,2400,1,0.8,0.08,30
+
+Numeric columns that aren't given take the defaults of the Streamlit page.
+"""
+import csv
+
+import numpy as np
+
+from one_click_looping.engine import DEFAULT_SCENARIO, SCENARIO_FIELDS, calc_roi, calculate_close_position, evaluate_scenarios
+
+# Numeric inputs of a position, in the order evaluate_scenarios expects them
+POSITION_FIELDS = tuple(name for name in SCENARIO_FIELDS if name != "price_move")
+
+class Portfolio:
+    def __init__(self, collateral_token_name, loan_token_name, **columns):
+        # Token names and numeric columns of equal length, one entry per position. Numeric columns that aren't given
+        # take their defaults.
+        unknown = set(columns) - set(POSITION_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown position columns: {', '.join(sorted(unknown))}")
+        self.collateral_token_name = np.asarray(collateral_token_name, dtype=str)
+        self.loan_token_name = np.asarray(loan_token_name, dtype=str)
+        n = len(self.collateral_token_name)
+        if len(self.loan_token_name) != n:
+            raise ValueError("Every position needs a collateral and a loan token")
+        self.columns = {}
+        for name in POSITION_FIELDS:
+            values = np.asarray(columns.get(name, DEFAULT_SCENARIO[name]), dtype=float)
+            self.columns[name] = np.broadcast_to(values, (n,)) if values.ndim == 0 else values
+            if len(self.columns[name]) != n:
+                raise ValueError(f"Column {name} has {len(self.columns[name])} entries for {n} positions")
+
+        # Every token that appears in the book, and where each position's tokens are in that list, so joint price
+        # shocks per token can be gathered for all positions at once
+        self.tokens, inverse = np.unique(np.concatenate([self.collateral_token_name, self.loan_token_name]), return_inverse=True)
+        self.collateral_token_index, self.loan_token_index = inverse[:n], inverse[n:]
+
+    @classmethod
+    def from_csv(cls, path_or_file):
+        # Reads a portfolio CSV from a path or an open text file
+        if isinstance(path_or_file, str):
+            with open(path_or_file, newline="") as f:
+                return cls.from_csv(f)
+        reader = csv.DictReader(path_or_file)
+        rows = list(reader)
+        if not rows:
+            raise ValueError("The portfolio has no positions")
+        names = {"collateral_token_name", "loan_token_name"}
+        missing = names - set(reader.fieldnames)
+        if missing:
+            raise ValueError(f"Missing position columns: {', '.join(sorted(missing))}")
+        columns = {name: np.array([float(row[name]) for row in rows]) for name in reader.fieldnames if name not in names}
+        return cls([row["collateral_token_name"] for row in rows], [row["loan_token_name"] for row in rows], **columns)
+
+    def __len__(self):
+        return len(self.collateral_token_name)
+
+    def initial_value_usd(self):
+        return self.columns["user_init_coll_amount"] * self.columns["current_price_coll_token"]
+
+    def evaluate(self, price_move=0.):
+        # Open/close breakdown, RoI and thresholds of every position (see evaluate_scenarios) for a relative move of
+        # each position's collateral token price (a scalar or one entry per position)
+        return evaluate_scenarios(**self.columns, price_move=price_move)
+
+    def shock_pnl(self, shocks):
+        # USD profit and loss of every position under joint price shocks: shocks has one row per scenario and one
+        # column per token in self.tokens (relative price changes). Both the collateral and the loan token price of
+        # a position move, and positions are closed with the usual repay-or-default rule. Returns the PnL per
+        # scenario and position, shape (len(shocks), len(self)), and the portfolio PnL per scenario.
+        shocks = np.atleast_2d(np.asarray(shocks, dtype=float))
+        if shocks.shape[1] != len(self.tokens):
+            raise ValueError(f"Shocks need one column per token ({', '.join(self.tokens)})")
+        c = self.columns
+        results = self.evaluate()
+        final_price_coll_token = c["current_price_coll_token"] * (1 + shocks[:, self.collateral_token_index])
+        final_price_loan_token = c["current_price_loan_token"] * (1 + shocks[:, self.loan_token_index])
+        _, _, _, final_amount_after_close, _, _ = calculate_close_position(
+            results["final_pledge_and_reclaimable"], results["owed_repayment"], final_price_coll_token, final_price_loan_token, c["dex_slippage"], c["dex_swap_fee"], c["gas_usd_cost"]
+        )
+        pnl = calc_roi(final_amount_after_close, final_price_loan_token, c["user_init_coll_amount"], c["current_price_coll_token"]) * self.initial_value_usd()
+        return pnl, pnl.sum(axis=1)
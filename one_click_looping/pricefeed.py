@@ -0,0 +1,281 @@
+"""Live token prices from a pluggable async source, kept in a thread-safe in-process store.
+
+Usage:
+    python -m one_click_looping.pricefeed simulate --price WMNT=0.38 --price USDT=1 --port 8765
+    python -m one_click_looping.pricefeed simulate --price WMNT=0.38 --file prices.jsonl
+
+A source is an async generator yielding batches of (symbol, price, timestamp) updates. Two are included: the tail of
+a JSON lines file that some other process appends to, and a websocket. Both carry JSON objects like
+``{"symbol": "WMNT", "price": 0.381, "timestamp": 1700000000.0}`` (or lists of them; the timestamp is optional).
+Sources ride out transient errors (a refused or dropped connection, a missing file) by retrying, so a feed never
+stops on its own. A PriceFeed consumes a source on its own thread and event loop and writes into a PriceStore, which
+only keeps the latest price per symbol: a burst of updates costs one store write per batch and never queues up.
+Readers (e.g. page sessions) wait on the store's version for new prices, so they can recompute at their own pace. A
+PriceFeedPool shares a bounded number of running feeds between readers and stops the ones it evicts. The simulate
+command publishes random-walk prices, as a stand-in for a real feed in tests.
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_POLL_INTERVAL = 0.25
+MIN_RECONNECT_DELAY = 1.
+MAX_RECONNECT_DELAY = 30.
+DEFAULT_MAX_FEEDS = 4
+
+# The tail source starts with the end of the file, enough to hold the latest price of every symbol
+_TAIL_START_BYTES = 64 * 1024
+
+class PriceStore:
+    def __init__(self):
+        self._prices = {}
+        self._condition = threading.Condition()
+        self.version = 0
+
+    def update_many(self, updates):
+        # Applies a batch of (symbol, price, timestamp) updates, keeping the latest price of every symbol
+        if not updates:
+            return
+        with self._condition:
+            for symbol, price, timestamp in updates:
+                self._prices[symbol] = (price, timestamp)
+            self.version += 1
+            self._condition.notify_all()
+
+    def update(self, symbol, price, timestamp=None):
+        self.update_many([(symbol, price, time.time() if timestamp is None else timestamp)])
+
+    def get(self, symbol):
+        # (price, timestamp) of the latest update of symbol, None if there was none
+        with self._condition:
+            return self._prices.get(symbol)
+
+    def snapshot(self):
+        # The store's version and a copy of all latest prices
+        with self._condition:
+            return self.version, dict(self._prices)
+
+    def wait_for_update(self, version, timeout=None):
+        # Blocks until the store is newer than version (or timeout seconds passed), returns the current version
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+def parse_price_updates(message, received_at=None):
+    # Updates from one JSON message (an object or a list of objects); malformed entries are skipped
+    received_at = time.time() if received_at is None else received_at
+    try:
+        entries = json.loads(message)
+    except ValueError:
+        return []
+    updates = []
+    for entry in entries if isinstance(entries, list) else [entries]:
+        try:
+            updates.append((str(entry["symbol"]), float(entry["price"]), float(entry.get("timestamp", received_at))))
+        except (TypeError, KeyError, ValueError, AttributeError):
+            continue
+    return updates
+
+async def tail_jsonl_source(path, poll_interval=DEFAULT_POLL_INTERVAL):
+    # Follows a JSON lines file like ``tail -f``: yields the updates of every batch of appended lines, polling every
+    # poll_interval seconds. Starts with the end of the file and reopens it when it's truncated or replaced.
+    f = None
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(path, "rb")
+                except OSError:
+                    await asyncio.sleep(poll_interval)
+                    continue
+                size = os.fstat(f.fileno()).st_size
+                f.seek(max(0, size - _TAIL_START_BYTES))
+                if f.tell() > 0:
+                    f.readline()  # skip the partial first line
+                inode, pending = os.fstat(f.fileno()).st_ino, b""
+            try:
+                chunk = f.read()
+            except OSError:
+                # e.g. the file system went away, reopen the file once it's back
+                f.close()
+                f = None
+                await asyncio.sleep(poll_interval)
+                continue
+            if chunk:
+                lines = (pending + chunk).split(b"\n")
+                pending = lines.pop()
+                received_at = time.time()
+                updates = [update for line in lines if line.strip() for update in parse_price_updates(line, received_at)]
+                if updates:
+                    yield updates
+                continue
+            await asyncio.sleep(poll_interval)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            if stat is None or stat.st_ino != inode or stat.st_size < f.tell():
+                f.close()
+                f = None
+    finally:
+        if f is not None:
+            f.close()
+
+async def websocket_source(url, min_reconnect_delay=MIN_RECONNECT_DELAY):
+    # Yields the updates of every message from a websocket. Whenever connecting fails (refused, rejected handshake, ...)
+    # or the connection drops, it reconnects with exponential backoff, which restarts once a message came through.
+    from tornado.httpclient import HTTPClientError
+    from tornado.iostream import StreamClosedError
+    from tornado.websocket import WebSocketError, websocket_connect
+
+    delay = min_reconnect_delay
+    while True:
+        connection = None
+        try:
+            connection = await websocket_connect(url)
+            while True:
+                message = await connection.read_message()
+                if message is None:
+                    break
+                delay = min_reconnect_delay
+                updates = parse_price_updates(message)
+                if updates:
+                    yield updates
+        except (OSError, HTTPClientError, StreamClosedError, WebSocketError):
+            pass
+        finally:
+            if connection is not None:
+                connection.close()
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+def source_from_spec(spec):
+    # ws:// and wss:// URLs are websockets, anything else is a JSON lines file
+    if spec.startswith(("ws://", "wss://")):
+        return websocket_source(spec)
+    return tail_jsonl_source(spec)
+
+class PriceFeed:
+    def __init__(self, source, store=None):
+        # source is an async generator of update batches (see source_from_spec)
+        self.source = source
+        self.store = PriceStore() if store is None else store
+        self._loop = None
+        self._task = None
+        self._thread = None
+
+    def start(self):
+        # Consumes the source on a daemon thread with its own event loop, so it never blocks the caller
+        started = threading.Event()
+
+        async def run():
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.current_task()
+            started.set()
+            try:
+                async for updates in self.source:
+                    self.store.update_many(updates)
+            except asyncio.CancelledError:
+                pass
+
+        self._thread = threading.Thread(target=asyncio.run, args=(run(),), name="price-feed", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+            self._thread.join()
+            self._task = None
+
+class PriceFeedPool:
+    def __init__(self, max_feeds=DEFAULT_MAX_FEEDS):
+        # Running feeds by source spec, shared by all callers (e.g. page sessions). At most max_feeds run at a time,
+        # starting another one stops the least recently used.
+        self.max_feeds = max_feeds
+        self._feeds = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, spec):
+        # The running feed of spec, started on first use
+        with self._lock:
+            feed = self._feeds.pop(spec, None)
+            if feed is None:
+                feed = PriceFeed(source_from_spec(spec)).start()
+            self._feeds[spec] = feed
+            evicted = [self._feeds.popitem(last=False)[1] for _ in range(len(self._feeds) - self.max_feeds)]
+        for evicted_feed in evicted:
+            evicted_feed.stop()
+        return feed
+
+    def stop(self):
+        with self._lock:
+            feeds = list(self._feeds.values())
+            self._feeds.clear()
+        for feed in feeds:
+            feed.stop()
+
+async def _simulate(prices, rate, volatility, port=None, path=None):
+    # Publishes geometric random walks of the prices rate times per second (each update moves every symbol), to
+    # websocket clients on port or appended to the file at path
+    import tornado.web
+    import tornado.websocket
+
+    clients = set()
+
+    class PriceSocket(tornado.websocket.WebSocketHandler):
+        def open(self):
+            clients.add(self)
+
+        def on_close(self):
+            clients.discard(self)
+
+    if port is not None:
+        tornado.web.Application([(r"/", PriceSocket)]).listen(port, address="127.0.0.1")
+        print(f"Publishing {rate:g} price updates per second on ws://127.0.0.1:{port}/")
+    else:
+        print(f"Appending {rate:g} price updates per second to {path}")
+
+    rng = np.random.default_rng()
+    symbols = list(prices)
+    levels = np.array([prices[symbol] for symbol in symbols], dtype=float)
+    step_std = volatility * np.sqrt(1 / (rate * 365 * 86400))
+    while True:
+        levels *= np.exp(step_std * rng.standard_normal(len(levels)))
+        now = time.time()
+        message = json.dumps([{"symbol": symbol, "price": level, "timestamp": now} for symbol, level in zip(symbols, levels)])
+        if port is not None:
+            for client in list(clients):
+                client.write_message(message)
+        else:
+            with open(path, "a") as f:
+                f.write(message + "\n")
+        await asyncio.sleep(1 / rate)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tools for live price feeds.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    simulate_parser = subparsers.add_parser("simulate", help="publish random-walk prices to a websocket or a JSON lines file")
+    simulate_parser.add_argument("--price", action="append", required=True, metavar="SYMBOL=PRICE", help="starting price of a symbol (repeatable)")
+    simulate_parser.add_argument("--rate", type=float, default=10., help="updates per second (default: 10)")
+    simulate_parser.add_argument("--volatility", type=float, default=0.8, help="annualized volatility of the random walk (default: 0.8)")
+    target = simulate_parser.add_mutually_exclusive_group()
+    target.add_argument("--port", type=int, default=8765, help="websocket port on localhost (default: 8765)")
+    target.add_argument("--file", help="append JSON lines to this file instead")
+    args = parser.parse_args(argv)
+
+    prices = {}
+    for spec in args.price:
+        symbol, _, price = spec.partition("=")
+        prices[symbol] = float(price)
+    asyncio.run(_simulate(prices, args.rate, args.volatility, port=None if args.file else args.port, path=args.file))
+
+if __name__ == "__main__":
+    main()
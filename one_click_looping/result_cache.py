@@ -0,0 +1,205 @@
+"""Persistent result cache in a local SQLite file, shared by worker processes and kept across restarts.
+
+Results are keyed by the SHA-256 of a namespace and a canonical form of the parameters they were computed from:
+dicts are sorted by key, all numbers become floats (so ``7`` and ``7.0`` share an entry), arrays are hashed by
+content and liquidity models by their constructor arguments. Values are pickled, so anything from numbers to
+rendered chart bytes can be stored. The database runs in WAL mode, so readers never block the writer, and concurrent
+writers wait for each other up to the busy timeout. Lookups are plain reads: their access times and the hit and miss
+counts are collected in memory and written in one transaction with the next put, at most every flush_interval
+seconds and at exit. When the stored values exceed max_bytes, the least recently used entries are evicted. Hits,
+misses and evictions are counted in the database, across all processes. Cached functions are keyed by their own
+source and the source of the whole package, so any change to the engine invalidates their entries.
+"""
+import atexit
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Part of every key; bump it when the format of cached results changes
+CACHE_SCHEMA_VERSION = 1
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_BUSY_TIMEOUT = 5.
+DEFAULT_FLUSH_INTERVAL = 1.
+
+_MISSING = object()
+
+def canonical_params(value):
+    # JSON-serializable canonical form of a parameter value, see the module docstring
+    if value is None or isinstance(value, (bool, np.bool_, str)):
+        return value.item() if isinstance(value, np.bool_) else value
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    if isinstance(value, dict):
+        return {str(name): canonical_params(item) for name, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonical_params(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return {"ndarray": value.dtype.str, "shape": list(value.shape), "sha256": hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()}
+    if type(value).__reduce__ is not object.__reduce__:
+        # Objects that reduce to their constructor arguments, like the liquidity models
+        constructor, args = value.__reduce__()[:2]
+        return {"object": f"{constructor.__module__}.{constructor.__qualname__}", "args": canonical_params(args)}
+    raise TypeError(f"Can't canonicalize a {type(value).__name__} for the result cache")
+
+@functools.lru_cache(maxsize=1)
+def package_source_hash():
+    # SHA-256 of the source of every module of this package, part of the namespace of cached functions
+    digest = hashlib.sha256()
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(package_dir)):
+        if name.endswith(".py"):
+            with open(os.path.join(package_dir, name), "rb") as f:
+                digest.update(name.encode() + b"\0" + f.read() + b"\0")
+    return digest.hexdigest()
+
+def cache_key(namespace, params):
+    canonical = json.dumps(canonical_params(params), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{CACHE_SCHEMA_VERSION}\n{namespace}\n{canonical}".encode()).hexdigest()
+
+class ResultCache:
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, busy_timeout=DEFAULT_BUSY_TIMEOUT, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.busy_timeout = busy_timeout
+        self.flush_interval = flush_interval
+        # SQLite connections can't be shared between threads, e.g. Streamlit sessions
+        self._local = threading.local()
+        # Access times and hit/miss counts of lookups since the last flush, shared by all threads
+        self._pending_lock = threading.Lock()
+        self._pending_accesses = {}
+        self._pending_counts = {"hits": 0, "misses": 0}
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush)
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS metrics (name TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        # Write transaction that takes the database lock up front, so concurrent writers queue on the busy timeout
+        # instead of failing on a lock upgrade
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _count(conn, name, n=1):
+        conn.execute("INSERT INTO metrics (name, count) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET count = count + excluded.count", (name, n))
+
+    def get(self, key, default=None):
+        row = self._connection().execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        with self._pending_lock:
+            if row is None:
+                self._pending_counts["misses"] += 1
+            else:
+                self._pending_counts["hits"] += 1
+                self._pending_accesses[key] = time.time()
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+        return default if row is None else pickle.loads(row[0])
+
+    def _take_pending(self):
+        with self._pending_lock:
+            accesses, counts = self._pending_accesses, self._pending_counts
+            self._pending_accesses, self._pending_counts = {}, {"hits": 0, "misses": 0}
+            self._last_flush = time.monotonic()
+        return accesses, counts
+
+    def _write_pending(self, conn, accesses, counts):
+        conn.executemany("UPDATE results SET last_access = MAX(last_access, ?) WHERE key = ?", [(at, key) for key, at in accesses.items()])
+        for name, n in counts.items():
+            if n:
+                self._count(conn, name, n)
+
+    def flush(self):
+        # Writes the access times and hit/miss counts of the lookups since the last flush
+        accesses, counts = self._take_pending()
+        if accesses or any(counts.values()):
+            with self._transaction() as conn:
+                self._write_pending(conn, accesses, counts)
+
+    def put(self, key, value):
+        # Stores value under key and evicts the least recently used entries beyond max_bytes. Values larger than
+        # max_bytes on their own aren't stored.
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        accesses, counts = self._take_pending()
+        with self._transaction() as conn:
+            # Pending access times first, so the eviction order is up to date
+            self._write_pending(conn, accesses, counts)
+            conn.execute("INSERT OR REPLACE INTO results (key, value, size, last_access) VALUES (?, ?, ?, ?)", (key, blob, len(blob), time.time()))
+            excess = conn.execute("SELECT SUM(size) FROM results").fetchone()[0] - self.max_bytes
+            if excess > 0:
+                evicted = []
+                for evicted_key, size in conn.execute("SELECT key, size FROM results WHERE key != ? ORDER BY last_access", (key,)):
+                    evicted.append((evicted_key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                conn.executemany("DELETE FROM results WHERE key = ?", evicted)
+                self._count(conn, "evictions", len(evicted))
+
+    def stats(self):
+        self.flush()
+        conn = self._connection()
+        counts = dict(conn.execute("SELECT name, count FROM metrics").fetchall())
+        entries, stored_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        hits, misses = counts.get("hits", 0), counts.get("misses", 0)
+        return {
+            "entries": entries,
+            "bytes": stored_bytes,
+            "hits": hits,
+            "misses": misses,
+            "evictions": counts.get("evictions", 0),
+            "hit_rate": hits / (hits + misses) if hits + misses else None,
+        }
+
+    def cached(self, func):
+        # Decorator caching func's results under its name, the hash of its source and of the package's source (which
+        # func presumably calls into) and its canonicalized arguments
+        signature = inspect.signature(func)
+        try:
+            source = inspect.getsource(func)
+        except (OSError, TypeError):
+            source = ""
+        namespace = f"{func.__module__}.{func.__qualname__}:{hashlib.sha256(source.encode()).hexdigest()}:{package_source_hash()}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = cache_key(namespace, bound.arguments)
+            value = self.get(key, _MISSING)
+            if value is _MISSING:
+                value = func(*args, **kwargs)
+                self.put(key, value)
+            return value
+
+        return wrapper
@@ -0,0 +1,64 @@
+"""Rolling looping strategies: consecutive loops along simulated collateral price paths, with compounding.
+
+Every period opens a loop of tenor days with the collateral at hand and closes it at the period's end with the usual
+repay-or-default rule. The loan tokens left after repaying and paying gas are swapped back into collateral, which is
+levered again in the next period; a default ends the chain with a total loss. After the last period the proceeds are
+kept in loan tokens, so a single period gives the page's RoI net of gas (a default counts as -100%). Prices follow the
+geometric Brownian motion of one_click_looping.montecarlo and the loan token price stays fixed. Periods are chained
+one after another, each vectorized over all paths that are still rolling.
+"""
+import numpy as np
+
+from one_click_looping.engine import calculate_close_position, calculate_open_position
+from one_click_looping.montecarlo import simulate_price_paths
+
+DEFAULT_N_PERIODS = 52
+DEFAULT_N_PATHS = 10_000
+
+def simulate_rolling_loops(current_price_coll_token, current_price_loan_token, user_init_coll_amount, ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, gas_usd_cost,
+                           volatility, drift=0., n_periods=DEFAULT_N_PERIODS, n_paths=DEFAULT_N_PATHS, bins=100, seed=None, liquidity=None):
+    # Simulates n_paths price paths over n_periods rolled loops and returns a dict with the compounded RoI of every
+    # path (net of gas), its mean and median, the probability of a total loss, the share of paths still rolling after
+    # each period, the buy & hold RoI of the collateral for comparison and a histogram of the compounded RoI (counts
+    # and bin edges; the best percent of outcomes is folded into the last bin, as the distribution is heavy-tailed).
+    rng = np.random.default_rng(seed)
+    prices = current_price_coll_token * simulate_price_paths(rng, n_paths, n_periods, tenor, volatility, drift)
+    collateral = np.full(n_paths, float(user_init_coll_amount))
+    final_value_usd = np.zeros(n_paths)
+    rolling = np.arange(n_paths)
+    survival = np.ones(n_periods + 1)
+    for period in range(n_periods):
+        open_price, close_price = prices[rolling, period], prices[rolling, period + 1]
+        _, owed_repayment, _, _, _, _, _, final_pledge_and_reclaimable = calculate_open_position(
+            open_price, current_price_loan_token, collateral[rolling], ltv, apr, upfront_fee, tenor, myso_fee, dex_slippage, dex_swap_fee, liquidity
+        )
+        _, _, _, final_amount_after_close, rational_to_repay, _ = calculate_close_position(
+            final_pledge_and_reclaimable, owed_repayment, close_price, current_price_loan_token, dex_slippage, dex_swap_fee, gas_usd_cost, liquidity=liquidity
+        )
+        proceeds = final_amount_after_close - gas_usd_cost / current_price_loan_token
+        repaid = rational_to_repay & (proceeds > 0)
+        rolling, proceeds, close_price = rolling[repaid], proceeds[repaid], close_price[repaid]
+        survival[period + 1] = len(rolling) / n_paths
+        if period == n_periods - 1:
+            final_value_usd[rolling] = proceeds * current_price_loan_token
+        elif liquidity is None:
+            collateral[rolling] = proceeds * current_price_loan_token / close_price * (1 - dex_slippage - dex_swap_fee)
+        else:
+            collateral[rolling], _ = liquidity.collateral_out(proceeds * (1 - dex_swap_fee), close_price / current_price_loan_token)
+
+    rois = final_value_usd / (user_init_coll_amount * current_price_coll_token) - 1
+    buy_and_hold_rois = prices[:, -1] / current_price_coll_token - 1
+    roi_high = max(np.quantile(rois, 0.99), 1e-9)
+    histogram_counts, histogram_bin_edges = np.histogram(np.minimum(rois, roi_high), bins=bins, range=(-1, roi_high))
+    return {
+        "n_paths": n_paths,
+        "n_periods": n_periods,
+        "rois": rois,
+        "expected_roi": rois.mean(),
+        "median_roi": np.median(rois),
+        "prob_total_loss": 1 - survival[-1],
+        "survival": survival,
+        "expected_buy_and_hold_roi": buy_and_hold_rois.mean(),
+        "histogram_counts": histogram_counts,
+        "histogram_bin_edges": histogram_bin_edges,
+    }
@@ -0,0 +1,239 @@
+"""Precomputed RoI, break-even and total loss surfaces for instant lookups.
+
+Usage:
+    python -m one_click_looping.surface build surfaces/wmnt-usdt --myso-fee 0.0008 --dex-slippage 0.0008 --dex-swap-fee 0.0005
+    python -m one_click_looping.surface check surfaces/wmnt-usdt
+
+With the flat price impact, the RoI before gas and the break-even/total loss price changes don't depend on prices, the
+amount or gas, only on the LTV, APR, tenor, price move and the costs of the pair (upfront fee, MYSO fee, DEX slippage
+and swap fee). The build step tabulates them over a bounded grid of the first four for one set of costs and writes
+    <prefix>.roi.npy         RoI by (ltv, apr, tenor, price_move)
+    <prefix>.thresholds.npy  break-even and total loss price changes by (ltv, apr, tenor)
+    <prefix>.json            axes, costs and the measured interpolation error
+Lookups interpolate multilinearly from memory-mapped arrays, so every process shares them through the OS page cache.
+The RoI is tabulated as if the loan was always repaid, which is smooth across the default kink, and clipped at -100%
+after interpolating; it's then linear in the price move and bilinear in APR and tenor, so the error comes from the
+curvature in the LTV. LTV points are spaced evenly in 1 / sqrt(1 - ltv), denser where the leverage takes off. Every
+build is checked against the exact calculate_open_position/calculate_close_position path at random points and refuses
+to write a surface whose error exceeds the tolerance. Scenarios outside of a surface (other costs, out-of-range inputs,
+a liquidity model) are left to the exact path by the callers, see PrecomputedSurface.covers.
+"""
+import argparse
+import json
+import os
+from bisect import bisect_right
+
+import numpy as np
+
+from one_click_looping.engine import DEFAULT_SCENARIO, calc_roi, calculate_close_position, calculate_open_position, calculate_thresholds
+
+SURFACE_SCHEMA_VERSION = 1
+
+# Bounds of the tabulated inputs and default grid sizes; tenor is in days, the price move is relative
+DEFAULT_RANGES = {"ltv": (0.5, 0.95), "apr": (0., 0.5), "tenor": (1., 365.), "price_move": (-1., 1.)}
+DEFAULT_POINTS = {"ltv": 140, "apr": 11, "tenor": 14, "price_move": 41}
+COST_FIELDS = ("upfront_fee", "myso_fee", "dex_slippage", "dex_swap_fee")
+DEFAULT_TOLERANCE = 1e-3
+DEFAULT_CHECK_SAMPLES = 100_000
+
+def surface_axes(ranges=None, points=None):
+    # Grid points of every input; the LTV axis is uniform in 1 / sqrt(1 - ltv)
+    ranges, points = {**DEFAULT_RANGES, **(ranges or {})}, {**DEFAULT_POINTS, **(points or {})}
+    ltv_low, ltv_high = ranges["ltv"]
+    axes = {"ltv": 1 - np.linspace((1 - ltv_low)**-0.5, (1 - ltv_high)**-0.5, points["ltv"])**-2}
+    for name in ("apr", "tenor", "price_move"):
+        axes[name] = np.linspace(*ranges[name], points[name])
+    return axes
+
+def _exact(ltv, apr, tenor, price_move, costs, always_repay=False):
+    # RoI at price_move and the thresholds from the engine; prices, amount and gas don't matter for either
+    p0, p2, u = DEFAULT_SCENARIO["current_price_coll_token"], DEFAULT_SCENARIO["current_price_loan_token"], DEFAULT_SCENARIO["user_init_coll_amount"]
+    _, owed_repayment, _, _, _, _, _, final_pledge_and_reclaimable = calculate_open_position(
+        p0, p2, u, ltv, apr, costs["upfront_fee"], tenor, costs["myso_fee"], costs["dex_slippage"], costs["dex_swap_fee"]
+    )
+    _, _, _, final_amount_after_close, _, _ = calculate_close_position(
+        final_pledge_and_reclaimable, owed_repayment, p0 * (1 + price_move), p2, costs["dex_slippage"], costs["dex_swap_fee"], 0., always_repay=always_repay
+    )
+    roi = calc_roi(final_amount_after_close, p2, u, p0)
+    break_even_price_change, total_loss_price_change = calculate_thresholds(p0, p2, u, final_pledge_and_reclaimable, owed_repayment, costs["dex_slippage"], costs["dex_swap_fee"], 0.)
+    return roi, break_even_price_change, total_loss_price_change
+
+def _interpolate(table, axes, points):
+    # Multilinear interpolation of table (one dimension per axis) at broadcast points, inputs are clamped to the axes.
+    # Corners are gathered by flat index from the raveled table, weights are built up one axis at a time.
+    points = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in points))
+    flat_table = table.reshape(-1)
+    strides = np.cumprod((1,) + table.shape[:0:-1])[::-1]
+    base = np.zeros(points[0].shape, dtype=np.int64)
+    offsets, weights = [0], [np.ones(points[0].shape)]
+    for axis, x, stride in zip(axes, points, strides):
+        i = np.clip(np.searchsorted(axis, x, side="right") - 1, 0, len(axis) - 2)
+        t = np.clip((x - axis[i]) / (axis[i + 1] - axis[i]), 0., 1.)
+        base += i * stride
+        offsets = offsets + [offset + stride for offset in offsets]
+        weights = [w * (1 - t) for w in weights] + [w * t for w in weights]
+    result = np.zeros(points[0].shape)
+    for offset, weight in zip(offsets, weights):
+        result += weight * flat_table[base + offset]
+    return result[()]
+
+def _scalars(*values):
+    # Whether all values are single numbers (cheaper than np.ndim)
+    return not any(isinstance(value, np.ndarray) and value.ndim for value in values)
+
+def _scalar_cell(axes, point):
+    # Slices of the grid cell around a single point and the weights of its corners (in C order), found in plain
+    # Python, which is faster than numpy for a single point
+    cell, weights = [], [1.]
+    for axis, x in zip(axes, point):
+        i = min(max(bisect_right(axis, x) - 1, 0), len(axis) - 2)
+        t = min(max((x - axis[i]) / (axis[i + 1] - axis[i]), 0.), 1.)
+        cell.append(slice(i, i + 2))
+        weights = [w * share for w in weights for share in (1 - t, t)]
+    return tuple(cell), np.array(weights)
+
+class PrecomputedSurface:
+    def __init__(self, roi, thresholds, metadata):
+        # Plain ndarray views of the memory maps, which index faster than np.memmap
+        self.roi_table = roi.view(np.ndarray)
+        self.thresholds_table = thresholds.view(np.ndarray)
+        self.metadata = metadata
+        self.axes = {name: np.array(values) for name, values in metadata["axes"].items()}
+        self._axis_lists = {name: list(values) for name, values in metadata["axes"].items()}
+        self.costs = metadata["costs"]
+
+    def covers(self, ltv, apr, tenor, upfront_fee, myso_fee, dex_slippage, dex_swap_fee, price_move_range=(0., 0.)):
+        # Where the surface answers for a scenario (element-wise): same costs, and the inputs and the lowest and
+        # highest price move that will be looked up within the tabulated ranges
+        scenario = (ltv, apr, tenor, *price_move_range, upfront_fee, myso_fee, dex_slippage, dex_swap_fee)
+        names = ("ltv", "apr", "tenor", "price_move", "price_move")
+        if _scalars(*scenario):
+            return (all(value == self.costs[name] for name, value in zip(COST_FIELDS, scenario[5:]))
+                    and all(self._axis_lists[name][0] <= x <= self._axis_lists[name][-1] for name, x in zip(names, scenario)))
+        covered = np.logical_and.reduce([np.asarray(value) == self.costs[name] for name, value in zip(COST_FIELDS, scenario[5:])])
+        for name, x in zip(names, scenario):
+            covered = covered & (np.asarray(x) >= self.axes[name][0]) & (np.asarray(x) <= self.axes[name][-1])
+        return covered[()]
+
+    def roi(self, ltv, apr, tenor, price_move):
+        # RoI before gas, like calc_roi after calculate_close_position (see covers for the valid price moves). For
+        # a single scenario the RoI along the price move axis is interpolated once and then read off with np.interp.
+        if _scalars(ltv, apr, tenor):
+            cell, weights = _scalar_cell([self._axis_lists[name] for name in ("ltv", "apr", "tenor")], (float(ltv), float(apr), float(tenor)))
+            repaid_roi = np.interp(price_move, self.axes["price_move"], weights @ self.roi_table[cell].reshape(len(weights), -1))
+        else:
+            repaid_roi = _interpolate(self.roi_table, [self.axes[name] for name in ("ltv", "apr", "tenor", "price_move")], (ltv, apr, tenor, price_move))
+        return np.maximum(repaid_roi, -1.)[()]
+
+    def thresholds(self, ltv, apr, tenor):
+        # Break-even and total loss price changes before gas, like calculate_thresholds
+        if _scalars(ltv, apr, tenor):
+            cell, weights = _scalar_cell([self._axis_lists[name] for name in ("ltv", "apr", "tenor")], (float(ltv), float(apr), float(tenor)))
+            break_even_price_change, total_loss_price_change = self.thresholds_table[(slice(None),) + cell].reshape(2, -1) @ weights
+            return float(break_even_price_change), float(total_loss_price_change)
+        axes = [self.axes[name] for name in ("ltv", "apr", "tenor")]
+        return _interpolate(self.thresholds_table[0], axes, (ltv, apr, tenor)), _interpolate(self.thresholds_table[1], axes, (ltv, apr, tenor))
+
+def check_surface(surface, n_samples=DEFAULT_CHECK_SAMPLES, seed=0):
+    # Largest absolute differences to the exact path at random points of the tabulated ranges (RoI and relative price
+    # changes, so 1e-3 is 0.1 percentage points)
+    rng = np.random.default_rng(seed)
+    ltv, apr, tenor, price_move = (rng.uniform(surface.axes[name][0], surface.axes[name][-1], n_samples) for name in ("ltv", "apr", "tenor", "price_move"))
+    roi, break_even_price_change, total_loss_price_change = _exact(ltv, apr, tenor, price_move, surface.costs)
+    surface_break_even, surface_total_loss = surface.thresholds(ltv, apr, tenor)
+    return {
+        "roi": float(np.max(np.abs(surface.roi(ltv, apr, tenor, price_move) - roi))),
+        "break_even_price_change": float(np.max(np.abs(surface_break_even - break_even_price_change))),
+        "total_loss_price_change": float(np.max(np.abs(surface_total_loss - total_loss_price_change))),
+    }
+
+def build_surface(output_prefix, upfront_fee=DEFAULT_SCENARIO["upfront_fee"], myso_fee=DEFAULT_SCENARIO["myso_fee"], dex_slippage=DEFAULT_SCENARIO["dex_slippage"], dex_swap_fee=DEFAULT_SCENARIO["dex_swap_fee"],
+                  ranges=None, points=None, tolerance=DEFAULT_TOLERANCE, n_check=DEFAULT_CHECK_SAMPLES):
+    # Tabulates the surface for one set of costs (one LTV slice at a time, so memory stays bounded) into temporary
+    # files and checks it. Only a checked surface replaces the files at output_prefix, so processes that have the old
+    # one mapped keep reading it. Raises ValueError if the error exceeds tolerance (use more grid points then).
+    # Returns the metadata.
+    costs = {"upfront_fee": upfront_fee, "myso_fee": myso_fee, "dex_slippage": dex_slippage, "dex_swap_fee": dex_swap_fee}
+    axes = surface_axes(ranges, points)
+    ltvs = axes["ltv"]
+    apr, tenor, price_move = axes["apr"][:, None, None], axes["tenor"][None, :, None], axes["price_move"][None, None, :]
+    roi = np.lib.format.open_memmap(f"{output_prefix}.roi.npy.tmp", mode="w+", dtype=np.float64, shape=tuple(len(axes[name]) for name in ("ltv", "apr", "tenor", "price_move")))
+    thresholds = np.lib.format.open_memmap(f"{output_prefix}.thresholds.npy.tmp", mode="w+", dtype=np.float64, shape=(2,) + roi.shape[:3])
+    for i, ltv in enumerate(ltvs):
+        roi[i], break_even_price_change, total_loss_price_change = _exact(ltv, apr, tenor, price_move, costs, always_repay=True)
+        thresholds[0, i], thresholds[1, i] = break_even_price_change[..., 0], total_loss_price_change[..., 0]
+    roi.flush()
+    thresholds.flush()
+
+    metadata = {
+        "schema_version": SURFACE_SCHEMA_VERSION,
+        "costs": costs,
+        "axes": {name: values.tolist() for name, values in axes.items()},
+        "tolerance": tolerance,
+    }
+    metadata["max_error"] = check_surface(PrecomputedSurface(roi, thresholds, metadata), n_check)
+    worst = max(metadata["max_error"].values())
+    del roi, thresholds
+    if not worst <= tolerance:
+        for suffix in (".roi.npy.tmp", ".thresholds.npy.tmp"):
+            os.remove(output_prefix + suffix)
+        raise ValueError(f"Interpolation error {worst:.3g} exceeds the tolerance {tolerance:g}, use more grid points")
+    with open(f"{output_prefix}.json.tmp", "w") as f:
+        json.dump(metadata, f)
+    for suffix in (".roi.npy", ".thresholds.npy", ".json"):
+        os.replace(f"{output_prefix}{suffix}.tmp", output_prefix + suffix)
+    return metadata
+
+def load_surface(prefix):
+    # Memory-maps a built surface read-only. Raises ValueError for surfaces of another schema version or arrays that
+    # don't match the metadata (e.g. caught in the middle of a rebuild).
+    with open(f"{prefix}.json") as f:
+        metadata = json.load(f)
+    if metadata.get("schema_version") != SURFACE_SCHEMA_VERSION:
+        raise ValueError(f"{prefix} has schema version {metadata.get('schema_version')}, rebuild it")
+    roi, thresholds = np.load(f"{prefix}.roi.npy", mmap_mode="r"), np.load(f"{prefix}.thresholds.npy", mmap_mode="r")
+    shape = tuple(len(metadata["axes"][name]) for name in ("ltv", "apr", "tenor", "price_move"))
+    if roi.shape != shape or thresholds.shape != (2,) + shape[:3]:
+        raise ValueError(f"The arrays of {prefix} don't match its metadata, rebuild it")
+    return PrecomputedSurface(roi, thresholds, metadata)
+
+def find_surface(surfaces, ltv, apr, tenor, upfront_fee, myso_fee, dex_slippage, dex_swap_fee, price_move_range=(0., 0.)):
+    # The first surface covering a single scenario, None if there's none
+    for surface in surfaces:
+        if surface.covers(ltv, apr, tenor, upfront_fee, myso_fee, dex_slippage, dex_swap_fee, price_move_range):
+            return surface
+    return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and check precomputed RoI surfaces.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="tabulate a surface for one set of costs")
+    build_parser.add_argument("output_prefix", help="writes <prefix>.roi.npy, <prefix>.thresholds.npy and <prefix>.json")
+    for name in COST_FIELDS:
+        build_parser.add_argument(f"--{name.replace('_', '-')}", type=float, default=DEFAULT_SCENARIO[name], help=f"(default: {DEFAULT_SCENARIO[name]:g})")
+    for name, (low, high) in DEFAULT_RANGES.items():
+        option = name.replace("_", "-")
+        build_parser.add_argument(f"--{option}-range", type=float, nargs=2, default=(low, high), metavar=("LOW", "HIGH"), help=f"tabulated {name} range (default: {low:g} {high:g})")
+        build_parser.add_argument(f"--{option}-points", type=int, default=DEFAULT_POINTS[name], help=f"grid points along {name} (default: {DEFAULT_POINTS[name]})")
+    build_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help=f"largest acceptable interpolation error (default: {DEFAULT_TOLERANCE:g})")
+    build_parser.add_argument("--check-samples", type=int, default=DEFAULT_CHECK_SAMPLES, help=f"random points the error is checked at (default: {DEFAULT_CHECK_SAMPLES})")
+    check_parser = subparsers.add_parser("check", help="re-check a surface against the exact path")
+    check_parser.add_argument("prefix")
+    check_parser.add_argument("--samples", type=int, default=DEFAULT_CHECK_SAMPLES, help=f"random points to check (default: {DEFAULT_CHECK_SAMPLES})")
+    check_parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        metadata = build_surface(
+            args.output_prefix, **{name: getattr(args, name) for name in COST_FIELDS},
+            ranges={name: tuple(getattr(args, f"{name}_range")) for name in DEFAULT_RANGES}, points={name: getattr(args, f"{name}_points") for name in DEFAULT_POINTS},
+            tolerance=args.tolerance, n_check=args.check_samples,
+        )
+        max_error = metadata["max_error"]
+    else:
+        max_error = check_surface(load_surface(args.prefix), args.samples, args.seed)
+    for name, error in max_error.items():
+        print(f"max error {name}: {error:.3g}")
+
+if __name__ == "__main__":
+    main()
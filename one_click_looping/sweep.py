@@ -0,0 +1,196 @@
+"""Parameter sweeps over large scenario grids, streamed to CSV or Parquet.
+
+Usage:
+    python -m one_click_looping.sweep --ltv 0.5:0.95:46 --apr 0:0.5:51 --tenor 7,14,30 --price-move=-0.5:0.5:101 -o sweep.parquet
+    python -m one_click_looping.sweep --scenarios scenarios.csv -o results.csv
+    python -m one_click_looping.sweep --user-init-coll-amount 100,10000,1000000 --pool-liquidity 50000 -o impact.csv
+
+A grid spec is either a single value, a comma separated list of values or ``start:stop:num`` (num evenly spaced
+values, both ends included); specs starting with a minus sign need the ``--name=SPEC`` form. Parameters that aren't
+given fall back to the defaults of the Streamlit page. Swaps are charged the flat dex_slippage unless a liquidity model
+is given with --pool-liquidity or --liquidity-ticks (see one_click_looping.liquidity).
+"""
+import argparse
+import csv
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from one_click_looping.engine import DEFAULT_SCENARIO, SCENARIO_FIELDS, evaluate_scenarios
+from one_click_looping.liquidity import ConcentratedLiquidity, ConstantProductPool
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+def parse_grid_spec(spec):
+    # "0.9" -> [0.9], "0.8,0.9" -> [0.8, 0.9], "0.5:0.95:10" -> 10 evenly spaced values from 0.5 to 0.95
+    if ":" in spec:
+        start, stop, num = spec.split(":")
+        return np.linspace(float(start), float(stop), int(num))
+    return np.array([float(value) for value in spec.split(",")])
+
+def evaluate_chunk(columns, liquidity=None):
+    # Evaluates one chunk of scenarios, given as a dict of equally long input columns, and returns inputs and results
+    results = evaluate_scenarios(**columns, liquidity=liquidity)
+    return {**columns, **results}
+
+def grid_chunk(axes, start, stop):
+    # Inputs for the flat indices [start, stop) of the Cartesian product of the axes (a dict of 1d value arrays)
+    indices = np.unravel_index(np.arange(start, stop), [len(values) for values in axes.values()])
+    return {name: values[index] for (name, values), index in zip(axes.items(), indices)}
+
+def evaluate_grid_chunk(args, liquidity=None):
+    axes, start, stop = args
+    return evaluate_chunk(grid_chunk(axes, start, stop), liquidity)
+
+def iter_grid_chunks(axes, chunk_size):
+    size = int(np.prod([len(values) for values in axes.values()]))
+    for start in range(0, size, chunk_size):
+        yield axes, start, min(start + chunk_size, size)
+
+def iter_csv_chunks(path, chunk_size):
+    # Streams scenarios from a CSV with (a subset of) SCENARIO_FIELDS as columns, missing ones take their defaults.
+    # Raises ValueError naming the line and column of the first value that isn't a number.
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        unknown = set(reader.fieldnames or ()) - set(SCENARIO_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown scenario columns in {path}: {', '.join(sorted(unknown))}")
+        rows = []
+        for row in reader:
+            rows.append(_parse_row(row, path, reader.line_num))
+            if len(rows) == chunk_size:
+                yield _rows_to_columns(rows)
+                rows = []
+        if rows:
+            yield _rows_to_columns(rows)
+
+def _parse_row(row, path, line):
+    if None in row:
+        raise ValueError(f"{path}, line {line}: more values than columns")
+    values = {}
+    for name, value in row.items():
+        try:
+            values[name] = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{path}, line {line}, column {name}: {value!r} is not a number") from None
+    return values
+
+def validate_scenarios_csv(path):
+    # Parses the whole file once, so a bad value fails the sweep before anything is evaluated or written
+    for _ in iter_csv_chunks(path, DEFAULT_CHUNK_SIZE):
+        pass
+
+def _rows_to_columns(rows):
+    return {
+        name: np.array([row[name] for row in rows]) if name in rows[0] else np.full(len(rows), float(DEFAULT_SCENARIO[name]))
+        for name in SCENARIO_FIELDS
+    }
+
+def _imap_bounded(executor, fn, iterable, max_pending):
+    # Like executor.map, but keeps at most max_pending chunks in flight so results never pile up in memory
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+class CsvWriter:
+    def __init__(self, path):
+        self.f = open(path, "w", newline="")
+        self.columns = None
+
+    def write(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk)
+            self.f.write(",".join(self.columns) + "\n")
+        np.savetxt(self.f, np.column_stack([chunk[name] for name in self.columns]), delimiter=",", fmt="%.10g")
+
+    def close(self):
+        self.f.close()
+
+class ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Writing Parquet files requires pyarrow, install it or write to a .csv file instead")
+        self.pa, self.pq = pa, pq
+        self.path = path
+        self.writer = None
+
+    def write(self, chunk):
+        table = self.pa.table({name: np.ascontiguousarray(values) for name, values in chunk.items()})
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def open_writer(path, output_format=None):
+    output_format = output_format or ("parquet" if path.endswith(".parquet") else "csv")
+    return ParquetWriter(path) if output_format == "parquet" else CsvWriter(path)
+
+def run_sweep(output_path, axes=None, scenarios_path=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=None, output_format=None, liquidity=None):
+    # Evaluates either the Cartesian product of the axes or the scenarios of a CSV file and streams the results to
+    # output_path. Chunks are evaluated in a process pool; returns the number of rows written. liquidity is an
+    # optional liquidity model used for all scenarios.
+    workers = workers or os.cpu_count()
+    if scenarios_path is not None:
+        validate_scenarios_csv(scenarios_path)
+        fn, chunks = evaluate_chunk, iter_csv_chunks(scenarios_path, chunk_size)
+    else:
+        axes = {name: np.atleast_1d(np.asarray(axes.get(name, DEFAULT_SCENARIO[name]), dtype=float)) for name in SCENARIO_FIELDS}
+        fn, chunks = evaluate_grid_chunk, iter_grid_chunks(axes, chunk_size)
+
+    rows = 0
+    writer = open_writer(output_path, output_format)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk in _imap_bounded(executor, partial(fn, liquidity=liquidity), chunks, max_pending=2 * workers):
+                writer.write(chunk)
+                rows += len(chunk["roi"])
+    finally:
+        writer.close()
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the one-click looping calculator over a grid of scenarios.")
+    for name in SCENARIO_FIELDS:
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=parse_grid_spec, metavar="SPEC",
+                            help=f"grid spec for {name} (default: {DEFAULT_SCENARIO[name]:g})")
+    parser.add_argument("--scenarios", help="CSV file with one scenario per row instead of a grid")
+    liquidity_group = parser.add_mutually_exclusive_group()
+    liquidity_group.add_argument("--pool-liquidity", type=float, metavar="L",
+                                 help="price impact of a constant-product pool with liquidity L = sqrt(collateral reserve * loan reserve) instead of --dex-slippage")
+    liquidity_group.add_argument("--liquidity-ticks", metavar="FILE",
+                                 help="price impact of concentrated liquidity from a CSV with tick,liquidity_net columns instead of --dex-slippage")
+    parser.add_argument("-o", "--output", required=True, help="output file (.csv or .parquet)")
+    parser.add_argument("--format", choices=("csv", "parquet"), help="output format (default: from the file extension)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="scenarios per vectorized chunk")
+    parser.add_argument("--workers", type=int, help="number of worker processes (default: number of CPUs)")
+    args = parser.parse_args(argv)
+
+    axes = {name: getattr(args, name) for name in SCENARIO_FIELDS if getattr(args, name) is not None}
+    if args.scenarios and axes:
+        parser.error("--scenarios can't be combined with grid specs")
+    liquidity = None
+    if args.pool_liquidity is not None:
+        liquidity = ConstantProductPool(args.pool_liquidity)
+    elif args.liquidity_ticks:
+        liquidity = ConcentratedLiquidity.from_ticks_csv(args.liquidity_ticks)
+    try:
+        rows = run_sweep(args.output, axes=axes, scenarios_path=args.scenarios, chunk_size=args.chunk_size, workers=args.workers, output_format=args.format, liquidity=liquidity)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Wrote {rows:,} scenarios to {args.output}")
+
+if __name__ == "__main__":
+    main()
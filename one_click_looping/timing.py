@@ -0,0 +1,41 @@
+"""Wall-clock timing of named pipeline stages, e.g. once per Streamlit rerun.
+
+Records can be appended to a JSON lines file for offline aggregation; every record is written with a single
+``write`` call on a file opened in append mode, so concurrent sessions and worker processes don't interleave lines.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+_write_lock = threading.Lock()
+
+class StageTimer:
+    def __init__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        # Times the body of the with-block as stage `name`; stages can repeat and are reported in order
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    def total_seconds(self):
+        return time.perf_counter() - self._start
+
+    def record(self, **extra):
+        # One timing record: start timestamp, total time so far and seconds per stage (summed for repeated stages)
+        stages = {}
+        for name, seconds in self.stages:
+            stages[name] = stages.get(name, 0.) + seconds
+        return {"timestamp": self.started_at, "total_seconds": self.total_seconds(), "stages": stages, **extra}
+
+def append_jsonl(path, record):
+    line = json.dumps(record, separators=(",", ":")) + "\n"
+    with _write_lock, open(path, "a") as f:
+        f.write(line)
@@ -0,0 +1,93 @@
+import io
+
+import streamlit as st
+import numpy as np
+
+from one_click_looping.portfolio import POSITION_FIELDS, Portfolio
+
+# Same bounded stage caches as the calculator page
+STAGE_CACHE_MAX_ENTRIES = 256
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+def portfolio_stage(csv_bytes):
+    return Portfolio.from_csv(io.StringIO(csv_bytes.decode("utf-8-sig")))
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+def positions_table_stage(csv_bytes, price_move):
+    import pandas as pd
+
+    portfolio = portfolio_stage(csv_bytes)
+    results = portfolio.evaluate(price_move)
+    c = portfolio.columns
+    return pd.DataFrame({
+        "Pair": [f"{coll}/{loan}" for coll, loan in zip(portfolio.collateral_token_name, portfolio.loan_token_name)],
+        "Amount": c["user_init_coll_amount"],
+        "Value (USD)": portfolio.initial_value_usd(),
+        "LTV (%)": c["ltv"] * 100,
+        "APR (%)": c["apr"] * 100,
+        "Tenor (days)": c["tenor"],
+        "Leverage": results["leverage"],
+        "RoI (%)": results["roi"] * 100,
+        "Break-even (%)": results["break_even_price_change"] * 100,
+        "Total Loss (%)": results["total_loss_price_change"] * 100,
+    })
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+def shock_stage(csv_bytes, shocks):
+    return portfolio_stage(csv_bytes).shock_pnl(np.array(shocks))
+
+@st.cache_data(max_entries=STAGE_CACHE_MAX_ENTRIES, show_spinner=False)
+def joint_move_stage(csv_bytes, moving_tokens, price_move_range):
+    # Portfolio PnL when all moving tokens change by the same relative amount, the others stay flat
+    portfolio = portfolio_stage(csv_bytes)
+    price_moves = np.linspace(price_move_range[0], price_move_range[1], 101) / 100
+    shocks = np.outer(price_moves, np.isin(portfolio.tokens, moving_tokens))
+    _, total_pnl = portfolio.shock_pnl(shocks)
+    return price_moves, total_pnl
+
+st.title("Looping Portfolio")
+st.write(f"""
+Upload a CSV with one looping position per row to evaluate your whole book at once. It needs the columns `collateral_token_name` and `loan_token_name`, plus any of `{"`, `".join(POSITION_FIELDS)}`. Missing numeric columns take the defaults of the calculator.""")
+
+uploaded_file = st.file_uploader("Portfolio CSV", type="csv")
+if uploaded_file is None:
+    st.stop()
+
+csv_bytes = uploaded_file.getvalue()
+try:
+    portfolio = portfolio_stage(csv_bytes)
+except (ValueError, KeyError) as e:
+    st.error(f"Can't read the portfolio: {e}")
+    st.stop()
+
+st.write("""### Positions""")
+price_move = st.number_input("Price change of every collateral token", min_value=-1.0, max_value=10.0, value=0.05, format="%.4f",
+                             help="Relative price change against the loan token over each position's tenor. E.g., enter 0.05 for +5%.")
+df = positions_table_stage(csv_bytes, price_move)
+initial_value = df["Value (USD)"].sum()
+col1, col2, col3 = st.columns(3)
+col1.metric("Positions", f"{len(portfolio):,}")
+col2.metric("Initial Value", f"${initial_value:,.2f}")
+col3.metric("Portfolio RoI", f"{(df['Value (USD)'] * df['RoI (%)']).sum() / initial_value:,.2f}%")
+st.dataframe(df.style.format({
+    "Amount": "{:,.2f}", "Value (USD)": "${:,.2f}", "LTV (%)": "{:.2f}%", "APR (%)": "{:.2f}%", "Tenor (days)": "{:.0f}", "Leverage": "{:.2f}x",
+    "RoI (%)": "{:+.2f}%", "Break-even (%)": "{:+.2f}%", "Total Loss (%)": "{:+.2f}%",
+}, na_rep="-"), use_container_width=True)
+
+st.write("""### Joint Price Shocks""")
+st.write("""
+Shock the USD price of every token in your book at the same time. Collateral and loan token prices both move, and every position is closed with the usual repay-or-default rule.""")
+shock_columns = st.columns(min(len(portfolio.tokens), 4))
+shocks = [
+    shock_columns[i % len(shock_columns)].number_input(f"{token} price change", min_value=-1.0, max_value=10.0, value=0.0, format="%.4f", key=f"shock_{token}")
+    for i, token in enumerate(portfolio.tokens)
+]
+pnl, total_pnl = shock_stage(csv_bytes, tuple(shocks))
+st.metric("Portfolio PnL", f"${total_pnl[0]:,.2f}", f"{total_pnl[0] / initial_value * 100:+.2f}%")
+st.dataframe({"Pair": df["Pair"], "PnL (USD)": [f"${value:,.2f}" for value in pnl[0]]}, use_container_width=True)
+
+collateral_tokens = sorted(set(portfolio.collateral_token_name))
+moving_tokens = st.multiselect("Tokens moving together", list(portfolio.tokens), default=collateral_tokens)
+price_move_range = st.slider("Price change range", min_value=-100., max_value=100., value=(-50., 50.), format="%.0f%%")
+price_moves, joint_pnl = joint_move_stage(csv_bytes, tuple(moving_tokens), price_move_range)
+st.line_chart({"Price Change (%)": price_moves * 100, "Portfolio PnL (USD)": joint_pnl}, x="Price Change (%)", y="Portfolio PnL (USD)")
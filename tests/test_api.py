@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip("tornado")
+
+from tornado.testing import AsyncHTTPTestCase
+
+from one_click_looping import api
+from one_click_looping.api import MAX_ROI_CURVE_POINTS, PARAM_DEFAULTS, RequestBatcher, _json_values, evaluate_requests, make_app, parse_params
+from one_click_looping.engine import evaluate_scenarios
+
+def test_parse_params_defaults_and_types():
+    params = parse_params({"ltv": "0.8", "tenor": "14", "unrelated": "x"})
+    assert params["ltv"] == 0.8 and params["tenor"] == 14 and isinstance(params["tenor"], int)
+    assert "unrelated" not in params
+    assert params["apr"] == PARAM_DEFAULTS["apr"]
+    # Whole numbers may be given as floats
+    assert parse_params({"tenor": 14.0, "gas_used": "1e6"})["tenor"] == 14
+    assert parse_params({"gas_used": "1e6"})["gas_used"] == 1_000_000
+
+@pytest.mark.parametrize("raw", [
+    [],
+    {"ltv": "abc"},
+    {"ltv": 0}, {"ltv": 1}, {"ltv": 1.5},
+    {"upfront_fee": -0.01}, {"myso_fee": 1}, {"dex_slippage": 1.2}, {"dex_swap_fee": -1},
+    {"current_price_coll_token": 0}, {"current_price_loan_token": -1}, {"user_init_coll_amount": 0},
+    {"apr": "inf"}, {"price_move_to": "nan"},
+    {"tenor": 1e999}, {"tenor": 10**400}, {"roi_curve_points": float("inf")}, {"gas_used": "-inf"},
+    {"tenor": 7.9}, {"tenor": "7.5"}, {"roi_curve_points": 10.5},
+    {"tenor": 0}, {"tenor": -7}, {"apr": -0.1}, {"gas_used": -1}, {"gas_price": -1}, {"eth_price": -0.3},
+    {"roi_curve_points": 1}, {"roi_curve_points": MAX_ROI_CURVE_POINTS + 1},
+    {"liquidity_model": "unknown"},
+    {"liquidity_model": "concentrated", "liquidity_ticks_path": "/etc/passwd"},
+])
+def test_parse_params_rejects_invalid_values(raw):
+    with pytest.raises(ValueError):
+        parse_params(raw)
+
+def test_json_values_maps_non_finite_values_to_none():
+    assert _json_values(np.array([1.5, np.nan, np.inf, -np.inf])) == [1.5, None, None, None]
+    assert _json_values(np.array([True, False])) == [True, False]
+
+def test_evaluate_requests_matches_engine():
+    param_sets = [parse_params({"ltv": 0.9, "roi_curve_points": 5}), parse_params({"ltv": 0.5, "liquidity_model": "constant_product", "pool_tvl": 1e5})]
+    results = evaluate_requests(param_sets)
+    assert len(results) == 2 and len(results[0]["roi_curve"]["roi"]) == 5
+    params = param_sets[0]
+    expected = evaluate_scenarios(
+        params["current_price_coll_token"], params["current_price_loan_token"], params["user_init_coll_amount"], params["ltv"], params["apr"], params["upfront_fee"], params["tenor"],
+        params["myso_fee"], params["dex_slippage"], params["dex_swap_fee"], results[0]["gas_usd_cost"], params["expected_price_move_coll_token"]
+    )
+    assert results[0]["close_position"]["roi"] == pytest.approx(float(expected["roi"]))
+    assert results[0]["break_even_price_change"] == pytest.approx(float(expected["break_even_price_change"]))
+    # The curve's end points are the page's price range, in percent
+    assert results[0]["roi_curve"]["price_change"] == pytest.approx([-5., -1.25, 2.5, 6.25, 10.])
+
+def test_evaluate_requests_output_is_strict_json():
+    # A price change of -100% leaves the collateral worthless, and no price reaches break-even without proceeds
+    results = evaluate_requests([parse_params({"price_move_from": -100, "price_move_to": 0, "expected_price_move_coll_token": -1, "liquidity_model": liquidity_model}) for liquidity_model in ("flat", "constant_product")])
+    json.dumps(results, allow_nan=False)
+
+def test_batcher_isolates_failing_requests(monkeypatch):
+    def evaluate_requests_failing_on_tenor_13(param_sets, surfaces=()):
+        if any(params["tenor"] == 13 for params in param_sets):
+            raise RuntimeError("tenor 13")
+        return evaluate_requests(param_sets, surfaces)
+
+    monkeypatch.setattr(api, "evaluate_requests", evaluate_requests_failing_on_tenor_13)
+
+    async def submit():
+        batcher = RequestBatcher(window=0.01)
+        return await asyncio.gather(*(batcher.evaluate([parse_params({"tenor": tenor})]) for tenor in (7, 13, 14)), return_exceptions=True)
+
+    good, bad, other = asyncio.run(submit())
+    assert isinstance(bad, RuntimeError)
+    assert good[0]["params"]["tenor"] == 7 and other[0]["params"]["tenor"] == 14
+
+class EvaluateHandlerTest(AsyncHTTPTestCase):
+    def get_app(self):
+        return make_app(batch_window=0.001)
+
+    def test_post_object_and_list(self):
+        response = self.fetch("/evaluate", method="POST", body=json.dumps({"ltv": 0.9, "roi_curve_points": 3}))
+        assert response.code == 200
+        assert len(json.loads(response.body)["roi_curve"]["roi"]) == 3
+        response = self.fetch("/evaluate", method="POST", body=json.dumps([{"ltv": 0.9}, {"ltv": 0.8}]))
+        assert [result["params"]["ltv"] for result in json.loads(response.body)] == [0.9, 0.8]
+
+    def test_get_query_string(self):
+        response = self.fetch("/evaluate?ltv=0.85&tenor=14")
+        assert response.code == 200
+        assert json.loads(response.body)["params"]["tenor"] == 14
+
+    def test_invalid_requests_are_rejected(self):
+        for body in ("not json", json.dumps({"ltv": 2}), json.dumps({"dex_swap_fee": 1}), json.dumps([{"roi_curve_points": MAX_ROI_CURVE_POINTS}] * 11),
+                     '{"tenor": 1e999}', '{"roi_curve_points": Infinity}', '{"tenor": 7.9}'):
+            assert self.fetch("/evaluate", method="POST", body=body).code == 400
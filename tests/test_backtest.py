@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from one_click_looping.backtest import SECONDS_PER_DAY, convert_price_csv, load_price_series, prices_at, run_backtest, summarize
+from one_click_looping.engine import DEFAULT_SCENARIO, evaluate_scenarios
+
+def _convert(tmp_path, text, chunk_size=2):
+    path = tmp_path / "prices.csv"
+    path.write_text(text)
+    prefix = str(tmp_path / "prices")
+    return convert_price_csv(str(path), prefix, chunk_size=chunk_size), load_price_series(prefix)
+
+def test_convert_price_csv(tmp_path):
+    n, (times, prices) = _convert(tmp_path, "timestamp,price\n1700000000,0.5\n1700000100,0.6\n1700000200,0.7\n")
+    assert n == 3
+    np.testing.assert_array_equal(times, [1700000000, 1700000100, 1700000200])
+    np.testing.assert_array_equal(prices, [0.5, 0.6, 0.7])
+
+def test_convert_price_csv_iso_timestamps(tmp_path):
+    _, (times, _) = _convert(tmp_path, "timestamp,price\n2023-11-14T22:13:20,0.5\n2023-11-14T22:15:00,0.6\n")
+    np.testing.assert_array_equal(times, [1700000000, 1700000100])
+
+def test_convert_price_csv_skips_blank_lines(tmp_path):
+    n, (times, prices) = _convert(tmp_path, "timestamp,price\n\n1700000000,0.5\n   \n1700000100,0.6\n\n\n1700000200,0.7\n\n")
+    assert n == 3
+    np.testing.assert_array_equal(times, [1700000000, 1700000100, 1700000200])
+    np.testing.assert_array_equal(prices, [0.5, 0.6, 0.7])
+
+def test_convert_price_csv_without_rows(tmp_path):
+    n, (times, prices) = _convert(tmp_path, "timestamp,price\n\n")
+    assert n == 0 and len(times) == len(prices) == 0
+
+@pytest.mark.parametrize("text", ["time,price\n1,2\n", "timestamp,price\n200,1\n100,1\n"])
+def test_convert_price_csv_rejects_bad_files(tmp_path, text):
+    with pytest.raises(ValueError):
+        _convert(tmp_path, text)
+
+def test_prices_at_takes_the_last_observation():
+    series = (np.array([100, 200, 300]), np.array([1., 2., 3.]))
+    np.testing.assert_array_equal(prices_at(series, np.array([50, 100, 250, 400])), [np.nan, 1., 2., 3.])
+
+def _flat_series(price=0.38, days=30):
+    times = np.arange(0, days * SECONDS_PER_DAY + 1, SECONDS_PER_DAY)
+    return times, np.full(len(times), price)
+
+def test_run_backtest_flat_prices():
+    series = _flat_series()
+    results = run_backtest(series, tenor=7, chunk_size=5)
+    assert len(results["roi"]) == 24
+    np.testing.assert_array_equal(results["exit_time"] - results["entry_time"], 7 * SECONDS_PER_DAY)
+    # Without price changes every entry pays the same fees and interest
+    np.testing.assert_allclose(results["roi"], results["roi"][0])
+    assert summarize(results)["hit_rate"] == float(results["roi"][0] > 0)
+
+def test_run_backtest_roi_is_net_of_gas():
+    series = _flat_series()
+    initial_value_usd = DEFAULT_SCENARIO["user_init_coll_amount"] * 0.38
+    # Gas is paid in USD, so it's converted into loan tokens at the loan token's exit price
+    for loan_price in (1., 2.):
+        expected = evaluate_scenarios(**{**DEFAULT_SCENARIO, "current_price_coll_token": 0.38, "current_price_loan_token": loan_price, "tenor": 7, "price_move": 0.})
+        for gas_usd_cost in (0., 2.):
+            results = run_backtest(series, _flat_series(price=loan_price), tenor=7, gas_usd_cost=gas_usd_cost)
+            np.testing.assert_allclose(results["roi"], expected["roi"] - gas_usd_cost / initial_value_usd)
+
+def test_run_backtest_defaults_when_gas_exceeds_the_proceeds():
+    results = run_backtest(_flat_series(), tenor=7, gas_usd_cost=1e6)
+    assert not results["rational_to_repay"].any()
+    np.testing.assert_array_equal(results["roi"], -1.)
+
+@pytest.mark.parametrize("collateral_empty, loan_empty", [(True, False), (False, True), (True, True)])
+def test_run_backtest_on_empty_series(collateral_empty, loan_empty):
+    empty = (np.empty(0, dtype=np.int64), np.empty(0))
+    results = run_backtest(empty if collateral_empty else _flat_series(), empty if loan_empty else _flat_series(price=1.), tenor=7)
+    assert all(len(values) == 0 for values in results.values())
+    summary = summarize(results)
+    assert summary["entries"] == 0 and np.isnan(summary["mean_roi"]) and summary["worst"] == []
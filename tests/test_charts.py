@@ -0,0 +1,36 @@
+import json
+
+import numpy as np
+import pytest
+
+from one_click_looping.charts import figure_to_png, new_figure, roi_curve_vega_lite
+
+def test_figure_renders_to_png_without_pyplot():
+    pytest.importorskip("matplotlib")
+    import matplotlib._pylab_helpers
+
+    fig = new_figure(figsize=(4, 3))
+    ax = fig.subplots()
+    ax.plot([0, 1], [1, 0])
+    png = figure_to_png(fig, dpi=50)
+    assert png.startswith(b"\x89PNG")
+    # The figure is cleared and never registered with pyplot's figure manager
+    assert not fig.axes and not matplotlib._pylab_helpers.Gcf.get_all_fig_managers()
+
+def test_roi_curve_vega_lite():
+    rel_price_changes = np.linspace(-0.1, 0.1, 5)
+    data, spec = roi_curve_vega_lite(rel_price_changes, rel_price_changes * 10, 0.5, -8., 1.5, (-10., 10.), "WMNT", "USDT")
+    np.testing.assert_allclose(data["price_change"], [-10, -5, 0, 5, 10])
+    np.testing.assert_allclose(data["profit"], [0, 0, 0, 50, 100])
+    np.testing.assert_allclose(data["loss"], [-100, -50, 0, 0, 0])
+    assert spec["title"] == "Your RoI for looping on WMNT/USDT"
+    # Thresholds are in percent; break-even, total loss and the flat price are marked, and the spec is plain JSON
+    markers = spec["layer"][-1]["data"]["values"]
+    assert [marker["color"] for marker in markers] == ["green", "red", "darkblue"]
+    assert markers[0]["label"] == "If price +0.50%: Break-even"
+    json.dumps(spec, allow_nan=False)
+
+def test_roi_curve_vega_lite_skips_markers_outside_the_range():
+    rel_price_changes = np.linspace(0.01, 0.1, 5)
+    _, spec = roi_curve_vega_lite(rel_price_changes, rel_price_changes, np.nan, np.nan, 0., (1., 10.), "WMNT", "USDT")
+    assert len(spec["layer"]) == 3
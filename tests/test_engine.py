@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from one_click_looping.engine import DEFAULT_SCENARIO, calc_price_change_for_roi, calc_roi, calculate_close_position, calculate_open_position, calculate_sensitivities, calculate_thresholds, evaluate_scenarios, find_flashloan_amount
+
+SCENARIOS = [
+    # user_init_coll_amount, cross_price, ltv, dex_slippage, dex_swap_fee, upfront_fee
+    (100., 0.38, 0.92, 0.0008, 0.0005, 0.),
+    (1., 2000., 0.5, 0.003, 0.003, 0.01),
+    (12345., 1., 0.99, 0., 0., 0.),
+    (5., 0.001, 0.1, 0.05, 0.01, 0.2),
+]
+
+def _open_position(**overrides):
+    scenario = {name: DEFAULT_SCENARIO[name] for name in ("current_price_coll_token", "current_price_loan_token", "user_init_coll_amount", "ltv", "apr", "upfront_fee", "tenor", "myso_fee", "dex_slippage", "dex_swap_fee")}
+    scenario.update(overrides)
+    return calculate_open_position(**scenario)
+
+@pytest.mark.parametrize("scenario", SCENARIOS)
+def test_closed_form_flashloan_solves_the_fixed_point(scenario):
+    user_init_coll_amount, cross_price, ltv, dex_slippage, dex_swap_fee, upfront_fee = scenario
+    flashloan = find_flashloan_amount(*scenario)
+    # The borrowable amount against the combined pledge is a contraction in F, so plain iteration converges to it
+    numeric = 0.
+    for _ in range(10000):
+        numeric = (user_init_coll_amount + numeric / cross_price * (1 - dex_slippage - dex_swap_fee)) * (1 - upfront_fee) * cross_price * ltv
+    assert flashloan == pytest.approx(numeric, rel=1e-9)
+
+def test_closed_form_flashloan_works_element_wise():
+    columns = [np.array(column) for column in zip(*SCENARIOS)]
+    np.testing.assert_allclose(find_flashloan_amount(*columns), [find_flashloan_amount(*scenario) for scenario in SCENARIOS])
+
+@pytest.mark.parametrize("scenario", SCENARIOS)
+def test_closed_form_flashloan_matches_the_previous_optimizer(scenario):
+    # The page used to minimize the squared difference between the flashloan and what it can borrow with scipy
+    minimize = pytest.importorskip("scipy.optimize").minimize
+    user_init_coll_amount, cross_price, ltv, dex_slippage, dex_swap_fee, upfront_fee = scenario
+
+    def objective(flashloan_amount):
+        received_from_dex = flashloan_amount / cross_price * (1 - dex_slippage - dex_swap_fee)
+        combined_pledge = user_init_coll_amount + received_from_dex
+        flashloan_amount_act = (combined_pledge - combined_pledge * upfront_fee) * cross_price * ltv
+        return (flashloan_amount - flashloan_amount_act)**2
+
+    result = minimize(objective, x0=[user_init_coll_amount * cross_price / (1 - ltv)])
+    flashloan = find_flashloan_amount(*scenario)
+    # The closed form is never worse than the optimizer, which stalls near its start on badly scaled scenarios
+    assert objective(flashloan) <= objective(result["x"][0])
+    if objective(result["x"][0]) < 1e-6:
+        assert flashloan == pytest.approx(result["x"][0], rel=1e-4)
+
+def test_default_scenario_regression():
+    # Values of the page's default scenario, as computed by the optimizer and bisection based page
+    results = evaluate_scenarios(**DEFAULT_SCENARIO)
+    assert results["flashloan_amount"] == pytest.approx(430.563082, rel=1e-6)
+    assert results["owed_repayment"] == pytest.approx(431.553967, rel=1e-6)
+    assert results["final_pledge_and_reclaimable"] == pytest.approx(1230.602493, rel=1e-6)
+    assert results["roi"] == pytest.approx(0.547845, rel=1e-5)
+    assert results["break_even_price_change"] == pytest.approx(0.0054236, rel=1e-4)
+    assert results["total_loss_price_change"] == pytest.approx(-0.0759432, rel=1e-5)
+
+@pytest.mark.parametrize("target_roi", [0., -1., 0.5])
+def test_closed_form_price_change_matches_bisection(target_roi):
+    s = DEFAULT_SCENARIO
+    _, owed_repayment, _, _, _, _, _, final_pledge_and_reclaimable = _open_position()
+    args = (s["current_price_coll_token"], s["current_price_loan_token"], s["user_init_coll_amount"], final_pledge_and_reclaimable, owed_repayment, s["dex_slippage"], s["dex_swap_fee"], s["gas_usd_cost"])
+
+    def roi_at(price_change):
+        _, _, _, final_amount_after_close, _, _ = calculate_close_position(
+            final_pledge_and_reclaimable, owed_repayment, s["current_price_coll_token"] * (1 + price_change), s["current_price_loan_token"],
+            s["dex_slippage"], s["dex_swap_fee"], s["gas_usd_cost"], always_repay=True
+        )
+        return calc_roi(final_amount_after_close, s["current_price_loan_token"], s["user_init_coll_amount"], s["current_price_coll_token"])
+
+    low, high = -1., 10.
+    for _ in range(200):
+        mid = (low + high) / 2
+        low, high = (mid, high) if roi_at(mid) < target_roi else (low, mid)
+    assert calc_price_change_for_roi(target_roi, *args) == pytest.approx(high, abs=1e-9)
+
+def test_unreachable_thresholds_are_nan():
+    # Without any proceeds to sell no price change reaches break-even
+    break_even, total_loss = calculate_thresholds(1., 1., 100., np.array([0.]), 50., 0.001, 0.001, 0.)
+    assert np.isnan(break_even) and np.isnan(total_loss)
+
+def test_evaluate_scenarios_matches_scalar_calls():
+    s = dict(DEFAULT_SCENARIO)
+    ltvs = np.array([0.5, 0.8, 0.92])
+    batch = evaluate_scenarios(**{**s, "ltv": ltvs})
+    for i, ltv in enumerate(ltvs):
+        single = evaluate_scenarios(**{**s, "ltv": ltv})
+        for name, values in batch.items():
+            np.testing.assert_allclose(values[i], single[name])
+
+SENSITIVITY_INPUTS = {"delta": "price_move", "apr": "apr", "tenor": "tenor", "ltv": "ltv", "upfront_fee": "upfront_fee", "myso_fee": "myso_fee",
+                      "dex_slippage": "dex_slippage", "dex_swap_fee": "dex_swap_fee", "gas_usd_cost": "gas_usd_cost"}
+
+@pytest.mark.parametrize("overrides", [{}, {"upfront_fee": 0.01, "apr": 0.3, "tenor": 30, "ltv": 0.7}, {"price_move": -0.5}])
+def test_sensitivities_match_finite_differences(overrides):
+    # Central differences of the engine's RoI net of gas, also at a price drop that defaults, where only gas matters
+    s = {**DEFAULT_SCENARIO, **overrides}
+    sensitivities = calculate_sensitivities(**s)
+    assert sensitivities["roi_net_of_gas"] == pytest.approx(float(evaluate_scenarios(**s)["roi_net_of_gas"]))
+    for name, field in SENSITIVITY_INPUTS.items():
+        h = 1e-6 * max(abs(s[field]), 1e-3)
+        up, down = evaluate_scenarios(**{**s, field: s[field] + h}), evaluate_scenarios(**{**s, field: s[field] - h})
+        assert sensitivities[name] == pytest.approx(float(up["roi_net_of_gas"] - down["roi_net_of_gas"]) / (2 * h), rel=1e-5, abs=1e-7), name
+    assert sensitivities["gamma"] == 0
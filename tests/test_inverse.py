@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from one_click_looping.engine import DEFAULT_SCENARIO, evaluate_scenarios
+from one_click_looping.inverse import solve_input
+
+@pytest.mark.parametrize("name", ["apr", "tenor", "upfront_fee", "ltv"])
+@pytest.mark.parametrize("target_roi, net_of_gas, price_move", [(0.3, False, 0.05), (0.3, True, 0.05), (0.05, True, 0.01), (-0.1, False, 0.), (-0.5, False, -0.03)])
+def test_solved_input_reaches_the_target_roi(name, target_roi, net_of_gas, price_move):
+    # Feeding the solution back through the forward model gives the target RoI at the target's price move
+    value = solve_input(name, target_roi, net_of_gas=net_of_gas, price_move=price_move)
+    assert np.isfinite(value)
+    results = evaluate_scenarios(**{**DEFAULT_SCENARIO, name: value, "price_move": price_move})
+    assert results["rational_to_repay"]
+    assert float(results["roi_net_of_gas" if net_of_gas else "roi"]) == pytest.approx(target_roi, abs=1e-9)
+
+def test_solved_ltv_reaches_the_target_leverage():
+    ltv = solve_input("leverage", 5.)
+    assert evaluate_scenarios(**{**DEFAULT_SCENARIO, "ltv": ltv})["leverage"] == pytest.approx(5.)
+
+@pytest.mark.parametrize("name, target", [
+    ("apr", 5.),  # would need a negative APR
+    ("tenor", 5.),  # would need a negative tenor
+    ("upfront_fee", 5.),  # would need a negative fee
+    ("ltv", 100.),  # would need an LTV above 100%
+    ("ltv", 0.),  # at +5%, even the lowest LTV makes a profit
+    ("apr", -1.), ("ltv", -1.5),  # every default yields -100% RoI
+    ("leverage", 0.5), ("leverage", 1e6),
+])
+def test_unreachable_targets_are_nan(name, target):
+    assert np.isnan(solve_input(name, target))
+
+def test_solves_element_wise():
+    targets = np.array([0.3, 5., 0.])
+    aprs = solve_input("apr", targets, price_move=np.array([0.05, 0.05, 0.1]))
+    assert np.isnan(aprs[1])
+    results = evaluate_scenarios(**{**DEFAULT_SCENARIO, "apr": aprs[[0, 2]], "price_move": np.array([0.05, 0.1])})
+    np.testing.assert_allclose(results["roi"], targets[[0, 2]], atol=1e-9)
+
+def test_rejects_unknown_inputs():
+    with pytest.raises(ValueError):
+        solve_input("gas_usd_cost", 0.1)
+    with pytest.raises(ValueError):
+        solve_input("apr", 0.1, leverage=3)
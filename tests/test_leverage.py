@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from one_click_looping.engine import DEFAULT_SCENARIO, evaluate_scenarios
+from one_click_looping.leverage import find_optimal_ltv, roi_surface
+
+SCENARIO = {name: value for name, value in DEFAULT_SCENARIO.items() if name not in ("ltv", "price_move")}
+LTVS = np.linspace(0.1, 0.95, 18)
+PRICE_MOVES = np.linspace(-0.2, 0.2, 9)
+
+def test_roi_surface_matches_the_engine():
+    rois, total_loss_price_change = roi_surface(LTVS, PRICE_MOVES, **SCENARIO)
+    assert rois.shape == (len(LTVS), len(PRICE_MOVES))
+    for j, price_move in enumerate(PRICE_MOVES):
+        expected = evaluate_scenarios(**SCENARIO, ltv=LTVS, price_move=price_move)
+        np.testing.assert_allclose(rois[:, j], expected["roi"])
+        np.testing.assert_allclose(total_loss_price_change, expected["total_loss_price_change"])
+
+@pytest.mark.parametrize("target_price_move", [-0.1, 0., 0.15])
+def test_optimal_ltv_at_a_target_is_the_best_surface_point(target_price_move):
+    rois, _ = roi_surface(LTVS, [target_price_move], **SCENARIO)
+    result = find_optimal_ltv(LTVS, PRICE_MOVES, **SCENARIO, target_price_move=target_price_move)
+    assert result["ltv"] == LTVS[np.argmax(rois[:, 0])]
+    assert result["objective"] == pytest.approx(rois[:, 0].max())
+
+def test_optimal_ltv_maximizes_the_weighted_roi():
+    weights = np.exp(-PRICE_MOVES**2 / 0.01)
+    rois, _ = roi_surface(LTVS, PRICE_MOVES, **SCENARIO)
+    result = find_optimal_ltv(LTVS, PRICE_MOVES, **SCENARIO, weights=weights)
+    np.testing.assert_allclose(result["objectives"], rois @ weights / weights.sum())
+    assert result["ltv"] == LTVS[np.argmax(result["objectives"])]
+
+def test_optimal_ltv_respects_the_total_loss_limit():
+    unconstrained = find_optimal_ltv(LTVS, PRICE_MOVES, **SCENARIO, target_price_move=0.1)
+    constrained = find_optimal_ltv(LTVS, PRICE_MOVES, **SCENARIO, target_price_move=0.1, max_total_loss_price_change=-0.2)
+    assert constrained["ltv"] < unconstrained["ltv"]
+    assert constrained["total_loss_price_change"] <= -0.2
+    # Higher LTVs earn more on a rising price, but a smaller drop wipes them out
+    assert not constrained["feasible"][LTVS > constrained["ltv"]].any()
+    infeasible = find_optimal_ltv(LTVS, PRICE_MOVES, **SCENARIO, target_price_move=0.1, max_total_loss_price_change=-1.)
+    assert np.isnan(infeasible["ltv"]) and np.isnan(infeasible["objective"])
@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pytest
+
+from one_click_looping.engine import calculate_open_position
+from one_click_looping.liquidity import ConcentratedLiquidity, ConstantProductPool, resolve_ticks_path, solve_flashloan_amount
+
+POOLS = {
+    "constant_product": ConstantProductPool.from_tvl(250_000., 0.38, 1.),
+    "concentrated": ConcentratedLiquidity([0.2, 0.3, 0.35, 0.4, 0.45, 0.6], [1e5, 4e5, 9e5, 6e5, 2e5]),
+}
+
+def _bisect(f, low, high, steps=200):
+    # Root of an increasing function between low and high
+    for _ in range(steps):
+        mid = (low + high) / 2
+        low, high = (mid, high) if f(mid) < 0 else (low, mid)
+    return (low + high) / 2
+
+@pytest.mark.parametrize("pool", POOLS.values(), ids=POOLS)
+@pytest.mark.parametrize("user_init_coll_amount, ltv", [(100., 0.92), (50_000., 0.8), (1., 0.5)])
+def test_newton_flashloan_matches_bisection(pool, user_init_coll_amount, ltv):
+    cross_price, dex_swap_fee, upfront_fee = 0.38, 0.0005, 0.001
+    borrowable_share = (1 - upfront_fee) * ltv
+
+    def residual(flashloan):
+        coll_out, _ = pool.collateral_out(flashloan * (1 - dex_swap_fee), cross_price)
+        return flashloan - (user_init_coll_amount + coll_out) * borrowable_share * cross_price
+
+    # The solution without price impact is an upper bound
+    upper = user_init_coll_amount * cross_price * borrowable_share / (1 - (1 - dex_swap_fee) * borrowable_share)
+    expected = _bisect(residual, 0., upper)
+    assert solve_flashloan_amount(pool, user_init_coll_amount, cross_price, ltv, dex_swap_fee, upfront_fee) == pytest.approx(expected, rel=1e-9)
+
+@pytest.mark.parametrize("pool", POOLS.values(), ids=POOLS)
+def test_newton_flashloan_works_element_wise(pool):
+    amounts = np.array([1., 100., 50_000.])
+    batch = solve_flashloan_amount(pool, amounts, 0.38, 0.9, 0.0005, 0.)
+    np.testing.assert_allclose(batch, [solve_flashloan_amount(pool, amount, 0.38, 0.9, 0.0005, 0.) for amount in amounts], rtol=1e-9)
+
+@pytest.mark.parametrize("pool", POOLS.values(), ids=POOLS)
+def test_price_for_loan_out_inverts_loan_out(pool):
+    coll_in = np.array([10., 1000., 100_000.])
+    prices = np.array([0.3, 0.38, 0.5])
+    loan_out = pool.loan_out(coll_in, prices)
+    np.testing.assert_allclose(pool.loan_out(coll_in, pool.price_for_loan_out(coll_in, loan_out)), loan_out, rtol=1e-9)
+
+def test_price_impact_grows_with_trade_size():
+    pool = POOLS["constant_product"]
+    coll_in = np.array([1., 1_000., 100_000.])
+    assert np.all(np.diff(pool.loan_out(coll_in, 0.38) / coll_in) < 0)
+
+def test_constant_product_reserves_stay_finite_at_zero_price():
+    pool = POOLS["constant_product"]
+    with np.errstate(all="raise"):
+        loan_out = pool.loan_out(np.array([1., 100.]), np.array([0., 0.]))
+        coll_out, marginal = pool.collateral_out(10., 0.)
+    assert np.all(np.isfinite(loan_out)) and np.all(loan_out < 1e-100)
+    assert np.isfinite(coll_out) and np.isfinite(marginal)
+
+def test_open_position_without_price_impact_matches_flat_model():
+    # A huge pool has no price impact, so it matches the flat model without slippage
+    pool = ConstantProductPool.from_tvl(1e15, 0.38, 1.)
+    flat = calculate_open_position(0.38, 1., 100., 0.92, 0.12, 0., 7, 0.0008, 0., 0.0005)
+    pooled = calculate_open_position(0.38, 1., 100., 0.92, 0.12, 0., 7, 0.0008, 0., 0.0005, liquidity=pool)
+    np.testing.assert_allclose(pooled, flat, rtol=1e-6)
+
+def test_ticks_csv(tmp_path):
+    path = tmp_path / "ticks.csv"
+    path.write_text("tick,liquidity_net\n-100,500\n0,250\n100,-750\n")
+    pool = ConcentratedLiquidity.from_ticks_csv(str(path))
+    np.testing.assert_allclose(pool.price_bounds, 1.0001**np.array([-100, 0, 100]))
+    np.testing.assert_allclose(pool.liquidities, [500, 750])
+
+def test_resolve_ticks_path(tmp_path):
+    (tmp_path / "ticks.csv").write_text("")
+    assert resolve_ticks_path("ticks.csv", str(tmp_path)) == os.path.realpath(tmp_path / "ticks.csv")
+    for path in ("../ticks.csv", "/etc/passwd", ""):
+        with pytest.raises(ValueError):
+            resolve_ticks_path(path, str(tmp_path))
+    with pytest.raises(ValueError):
+        resolve_ticks_path("ticks.csv", None)
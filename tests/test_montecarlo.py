@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from one_click_looping.engine import DEFAULT_SCENARIO, calc_roi, calculate_close_position, calculate_open_position
+from one_click_looping.montecarlo import _FINE_BINS, simulate_price_moves, simulate_price_paths, simulate_roi_distribution
+
+SCENARIO = {name: value for name, value in DEFAULT_SCENARIO.items() if name != "price_move"}
+VOLATILITY, DRIFT = 0.8, 0.1
+
+def _brute_force_rois(price_moves):
+    # RoI of every path straight from the engine, without the histogram
+    s = SCENARIO
+    _, owed_repayment, _, _, _, _, _, final_pledge_and_reclaimable = calculate_open_position(
+        s["current_price_coll_token"], s["current_price_loan_token"], s["user_init_coll_amount"], s["ltv"], s["apr"], s["upfront_fee"], s["tenor"], s["myso_fee"], s["dex_slippage"], s["dex_swap_fee"]
+    )
+    _, _, _, final_amount_after_close, rational_to_repay, _ = calculate_close_position(
+        final_pledge_and_reclaimable, owed_repayment, s["current_price_coll_token"] * (1 + price_moves), s["current_price_loan_token"], s["dex_slippage"], s["dex_swap_fee"], s["gas_usd_cost"]
+    )
+    return calc_roi(final_amount_after_close, s["current_price_loan_token"], s["user_init_coll_amount"], s["current_price_coll_token"]), rational_to_repay
+
+def test_price_moves_follow_the_gbm():
+    n, tenor = 200_000, 30
+    log_returns = np.log1p(simulate_price_moves(np.random.default_rng(1), n, tenor, VOLATILITY, DRIFT))
+    t = tenor / 365
+    assert log_returns.mean() == pytest.approx((DRIFT - VOLATILITY**2 / 2) * t, abs=4 * VOLATILITY * np.sqrt(t / n))
+    assert log_returns.std() == pytest.approx(VOLATILITY * np.sqrt(t), rel=0.01)
+
+def test_price_paths_compound_single_periods():
+    paths = simulate_price_paths(np.random.default_rng(2), 100_000, 4, 7, VOLATILITY, DRIFT)
+    assert paths.shape == (100_000, 5) and np.all(paths[:, 0] == 1)
+    log_returns = np.diff(np.log(paths), axis=1)
+    np.testing.assert_allclose(log_returns.std(axis=0), VOLATILITY * np.sqrt(7 / 365), rtol=0.02)
+    # Periods are independent
+    assert abs(np.corrcoef(log_returns[:, 0], log_returns[:, 1])[0, 1]) < 0.02
+
+@pytest.mark.parametrize("var_level", [0.5, 0.95])
+def test_distribution_matches_brute_force_quantiles(var_level):
+    # A quarter of the paths default, so the 95% VaR sits on the point mass at -100% and the 50% VaR in the continuous part
+    n_paths = 50_000
+    results = simulate_roi_distribution(**SCENARIO, volatility=VOLATILITY, drift=DRIFT, n_paths=n_paths, chunk_size=n_paths, var_level=var_level, seed=3)
+    rois, rational_to_repay = _brute_force_rois(simulate_price_moves(np.random.default_rng(3), n_paths, SCENARIO["tenor"], VOLATILITY, DRIFT))
+    bin_width = results["histogram_bin_edges"][-1] - results["histogram_bin_edges"][0]
+    assert results["expected_roi"] == pytest.approx(rois.mean())
+    assert results["prob_total_loss"] == pytest.approx(np.mean(~rational_to_repay))
+    # VaR/CVaR are read from the fine histogram, so they are accurate to within a fine bin
+    var_roi = np.quantile(rois, 1 - var_level, method="inverted_cdf")
+    assert results["var"] == pytest.approx(-var_roi, abs=bin_width / _FINE_BINS)
+    assert results["cvar"] == pytest.approx(-np.sort(rois)[:int((1 - var_level) * n_paths)].mean(), abs=bin_width / _FINE_BINS)
+    assert results["histogram_counts"].sum() == n_paths
+    assert len(results["histogram_counts"]) == len(results["histogram_bin_edges"]) - 1 == 100
+
+def test_seed_handling():
+    kwargs = dict(SCENARIO, volatility=VOLATILITY, n_paths=10_000, chunk_size=3_000)
+    first, second = simulate_roi_distribution(**kwargs, seed=4), simulate_roi_distribution(**kwargs, seed=4)
+    for name, value in first.items():
+        np.testing.assert_array_equal(value, second[name])
+    # Chunks draw consecutively from one generator, so the chunk size doesn't change the paths
+    unchunked = simulate_roi_distribution(**{**kwargs, "chunk_size": 10_000}, seed=4)
+    np.testing.assert_array_equal(unchunked["histogram_counts"], first["histogram_counts"])
+    assert simulate_roi_distribution(**kwargs, seed=5)["expected_roi"] != first["expected_roi"]
@@ -0,0 +1,59 @@
+import io
+
+import numpy as np
+import pytest
+
+from one_click_looping.engine import DEFAULT_SCENARIO, evaluate_scenarios
+from one_click_looping.portfolio import POSITION_FIELDS, Portfolio
+
+PORTFOLIO_CSV = """collateral_token_name,loan_token_name,user_init_coll_amount,current_price_coll_token,current_price_loan_token,ltv,apr,tenor
+WMNT,USDT,100,0.38,1,0.92,0.12,7
+WETH,USDC,2,2400,1,0.8,0.08,30
+WMNT,USDC,500,0.38,1,0.5,0.1,14
+"""
+
+def test_single_position_matches_the_engine():
+    position = {name: DEFAULT_SCENARIO[name] for name in POSITION_FIELDS}
+    portfolio = Portfolio(["WMNT"], ["USDT"], **{name: [value] for name, value in position.items()})
+    results = portfolio.evaluate(price_move=0.05)
+    expected = evaluate_scenarios(**position, price_move=0.05)
+    for name, values in expected.items():
+        np.testing.assert_allclose(results[name], [values])
+    # Shocking only the collateral token is the engine's price move, and the PnL is the RoI on the initial value
+    pnl, total_pnl = portfolio.shock_pnl([[0., 0.05], [0., -0.5]])
+    assert list(portfolio.tokens) == ["USDT", "WMNT"]
+    assert pnl[0, 0] == total_pnl[0] == pytest.approx(expected["roi"] * position["user_init_coll_amount"] * position["current_price_coll_token"])
+    assert total_pnl[1] == pytest.approx(-position["user_init_coll_amount"] * position["current_price_coll_token"])
+
+def test_from_csv_fills_defaults_and_indexes_tokens():
+    portfolio = Portfolio.from_csv(io.StringIO(PORTFOLIO_CSV))
+    assert len(portfolio) == 3
+    np.testing.assert_array_equal(portfolio.columns["myso_fee"], DEFAULT_SCENARIO["myso_fee"])
+    np.testing.assert_array_equal(portfolio.columns["tenor"], [7, 30, 14])
+    assert list(portfolio.tokens) == ["USDC", "USDT", "WETH", "WMNT"]
+    np.testing.assert_array_equal(portfolio.tokens[portfolio.collateral_token_index], ["WMNT", "WETH", "WMNT"])
+    np.testing.assert_array_equal(portfolio.tokens[portfolio.loan_token_index], ["USDT", "USDC", "USDC"])
+    # Every position is evaluated like a scenario of its own
+    results = portfolio.evaluate()
+    for i in range(len(portfolio)):
+        single = evaluate_scenarios(**{name: values[i] for name, values in portfolio.columns.items()}, price_move=0.)
+        assert results["roi"][i] == pytest.approx(single["roi"])
+
+def test_loan_token_shocks_move_every_position_borrowing_it():
+    portfolio = Portfolio.from_csv(io.StringIO(PORTFOLIO_CSV))
+    shocks = np.zeros(len(portfolio.tokens))
+    shocks[list(portfolio.tokens).index("USDC")] = 0.1
+    pnl, _ = portfolio.shock_pnl(shocks)
+    unshocked, _ = portfolio.shock_pnl(np.zeros(len(portfolio.tokens)))
+    # A dearer loan token costs the positions borrowing it and leaves the others alone
+    assert pnl[0, 0] == unshocked[0, 0]
+    assert np.all(pnl[0, 1:] < unshocked[0, 1:])
+
+@pytest.mark.parametrize("text, message", [
+    ("collateral_token_name,loan_token_name\n", "no positions"),
+    ("collateral_token_name,ltv\nWMNT,0.9\n", "Missing position columns: loan_token_name"),
+    ("collateral_token_name,loan_token_name,leverage\nWMNT,USDT,3\n", "Unknown position columns: leverage"),
+])
+def test_from_csv_rejects_invalid_files(text, message):
+    with pytest.raises(ValueError, match=message):
+        Portfolio.from_csv(io.StringIO(text))
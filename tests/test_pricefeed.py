@@ -0,0 +1,122 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from one_click_looping.pricefeed import PriceFeed, PriceFeedPool, PriceStore, parse_price_updates, tail_jsonl_source, websocket_source
+
+def _wait_until(condition, timeout=5.):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def test_parse_price_updates():
+    assert parse_price_updates('{"symbol": "WMNT", "price": 0.38, "timestamp": 5}') == [("WMNT", 0.38, 5.)]
+    assert parse_price_updates('[{"symbol": "A", "price": "1"}, {"symbol": "B"}, 3]', received_at=7.) == [("A", 1., 7.)]
+    assert parse_price_updates("not json") == []
+
+def test_store_keeps_the_latest_prices():
+    store = PriceStore()
+    store.update_many([("A", 1., 1.), ("A", 2., 2.), ("B", 3., 2.)])
+    version, prices = store.snapshot()
+    assert version == 1 and prices == {"A": (2., 2.), "B": (3., 2.)}
+    assert store.wait_for_update(version, timeout=0.01) == version
+    threading.Timer(0.05, store.update, ("A", 4.)).start()
+    assert store.wait_for_update(version, timeout=5.) == 2
+    assert store.get("A")[0] == 4.
+
+def test_tail_source_follows_appends_and_truncation(tmp_path):
+    path = tmp_path / "prices.jsonl"
+    path.write_text(json.dumps({"symbol": "A", "price": 1.}) + "\n")
+    feed = PriceFeed(tail_jsonl_source(str(path), poll_interval=0.01)).start()
+    try:
+        assert _wait_until(lambda: feed.store.get("A") is not None)
+        assert feed.store.get("A")[0] == 1.
+        with open(path, "a") as f:
+            f.write(json.dumps({"symbol": "A", "price": 2.}))  # a partial line isn't read yet
+        time.sleep(0.05)
+        assert feed.store.get("A")[0] == 1.
+        with open(path, "a") as f:
+            f.write("\n")
+        assert _wait_until(lambda: feed.store.get("A")[0] == 2.)
+        path.write_text(json.dumps({"symbol": "A", "price": 3.}) + "\n")
+        assert _wait_until(lambda: feed.store.get("A")[0] == 3.)
+    finally:
+        feed.stop()
+    assert not feed._thread.is_alive()
+
+@pytest.fixture
+def websocket_server():
+    # A server that sends one price per connection and drops it, and rejects the handshake on any other path
+    tornado_web = pytest.importorskip("tornado.web")
+    tornado_websocket = pytest.importorskip("tornado.websocket")
+    from tornado.testing import bind_unused_port
+
+    connections = []
+
+    class DroppingSocket(tornado_websocket.WebSocketHandler):
+        def open(self):
+            connections.append(self)
+            self.write_message(json.dumps({"symbol": "A", "price": len(connections)}))
+            self.close()
+
+    sock, port = bind_unused_port()
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        from tornado.httpserver import HTTPServer
+        server = HTTPServer(tornado_web.Application([(r"/ws", DroppingSocket)]))
+        server.add_sockets([sock])
+        loop.call_soon(started.set)
+        loop.run_forever()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    started.wait()
+    yield port, connections
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+def test_websocket_source_reconnects_after_dropped_connections(websocket_server):
+    port, connections = websocket_server
+    feed = PriceFeed(websocket_source(f"ws://127.0.0.1:{port}/ws", min_reconnect_delay=0.01)).start()
+    try:
+        assert _wait_until(lambda: (feed.store.get("A") or (0,))[0] >= 3)
+        assert feed._thread.is_alive()
+    finally:
+        feed.stop()
+
+@pytest.mark.parametrize("path", ["/missing", None])
+def test_websocket_source_survives_connection_errors(websocket_server, path):
+    # A rejected handshake (404) or a refused connection only delays the next attempt
+    port, connections = websocket_server
+    url = f"ws://127.0.0.1:{port}{path}" if path else "ws://127.0.0.1:1/"
+    still_retrying = []
+
+    async def consume():
+        source = websocket_source(url, min_reconnect_delay=0.01)
+        task = asyncio.ensure_future(source.__anext__())
+        await asyncio.sleep(0.3)
+        still_retrying.append(not task.done())
+        task.cancel()
+
+    asyncio.run(consume())
+    assert still_retrying == [True]
+
+def test_pool_shares_feeds_and_stops_evicted_ones(tmp_path):
+    pool = PriceFeedPool(max_feeds=2)
+    a = pool.get(str(tmp_path / "a.jsonl"))
+    b = pool.get(str(tmp_path / "b.jsonl"))
+    assert pool.get(str(tmp_path / "a.jsonl")) is a
+    c = pool.get(str(tmp_path / "c.jsonl"))
+    assert not b._thread.is_alive()
+    assert a._thread.is_alive() and c._thread.is_alive()
+    pool.stop()
+    assert not a._thread.is_alive() and not c._thread.is_alive()
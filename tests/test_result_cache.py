@@ -0,0 +1,72 @@
+import time
+
+import numpy as np
+import pytest
+
+from one_click_looping.liquidity import ConstantProductPool
+from one_click_looping.result_cache import ResultCache, cache_key, canonical_params
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path / "cache.db"), max_bytes=4096, flush_interval=3600)
+
+def test_canonical_keys():
+    assert cache_key("ns", {"tenor": 7, "ltv": 0.9}) == cache_key("ns", {"ltv": 0.9, "tenor": 7.0})
+    assert cache_key("ns", {"ltv": 0.9}) != cache_key("other", {"ltv": 0.9})
+    assert cache_key("ns", np.arange(3.)) == cache_key("ns", np.arange(3.))
+    assert cache_key("ns", np.arange(3.)) != cache_key("ns", np.arange(4.))
+    assert canonical_params(ConstantProductPool(10.)) == canonical_params(ConstantProductPool(10))
+    with pytest.raises(TypeError):
+        canonical_params(object())
+
+def test_get_and_put(cache):
+    assert cache.get("missing") is None
+    assert cache.get("missing", "default") == "default"
+    cache.put("key", {"roi": np.array([1., 2.])})
+    np.testing.assert_array_equal(cache.get("key")["roi"], [1., 2.])
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 2, pytest.approx(1 / 3))
+
+def test_shared_between_instances(cache, tmp_path):
+    cache.put("key", 42)
+    other = ResultCache(str(tmp_path / "cache.db"))
+    assert other.get("key") == 42
+
+def test_evicts_least_recently_used(cache):
+    for key in "abc":
+        cache.put(key, b"x" * 1200)
+        time.sleep(0.01)
+    # Reading a marks it as recently used once the access times are flushed with the next put
+    assert cache.get("a") is not None
+    cache.put("d", b"x" * 1200)
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+    assert cache.stats()["evictions"] == 1
+
+def test_values_larger_than_the_cache_are_not_stored(cache):
+    cache.put("huge", b"x" * 10_000)
+    assert cache.get("huge") is None
+
+def test_reads_are_counted_lazily(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache(path, flush_interval=3600)
+    cache.put("key", 1)
+    cache.get("key")
+    cache.get("missing")
+    other = ResultCache(path)
+    assert (other.stats()["hits"], other.stats()["misses"]) == (0, 0)
+    cache.flush()
+    assert (other.stats()["hits"], other.stats()["misses"]) == (1, 1)
+
+def test_cached_decorator(cache):
+    calls = []
+
+    @cache.cached
+    def double(x, factor=2):
+        calls.append(x)
+        return x * factor
+
+    assert double(3) == 6
+    assert double(3.0) == 6
+    assert double(3, factor=3) == 9
+    assert calls == [3, 3]
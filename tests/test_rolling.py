@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from one_click_looping.engine import DEFAULT_SCENARIO, evaluate_scenarios
+from one_click_looping.montecarlo import simulate_price_paths
+from one_click_looping.rolling import simulate_rolling_loops
+
+SCENARIO = {name: value for name, value in DEFAULT_SCENARIO.items() if name != "price_move"}
+VOLATILITY = 0.8
+
+def test_one_period_is_the_single_period_engine_result():
+    results = simulate_rolling_loops(**SCENARIO, volatility=VOLATILITY, n_periods=1, n_paths=5_000, seed=1)
+    price_moves = simulate_price_paths(np.random.default_rng(1), 5_000, 1, SCENARIO["tenor"], VOLATILITY, 0.)[:, 1] - 1
+    expected = evaluate_scenarios(**SCENARIO, price_move=price_moves)
+    # A default, or proceeds that don't cover the gas, is a total loss
+    roi_net_of_gas = np.where(expected["rational_to_repay"], expected["roi_net_of_gas"], -1.)
+    np.testing.assert_allclose(results["rois"], np.maximum(roi_net_of_gas, -1.))
+    assert 0 < results["prob_total_loss"] == pytest.approx(np.mean(results["rois"] == -1))
+    assert results["expected_roi"] == pytest.approx(results["rois"].mean())
+
+def test_flat_prices_compound_the_proceeds():
+    # Without price moves every period re-levers the previous period's proceeds, swapped back into collateral
+    s = SCENARIO
+    results = simulate_rolling_loops(**s, volatility=0., n_periods=3, n_paths=2, seed=2)
+    collateral = s["user_init_coll_amount"]
+    for period in range(3):
+        final_amount_after_close = evaluate_scenarios(**{**s, "user_init_coll_amount": collateral}, price_move=0.)["final_amount_after_close"]
+        proceeds = final_amount_after_close - s["gas_usd_cost"] / s["current_price_loan_token"]
+        collateral = proceeds * s["current_price_loan_token"] / s["current_price_coll_token"] * (1 - s["dex_slippage"] - s["dex_swap_fee"])
+    np.testing.assert_allclose(results["rois"], proceeds * s["current_price_loan_token"] / (s["user_init_coll_amount"] * s["current_price_coll_token"]) - 1)
+    np.testing.assert_array_equal(results["survival"], 1.)
+
+def test_survival_and_histogram():
+    results = simulate_rolling_loops(**SCENARIO, volatility=VOLATILITY, n_periods=6, n_paths=2_000, seed=3)
+    survival = results["survival"]
+    assert survival[0] == 1 and np.all(np.diff(survival) <= 0)
+    assert results["prob_total_loss"] == pytest.approx(1 - survival[-1])
+    assert results["histogram_counts"].sum() == 2_000 and results["histogram_bin_edges"][0] == -1
+    # The same seed gives the same paths
+    np.testing.assert_array_equal(simulate_rolling_loops(**SCENARIO, volatility=VOLATILITY, n_periods=6, n_paths=2_000, seed=3)["rois"], results["rois"])
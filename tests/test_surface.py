@@ -0,0 +1,79 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from one_click_looping.surface import _exact, build_surface, check_surface, find_surface, load_surface
+
+RANGES = {"ltv": (0.5, 0.9), "apr": (0., 0.2), "tenor": (1., 30.), "price_move": (-0.5, 0.5)}
+POINTS = {"ltv": 40, "apr": 3, "tenor": 3, "price_move": 11}
+TOLERANCE = 2e-3
+
+@pytest.fixture(scope="module")
+def surface(tmp_path_factory):
+    prefix = str(tmp_path_factory.mktemp("surfaces") / "pair")
+    build_surface(prefix, ranges=RANGES, points=POINTS, tolerance=TOLERANCE, n_check=5_000)
+    return load_surface(prefix)
+
+def _costs(surface):
+    return tuple(surface.costs[name] for name in ("upfront_fee", "myso_fee", "dex_slippage", "dex_swap_fee"))
+
+def test_interpolation_error_is_within_the_checked_bound(surface):
+    # Points the build didn't check stay within the tolerance, and exact at grid nodes
+    rng = np.random.default_rng(7)
+    ltv, apr, tenor, price_move = (rng.uniform(*RANGES[name], 20_000) for name in ("ltv", "apr", "tenor", "price_move"))
+    roi, break_even_price_change, total_loss_price_change = _exact(ltv, apr, tenor, price_move, surface.costs)
+    assert np.max(np.abs(surface.roi(ltv, apr, tenor, price_move) - roi)) <= TOLERANCE
+    surface_break_even, surface_total_loss = surface.thresholds(ltv, apr, tenor)
+    np.testing.assert_allclose(surface_break_even, break_even_price_change, atol=TOLERANCE)
+    np.testing.assert_allclose(surface_total_loss, total_loss_price_change, atol=TOLERANCE)
+    node = (surface.axes["ltv"][7], surface.axes["apr"][1], surface.axes["tenor"][2])
+    assert surface.roi(*node, surface.axes["price_move"]) == pytest.approx(_exact(*node, surface.axes["price_move"], surface.costs)[0], abs=1e-12)
+    assert max(check_surface(surface, 5_000, seed=3).values()) <= TOLERANCE
+
+def test_scalar_and_batched_lookups_agree(surface):
+    price_moves = np.linspace(-0.5, 0.5, 7)
+    np.testing.assert_allclose(surface.roi(0.8, 0.1, 14, price_moves), surface.roi(np.full(7, 0.8), 0.1, 14, price_moves), rtol=1e-12)
+    # A default is -100% RoI, however deep the drop
+    assert surface.roi(0.9, 0.2, 30, -0.5) == -1
+    scalar = surface.thresholds(0.8, 0.1, 14)
+    batched = surface.thresholds(np.array([0.8]), np.array([0.1]), np.array([14.]))
+    np.testing.assert_allclose(np.ravel(batched), scalar)
+
+def test_covers(surface):
+    costs = _costs(surface)
+    assert surface.covers(0.8, 0.1, 14, *costs, price_move_range=(-0.5, 0.5))
+    assert not surface.covers(0.8, 0.1, 14, *costs, price_move_range=(-0.6, 0.5))
+    assert not surface.covers(0.95, 0.1, 14, *costs)
+    assert not surface.covers(0.8, 0.1, 60, *costs)
+    assert not surface.covers(0.8, 0.1, 14, costs[0] + 0.01, *costs[1:])
+    # Element-wise for arrays, with the same answers as for single scenarios
+    ltvs = np.array([0.4, 0.5, 0.8, 0.9, 0.95])
+    np.testing.assert_array_equal(surface.covers(ltvs, 0.1, 14, *costs), [surface.covers(ltv, 0.1, 14, *costs) for ltv in ltvs])
+    np.testing.assert_array_equal(surface.covers(0.8, 0.1, 14, *costs, price_move_range=(np.array([-0.5, -0.7]), np.array([0.5, 0.]))), [True, False])
+
+def test_find_surface_returns_the_first_covering_surface(surface, tmp_path):
+    prefix = str(tmp_path / "other")
+    build_surface(prefix, myso_fee=0.002, ranges=RANGES, points=POINTS, tolerance=TOLERANCE, n_check=1_000)
+    other = load_surface(prefix)
+    assert find_surface([other, surface], 0.8, 0.1, 14, *_costs(surface)) is surface
+    assert find_surface([other, surface], 0.8, 0.1, 14, *_costs(other)) is other
+    assert find_surface([other, surface], 0.99, 0.1, 14, *_costs(surface)) is None
+    assert find_surface([], 0.8, 0.1, 14, *_costs(surface)) is None
+
+def test_build_refuses_surfaces_over_the_tolerance(tmp_path):
+    prefix = str(tmp_path / "coarse")
+    with pytest.raises(ValueError, match="exceeds the tolerance"):
+        build_surface(prefix, ranges=RANGES, points={**POINTS, "ltv": 3}, tolerance=TOLERANCE, n_check=1_000)
+    assert os.listdir(tmp_path) == []
+
+def test_load_rejects_other_schema_versions(tmp_path):
+    prefix = str(tmp_path / "pair")
+    build_surface(prefix, ranges=RANGES, points=POINTS, tolerance=TOLERANCE, n_check=1_000)
+    with open(f"{prefix}.json") as f:
+        metadata = json.load(f)
+    with open(f"{prefix}.json", "w") as f:
+        json.dump({**metadata, "schema_version": 0}, f)
+    with pytest.raises(ValueError, match="schema version"):
+        load_surface(prefix)
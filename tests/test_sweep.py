@@ -0,0 +1,38 @@
+import csv
+
+import pytest
+
+from one_click_looping.sweep import iter_csv_chunks, parse_grid_spec, run_sweep
+
+def test_parse_grid_spec():
+    assert list(parse_grid_spec("0.5")) == [0.5]
+    assert list(parse_grid_spec("7,14,30")) == [7, 14, 30]
+    assert list(parse_grid_spec("0:1:3")) == [0, 0.5, 1]
+
+def test_csv_chunks_fill_defaults(tmp_path):
+    path = tmp_path / "scenarios.csv"
+    path.write_text("ltv,apr\n0.9,0.1\n0.8,0.2\n0.7,0.3\n")
+    chunks = list(iter_csv_chunks(str(path), 2))
+    assert [len(chunk["ltv"]) for chunk in chunks] == [2, 1]
+    assert list(chunks[0]["apr"]) == [0.1, 0.2]
+
+@pytest.mark.parametrize("text, message", [
+    ("ltv,apr\n0.9,0.1\n0.8,\n", "line 3, column apr: '' is not a number"),
+    ("ltv,apr\n0.9,abc\n", "line 2, column apr: 'abc' is not a number"),
+    ("ltv,apr\n0.9,0.1,5\n", "line 2: more values than columns"),
+    ("ltv,bogus\n0.9,0.1\n", "Unknown scenario columns"),
+])
+def test_bad_scenarios_fail_before_anything_is_written(tmp_path, text, message):
+    path = tmp_path / "scenarios.csv"
+    path.write_text(text)
+    output = tmp_path / "results.csv"
+    with pytest.raises(ValueError, match=message):
+        run_sweep(str(output), scenarios_path=str(path), workers=1)
+    assert not output.exists()
+
+def test_grid_sweep(tmp_path):
+    output = tmp_path / "results.csv"
+    assert run_sweep(str(output), axes={"ltv": [0.5, 0.9], "tenor": [7, 14]}, chunk_size=3, workers=1) == 4
+    with open(output, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert sorted((float(row["ltv"]), float(row["tenor"])) for row in rows) == [(0.5, 7), (0.5, 14), (0.9, 7), (0.9, 14)]
@@ -0,0 +1,37 @@
+import json
+import threading
+import time
+
+from one_click_looping.timing import StageTimer, append_jsonl
+
+def test_stage_timer_sums_repeated_stages():
+    timer = StageTimer()
+    for name in ("open", "close", "open"):
+        with timer.stage(name):
+            time.sleep(0.01)
+    assert [name for name, _ in timer.stages] == ["open", "close", "open"]
+    record = timer.record(session="abc")
+    assert set(record["stages"]) == {"open", "close"} and record["session"] == "abc"
+    assert record["stages"]["open"] > record["stages"]["close"] > 0
+    assert record["total_seconds"] >= sum(record["stages"].values())
+
+def test_stage_is_recorded_when_the_body_raises():
+    timer = StageTimer()
+    try:
+        with timer.stage("failing"):
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert "failing" in timer.record()["stages"]
+
+def test_append_jsonl_writes_whole_lines_from_threads(tmp_path):
+    path = str(tmp_path / "timings.jsonl")
+    record = StageTimer().record(padding="x" * 10_000)
+    threads = [threading.Thread(target=lambda: [append_jsonl(path, record) for _ in range(20)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with open(path) as f:
+        lines = f.readlines()
+    assert len(lines) == 80 and all(json.loads(line) == record for line in lines)